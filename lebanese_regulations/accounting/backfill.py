@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE
+
+# Global default holding the last GL Entry name backfilled
+BACKFILL_CHECKPOINT_KEY = "lebanese_gl_backfill_checkpoint"
+
+def backfill_gl_currency_info(chunk_size=5000, sleep=0.5, max_chunks=None, restart=False):
+    """
+    Backfill foreign_currency, foreign_currency_amount, exchange_rate and
+    lbp_amount on GL Entries posted without them
+
+    GL Entries are processed in primary key chunks with one UPDATE ... JOIN
+    against LBP Daily Rate each, using the rate type of the GL Entry's company. Every chunk is committed with its
+    checkpoint, so an interrupted run resumes where it stopped.
+
+    Args:
+        chunk_size (int): GL Entries per chunk
+        sleep (float): Seconds to pause between chunks
+        max_chunks (int): Stop after this many chunks
+        restart (bool): Ignore the checkpoint and start from the first GL Entry
+
+    Returns:
+        int: Number of GL Entries updated
+    """
+    chunk_size = cint(chunk_size) or 5000
+
+    if restart:
+        frappe.db.set_global(BACKFILL_CHECKPOINT_KEY, "")
+        frappe.db.commit()
+
+    checkpoint = frappe.db.get_global(BACKFILL_CHECKPOINT_KEY) or ""
+    updated = 0
+    chunks = 0
+
+    while True:
+        # Upper bound of the next primary key chunk
+        chunk_end = frappe.db.sql("""
+            SELECT MAX(name)
+            FROM (
+                SELECT name
+                FROM `tabGL Entry`
+                WHERE name > %s
+                ORDER BY name
+                LIMIT %s
+            ) chunk
+        """, (checkpoint, chunk_size))[0][0]
+
+        if not chunk_end:
+            break
+
+        updated += backfill_chunk(checkpoint, chunk_end)
+
+        checkpoint = chunk_end
+        frappe.db.set_global(BACKFILL_CHECKPOINT_KEY, checkpoint)
+        frappe.db.commit()
+
+        chunks += 1
+        if max_chunks and chunks >= cint(max_chunks):
+            break
+
+        # Leave room for live posting between chunks
+        if flt(sleep):
+            time.sleep(flt(sleep))
+
+    frappe.logger().info(f"Backfilled LBP currency info on {updated} GL Entries up to {checkpoint}")
+
+    return updated
+
+def backfill_chunk(chunk_start, chunk_end):
+    """
+    Backfill the GL Entries of one primary key chunk
+
+    Args:
+        chunk_start (str): Exclusive lower bound of the chunk
+        chunk_end (str): Inclusive upper bound of the chunk
+
+    Returns:
+        int: Number of GL Entries updated
+    """
+    return update_gl_currency_info("gle.name > %s AND gle.name <= %s", (chunk_start, chunk_end))
+
+def update_gl_currency_info(condition, values):
+    """
+    Fill foreign_currency, foreign_currency_amount, exchange_rate and
+    lbp_amount on the matching GL Entries with one UPDATE ... JOIN against
+    LBP Daily Rate, using the rate type of each GL Entry's company
+
+    Args:
+        condition (str): SQL condition on the GL Entry alias gle
+        values (tuple): Values of the condition placeholders
+
+    Returns:
+        int: Number of GL Entries updated
+    """
+    # Select the GL Entries that have a daily rate to fill from first, so
+    # the count comes from the selected names
+    names = frappe.db.sql_list("""
+        SELECT gle.name
+        FROM `tabGL Entry` gle
+        JOIN `tabCompany` company
+            ON company.name = gle.company
+        JOIN `tabLBP Daily Rate` daily
+            ON daily.currency = gle.account_currency AND daily.date = gle.posting_date
+            AND daily.rate_type = IFNULL(NULLIF(company.lbp_rate_type, ''), %s)
+        WHERE {condition}
+          AND gle.account_currency != 'LBP'
+          AND IFNULL(gle.lbp_amount, 0) = 0
+    """.format(condition=condition), (DEFAULT_RATE_TYPE,) + tuple(values))
+
+    if not names:
+        return 0
+
+    # The rate expression is idempotent, so the order MariaDB applies the
+    # assignments in does not change the result
+    frappe.db.sql("""
+        UPDATE `tabGL Entry` gle
+        JOIN `tabCompany` company
+            ON company.name = gle.company
+        JOIN `tabLBP Daily Rate` daily
+            ON daily.currency = gle.account_currency AND daily.date = gle.posting_date
+            AND daily.rate_type = IFNULL(NULLIF(company.lbp_rate_type, ''), %s)
+        SET gle.foreign_currency = gle.account_currency,
+            gle.foreign_currency_amount = IF(gle.debit_in_account_currency > 0,
+                gle.debit_in_account_currency, gle.credit_in_account_currency),
+            gle.exchange_rate = COALESCE(NULLIF(gle.exchange_rate, 0), daily.exchange_rate),
+            gle.lbp_amount = IF(gle.debit_in_account_currency > 0,
+                gle.debit_in_account_currency, gle.credit_in_account_currency)
+                * COALESCE(NULLIF(gle.exchange_rate, 0), daily.exchange_rate),
+            gle.lbp_rate_type = daily.rate_type
+        WHERE gle.name IN %s
+          AND IFNULL(gle.lbp_amount, 0) = 0
+    """, (DEFAULT_RATE_TYPE, tuple(names)))
+
+    return len(names)
+
+@frappe.whitelist()
+def enqueue_gl_backfill(chunk_size=5000, sleep=0.5, restart=0):
+    """
+    Run the GL Entry currency info backfill as a background job
+
+    Args:
+        chunk_size (int): GL Entries per chunk
+        sleep (float): Seconds to pause between chunks
+        restart (int): Ignore the checkpoint and start from the first GL Entry
+    """
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "lebanese_regulations.accounting.backfill.backfill_gl_currency_info",
+        queue="long",
+        timeout=24 * 60 * 60,
+        job_id="lebanese_gl_backfill",
+        deduplicate=True,
+        chunk_size=cint(chunk_size),
+        sleep=flt(sleep),
+        restart=cint(restart)
+    )
+
+    frappe.msgprint(_("GL Entry currency backfill queued"), alert=True)
@@ -0,0 +1,633 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.utils import cint, flt, get_last_day, getdate, now_datetime
+from lebanese_regulations.accounting.gl_expressions import get_lbp_amount_expressions, get_rate_join
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE, get_company_rate_type
+
+# Cumulative totals kept on each Account Balance Snapshot
+SNAPSHOT_FIELDS = (
+    "debit", "credit",
+    "debit_in_account_currency", "credit_in_account_currency",
+    "debit_lbp", "credit_lbp"
+)
+
+# Global default, suffixed by company, holding the rate type a company's
+# snapshots were completely built with
+SNAPSHOTS_BUILT_KEY = "lebanese_balance_snapshots_built"
+
+# SQL expression of the first day of a GL Entry's month
+MONTH_EXPRESSION = "DATE_SUB(gle.posting_date, INTERVAL DAYOFMONTH(gle.posting_date) - 1 DAY)"
+
+def get_month_start(date):
+    """
+    Get the first day of a date's month
+
+    Args:
+        date (str): Date
+
+    Returns:
+        date: First day of the month
+    """
+    return getdate(date).replace(day=1)
+
+def get_snapshot_name(company, account, month):
+    """
+    Get the name of a snapshot, derived from its key so that the incremental
+    and the full rebuild paths agree
+
+    The whole hash is kept: ON DUPLICATE KEY matches the name as well as
+    the (company, account, month) key, so a shortened hash colliding would
+    overwrite another account's month.
+
+    Args:
+        company (str): Company name
+        account (str): Account name
+        month (date): First day of the month
+
+    Returns:
+        str: Document name
+    """
+    return hashlib.sha1("|".join([company, account, str(month)]).encode()).hexdigest()
+
+def get_movement_sums():
+    """
+    Get the SQL sums of the snapshot fields over GL Entries
+
+    Returns:
+        str: Comma separated SUM expressions aliased as SNAPSHOT_FIELDS
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    return """
+        IFNULL(SUM(gle.debit), 0) AS debit,
+        IFNULL(SUM(gle.credit), 0) AS credit,
+        IFNULL(SUM(gle.debit_in_account_currency), 0) AS debit_in_account_currency,
+        IFNULL(SUM(gle.credit_in_account_currency), 0) AS credit_in_account_currency,
+        IFNULL(SUM({debit_lbp}), 0) AS debit_lbp,
+        IFNULL(SUM({credit_lbp}), 0) AS credit_lbp
+    """.format(debit_lbp=debit_lbp, credit_lbp=credit_lbp)
+
+def get_rate_values(company):
+    """
+    Get the rate type values the LBP sums of a company need
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        dict: Query values
+    """
+    return {
+        "company": company,
+        "rate_type": get_company_rate_type(company),
+        "default_rate_type": DEFAULT_RATE_TYPE
+    }
+
+def on_gl_entry_insert(doc, method=None):
+    """
+    Queue a new GL Entry for the snapshots of its company
+
+    Cancellation flags the original entries without document events, so a
+    reverse entry also queues its voucher, whose original entries are taken
+    back out of the snapshots. Reposting deletes the voucher's entries the
+    same way, so a reposted entry queues its whole account month instead.
+
+    Args:
+        doc: GL Entry document
+    """
+    # Snapshots not built yet are filled by the rebuild, not entry by entry
+    if not has_balance_snapshots(doc.company):
+        return
+
+    queue = get_snapshot_queue()
+
+    if doc.flags.from_repost:
+        queue.reposted.add((doc.company, doc.account, get_month_start(doc.posting_date)))
+        return
+
+    queue.entries.setdefault(doc.company, set()).add(doc.name)
+
+    if cint(doc.is_cancelled):
+        queue.vouchers.setdefault(doc.company, set()).add((doc.voucher_type, doc.voucher_no))
+
+def get_snapshot_queue():
+    """
+    Get the GL Entries and cancelled vouchers queued in this transaction,
+    flushed just before it commits so a voucher updates each account month once
+
+    Returns:
+        frappe._dict: entries and vouchers, each a set per company, and the
+            reposted (company, account, month)
+    """
+    queue = getattr(frappe.local, "lebanese_snapshot_queue", None)
+    if queue is None:
+        queue = frappe.local.lebanese_snapshot_queue = frappe._dict(entries={}, vouchers={}, reposted=set())
+        frappe.db.before_commit.add(flush_snapshot_updates)
+        frappe.db.after_rollback.add(clear_snapshot_queue)
+
+    return queue
+
+def clear_snapshot_queue():
+    """
+    Drop the queue of a rolled back transaction, whose entries never landed
+    """
+    frappe.local.lebanese_snapshot_queue = None
+
+def flush_snapshot_updates():
+    """
+    Add the queued GL Entries to the snapshots
+
+    This runs after deferred GL Entry enrichment, whose before commit hook
+    is registered first, so the LBP sums read the enriched amounts.
+    """
+    queue = getattr(frappe.local, "lebanese_snapshot_queue", None)
+    frappe.local.lebanese_snapshot_queue = None
+    if not queue:
+        return
+
+    changes = {}
+    for company, entries in queue.entries.items():
+        for key, movement in get_snapshot_deltas(company, entries, queue.vouchers.get(company)).items():
+            changes[(company,) + key] = movement
+
+    # Reposted months are recomputed whole, which covers their new entries too
+    for key in queue.reposted:
+        changes[key] = None
+
+    # Earlier months first, in the same order in every transaction
+    for (company, account, month), movement in sorted(changes.items()):
+        if movement is None:
+            recompute_account_snapshot(company, account, month)
+        else:
+            apply_snapshot_delta(company, account, month, movement)
+
+def get_snapshot_deltas(company, entries, vouchers=None):
+    """
+    Get the change a transaction makes to each account month of a company:
+    its new entries in, and the original entries of its cancelled vouchers out
+
+    Only the transaction's own rows are summed, so the change holds whatever
+    other transactions commit meanwhile.
+
+    Args:
+        company (str): Company name
+        entries (set): GL Entries inserted in the transaction
+        vouchers (set): (voucher_type, voucher_no) cancelled in the transaction
+
+    Returns:
+        dict: account_currency and SNAPSHOT_FIELDS by (account, month)
+    """
+    values = get_rate_values(company)
+    values["entries"] = tuple(entries)
+
+    query = """
+        SELECT gle.account, {month} AS month, MAX(gle.account_currency) AS account_currency, {sums}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE gle.company = %(company)s AND {condition}
+        GROUP BY gle.account, {month}
+    """
+
+    # New entries count in, original entries of cancelled vouchers count out
+    conditions = [(1, "gle.name IN %(entries)s AND gle.is_cancelled = 0")]
+    if vouchers:
+        values["vouchers"] = tuple(vouchers)
+        conditions.append((-1, "(gle.voucher_type, gle.voucher_no) IN %(vouchers)s"
+            " AND gle.is_cancelled = 1 AND gle.name NOT IN %(entries)s"))
+
+    deltas = {}
+    for sign, condition in conditions:
+        for row in frappe.db.sql(query.format(
+            month=MONTH_EXPRESSION,
+            sums=get_movement_sums(),
+            rate_join=get_rate_join(),
+            condition=condition
+        ), values, as_dict=1):
+            delta = deltas.setdefault((row.account, getdate(row.month)),
+                frappe._dict({"account_currency": row.account_currency, **{field: 0 for field in SNAPSHOT_FIELDS}}))
+            for field in SNAPSHOT_FIELDS:
+                delta[field] += sign * flt(row[field])
+
+    return deltas
+
+def apply_snapshot_delta(company, account, month, delta):
+    """
+    Add a change to one account month and to every month after it
+
+    Existing rows are only ever incremented, and a new month starts from the
+    month before it read under lock, so concurrent transactions posting to
+    the same account apply their changes one after the other.
+
+    Args:
+        company (str): Company name
+        account (str): Account name
+        month (date): First day of the month
+        delta (dict): account_currency and SNAPSHOT_FIELDS to add
+    """
+    if not any(flt(delta[field]) for field in SNAPSHOT_FIELDS):
+        return
+
+    values = {"company": company, "account": account, "month": month}
+
+    # Totals through the end of the previous snapshot month, locked until commit
+    previous = frappe.db.sql("""
+        SELECT {fields}
+        FROM `tabAccount Balance Snapshot`
+        WHERE company = %(company)s AND account = %(account)s AND month < %(month)s
+        ORDER BY month DESC
+        LIMIT 1
+        FOR UPDATE
+    """.format(fields=", ".join(SNAPSHOT_FIELDS)), values, as_dict=1)
+    previous = previous[0] if previous else frappe._dict()
+
+    now = now_datetime()
+    user = frappe.session.user
+    account_currency = delta.account_currency or frappe.get_cached_value("Account", account, "account_currency")
+
+    # A new month starts from the previous one, an existing month is incremented
+    frappe.db.sql("""
+        INSERT INTO `tabAccount Balance Snapshot`
+            (name, company, account, month, account_currency, {fields},
+             creation, modified, owner, modified_by, docstatus)
+        VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE
+            {updates},
+            modified = VALUES(modified),
+            modified_by = VALUES(modified_by)
+    """.format(
+        fields=", ".join(SNAPSHOT_FIELDS),
+        placeholders=", ".join(["%s"] * (len(SNAPSHOT_FIELDS) + 10)),
+        updates=", ".join(f"{field} = {field} + %s" for field in SNAPSHOT_FIELDS)
+    ), [get_snapshot_name(company, account, month), company, account, month, account_currency]
+        + [flt(previous.get(field)) + flt(delta[field]) for field in SNAPSHOT_FIELDS]
+        + [now, now, user, user, 0]
+        + [flt(delta[field]) for field in SNAPSHOT_FIELDS])
+
+    # Later months carry the change forward
+    values.update({f"delta_{field}": flt(delta[field]) for field in SNAPSHOT_FIELDS})
+    frappe.db.sql("""
+        UPDATE `tabAccount Balance Snapshot`
+        SET {updates}
+        WHERE company = %(company)s AND account = %(account)s AND month > %(month)s
+    """.format(
+        updates=", ".join(f"{field} = {field} + %(delta_{field})s" for field in SNAPSHOT_FIELDS)
+    ), values)
+
+def recompute_account_snapshot(company, account, month):
+    """
+    Recompute one account month from its GL Entries and shift the months
+    after it by the change
+
+    The snapshots and the month's entries are read with locking reads, which
+    see the latest committed rows, as the change cannot be summed from the
+    transaction's own rows after a repost deleted the old ones.
+
+    Args:
+        company (str): Company name
+        account (str): Account name
+        month (date): First day of the month
+    """
+    values = get_rate_values(company)
+    values.update({
+        "account": account,
+        "month": month,
+        "month_end": get_last_day(month)
+    })
+
+    # The previous and the current month, locked until commit
+    snapshots = frappe.db.sql("""
+        SELECT month, {fields}
+        FROM `tabAccount Balance Snapshot`
+        WHERE company = %(company)s AND account = %(account)s AND month <= %(month)s
+        ORDER BY month DESC
+        LIMIT 2
+        FOR UPDATE
+    """.format(fields=", ".join(SNAPSHOT_FIELDS)), values, as_dict=1)
+
+    current = snapshots[0] if snapshots and getdate(snapshots[0].month) == month else None
+    previous = [snapshot for snapshot in snapshots if getdate(snapshot.month) < month]
+    previous = previous[0] if previous else frappe._dict()
+
+    movement = frappe.db.sql("""
+        SELECT MAX(gle.account_currency) AS account_currency, {sums}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE gle.company = %(company)s AND gle.account = %(account)s
+          AND gle.posting_date BETWEEN %(month)s AND %(month_end)s
+          AND gle.is_cancelled = 0
+        LOCK IN SHARE MODE
+    """.format(sums=get_movement_sums(), rate_join=get_rate_join()), values, as_dict=1)[0]
+
+    # The change against the month as stored, or as carried from the previous month
+    delta = frappe._dict(account_currency=movement.account_currency)
+    for field in SNAPSHOT_FIELDS:
+        delta[field] = flt(previous.get(field)) + flt(movement[field]) - flt((current or previous).get(field))
+
+    apply_snapshot_delta(company, account, month, delta)
+
+def get_snapshot_balances(company, date=None, accounts=None):
+    """
+    Get cumulative account totals as of a date from the snapshots
+
+    Each account costs one snapshot read plus a sum over at most one month
+    of GL Entries. Cancelled entries are left out.
+
+    Args:
+        company (str): Company name
+        date (str): Last posting date included, all dates if not given
+        accounts (list): Account names, every account of the company if not given
+
+    Returns:
+        dict: Totals by account, each with account_currency and SNAPSHOT_FIELDS
+    """
+    values = get_rate_values(company)
+    account_condition = ""
+    if accounts is not None:
+        if not accounts:
+            return {}
+        account_condition = "AND account IN %(accounts)s"
+        values["accounts"] = tuple(accounts)
+
+    month_condition = ""
+    if date:
+        values["date"] = getdate(date)
+        values["month"] = get_month_start(date)
+        month_condition = "AND month < %(month)s"
+
+    # Latest snapshot of each account before the date's month
+    balances = {}
+    for row in frappe.db.sql("""
+        SELECT snapshot.account, snapshot.account_currency, {fields}
+        FROM `tabAccount Balance Snapshot` snapshot
+        JOIN (
+            SELECT account, MAX(month) AS month
+            FROM `tabAccount Balance Snapshot`
+            WHERE company = %(company)s {account_condition} {month_condition}
+            GROUP BY account
+        ) latest ON latest.account = snapshot.account AND latest.month = snapshot.month
+        WHERE snapshot.company = %(company)s
+    """.format(
+        fields=", ".join(f"snapshot.{field}" for field in SNAPSHOT_FIELDS),
+        account_condition=account_condition,
+        month_condition=month_condition
+    ), values, as_dict=1):
+        balances[row.account] = row
+
+    if not date:
+        return balances
+
+    # Entries of the date's own month up to the date
+    for row in frappe.db.sql("""
+        SELECT gle.account, MAX(gle.account_currency) AS account_currency, {sums}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE gle.company = %(company)s {account_condition}
+          AND gle.posting_date BETWEEN %(month)s AND %(date)s
+          AND gle.is_cancelled = 0
+        GROUP BY gle.account
+    """.format(
+        sums=get_movement_sums(),
+        rate_join=get_rate_join(),
+        account_condition=account_condition.replace("account", "gle.account", 1)
+    ), values, as_dict=1):
+        balance = balances.setdefault(row.account, frappe._dict(account=row.account,
+            account_currency=row.account_currency))
+        for field in SNAPSHOT_FIELDS:
+            balance[field] = flt(balance.get(field)) + flt(row[field])
+
+    return balances
+
+def get_ledger_balances(company, date=None, accounts=None, condition=None):
+    """
+    Get cumulative account totals as of a date straight from GL Entry, in
+    one grouped query, for companies whose snapshots are not built yet
+
+    Args:
+        company (str): Company name
+        date (str): Last posting date included, all dates if not given
+        accounts (list): Account names, every account of the company if not given
+        condition (str): Extra SQL condition on the gle alias
+
+    Returns:
+        dict: Totals by account, each with account_currency and SNAPSHOT_FIELDS
+    """
+    values = get_rate_values(company)
+    conditions = f" AND {condition}" if condition else ""
+    if accounts is not None:
+        if not accounts:
+            return {}
+        conditions += " AND gle.account IN %(accounts)s"
+        values["accounts"] = tuple(accounts)
+
+    if date:
+        conditions += " AND gle.posting_date <= %(date)s"
+        values["date"] = getdate(date)
+
+    return {
+        row.account: row
+        for row in frappe.db.sql("""
+            SELECT gle.account, MAX(gle.account_currency) AS account_currency, {sums}
+            FROM `tabGL Entry` gle
+            {rate_join}
+            WHERE gle.company = %(company)s {conditions}
+              AND gle.is_cancelled = 0
+            GROUP BY gle.account
+        """.format(sums=get_movement_sums(), rate_join=get_rate_join(), conditions=conditions), values, as_dict=1)
+    }
+
+def get_snapshots_built_key(company):
+    """
+    Get the global default flagging a company's snapshots as built
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        str: Default key, hashed to fit whatever the company name's length
+    """
+    return "{0}:{1}".format(SNAPSHOTS_BUILT_KEY, hashlib.sha1(company.encode()).hexdigest()[:10])
+
+def has_balance_snapshots(company):
+    """
+    Check whether a company's balance snapshots have been built and are kept
+    up to date, which snapshot rows alone do not tell
+
+    The LBP totals are only valid at the rate type they were built with, so
+    snapshots built before the company changed its rate type do not count.
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        bool: True when the company's snapshots are complete at its rate type
+    """
+    if not company:
+        return False
+
+    return frappe.db.get_global(get_snapshots_built_key(company)) == get_company_rate_type(company)
+
+def set_snapshots_built(company, rate_type=None):
+    """
+    Flag a company's snapshots as built at a rate type, or as not built
+
+    Args:
+        company (str): Company name
+        rate_type (str): Rate type the snapshots hold, None when they are stale
+    """
+    frappe.db.set_global(get_snapshots_built_key(company), rate_type or "")
+
+def on_company_insert(doc, method=None):
+    """
+    Flag a new company's snapshots as built, as it has no entries to build from
+
+    Args:
+        doc: Company document
+    """
+    set_snapshots_built(doc.name, get_company_rate_type(doc.name))
+
+def on_company_update(doc, method=None):
+    """
+    Rebuild a company's snapshots when it changes its LBP rate type
+
+    Args:
+        doc: Company document
+    """
+    # New companies are flagged on insert
+    if doc.get_doc_before_save() and doc.has_value_changed("lbp_rate_type"):
+        invalidate_balance_snapshots([doc.name])
+
+def on_rates_changed(rate_type, from_date):
+    """
+    Rebuild the snapshots a backdated rate makes stale: those of companies
+    reporting at the rate type, whose LBP sums fall back to the daily rates
+    for entries without a stored amount of that type
+
+    Rates entered for today or later leave the snapshots as they are.
+
+    Args:
+        rate_type (str): Rate type of the changed rates
+        from_date (str): Earliest date whose rates changed
+    """
+    if getdate(from_date) >= getdate():
+        return
+
+    companies = [
+        company
+        for company in frappe.get_all("Company", pluck="name")
+        if get_company_rate_type(company) == rate_type and has_balance_snapshots(company)
+    ]
+
+    invalidate_balance_snapshots(companies)
+
+def invalidate_balance_snapshots(companies):
+    """
+    Stop trusting the snapshots of companies and rebuild them in the background
+
+    Reports read GL Entry until the rebuild flags the snapshots as built again.
+
+    Args:
+        companies (list): Company names
+    """
+    for company in companies:
+        set_snapshots_built(company)
+
+        frappe.enqueue(
+            "lebanese_regulations.accounting.balance_snapshots.rebuild_account_balance_snapshots",
+            queue="long",
+            timeout=4 * 60 * 60,
+            job_id=f"lebanese_balance_snapshots:{company}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            company=company
+        )
+
+def get_snapshot_balance(company, account, date=None):
+    """
+    Get the cumulative totals of one account as of a date
+
+    Args:
+        company (str): Company name
+        account (str): Account name
+        date (str): Last posting date included, all dates if not given
+
+    Returns:
+        dict: account_currency and SNAPSHOT_FIELDS, zero if the account has no entries
+    """
+    balance = get_snapshot_balances(company, date, [account]).get(account)
+    if not balance:
+        balance = frappe._dict({field: 0 for field in SNAPSHOT_FIELDS})
+        balance.account_currency = frappe.get_cached_value("Account", account, "account_currency")
+
+    return balance
+
+def rebuild_account_balance_snapshots(company=None):
+    """
+    Rebuild the snapshots of one or every company from GL Entry, with one
+    grouped INSERT ... SELECT per company
+
+    Args:
+        company (str): Company name, every company if not given
+    """
+    companies = [company] if company else frappe.get_all("Company", pluck="name")
+    now = now_datetime()
+
+    for company in companies:
+        values = get_rate_values(company)
+        values.update({"now": now, "user": frappe.session.user})
+
+        frappe.db.delete("Account Balance Snapshot", {"company": company})
+
+        frappe.db.sql("""
+            INSERT INTO `tabAccount Balance Snapshot`
+                (name, company, account, month, account_currency, {fields},
+                 creation, modified, owner, modified_by, docstatus)
+            SELECT
+                SHA1(CONCAT_WS('|', monthly.company, monthly.account, monthly.month)),
+                monthly.company, monthly.account, monthly.month, monthly.account_currency,
+                {running},
+                %(now)s, %(now)s, %(user)s, %(user)s, 0
+            FROM (
+                SELECT gle.company, gle.account, {month} AS month,
+                    MAX(gle.account_currency) AS account_currency, {sums}
+                FROM `tabGL Entry` gle
+                {rate_join}
+                WHERE gle.company = %(company)s AND gle.is_cancelled = 0
+                GROUP BY gle.company, gle.account, {month}
+            ) monthly
+        """.format(
+            fields=", ".join(SNAPSHOT_FIELDS),
+            running=", ".join(
+                f"SUM(monthly.{field}) OVER (PARTITION BY monthly.account ORDER BY monthly.month)"
+                for field in SNAPSHOT_FIELDS
+            ),
+            month=MONTH_EXPRESSION,
+            sums=get_movement_sums(),
+            rate_join=get_rate_join()
+        ), values)
+
+        set_snapshots_built(company, values["rate_type"])
+        frappe.db.commit()
+
+    frappe.logger().info(f"Rebuilt account balance snapshots for {len(companies)} companies")
+
+@frappe.whitelist()
+def enqueue_snapshot_rebuild(company=None):
+    """
+    Rebuild the account balance snapshots as a background job
+
+    Args:
+        company (str): Company name, every company if not given
+    """
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "lebanese_regulations.accounting.balance_snapshots.rebuild_account_balance_snapshots",
+        queue="long",
+        timeout=4 * 60 * 60,
+        company=company
+    )
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import flt
+from lebanese_regulations.accounting.backfill import update_gl_currency_info
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+
+@contextmanager
+def bulk_gl_posting():
+    """
+    Defer the LBP enrichment of GL Entries posted inside the block
+
+    GL Entries skip the per-entry rate lookup of add_currency_info. When the
+    outermost block exits, every voucher posted inside it is enriched with
+    one UPDATE ... JOIN against LBP Daily Rate. Anything still deferred when
+    the transaction commits is enriched just before the commit.
+
+    Usage:
+        with bulk_gl_posting():
+            je.submit()
+    """
+    depth = frappe.flags.lebanese_bulk_gl_posting or 0
+    frappe.flags.lebanese_bulk_gl_posting = depth + 1
+
+    try:
+        yield
+    except Exception:
+        # The transaction is rolled back, so there is nothing to enrich
+        if not depth:
+            frappe.local.lebanese_deferred_vouchers = set()
+        raise
+    finally:
+        frappe.flags.lebanese_bulk_gl_posting = depth
+
+    if not depth:
+        flush_deferred_gl_entries()
+
+def is_bulk_gl_posting():
+    """
+    Check whether GL Entry enrichment is currently deferred
+
+    Data imports defer it too, so imported vouchers are enriched per voucher
+    rather than per line.
+
+    Returns:
+        bool: True inside bulk_gl_posting or a data import
+    """
+    return bool(frappe.flags.lebanese_bulk_gl_posting or frappe.flags.in_import)
+
+def defer_gl_entry(doc):
+    """
+    Queue the voucher of a GL Entry for set-based enrichment
+
+    Args:
+        doc: GL Entry document
+    """
+    vouchers = getattr(frappe.local, "lebanese_deferred_vouchers", None)
+    if vouchers is None:
+        vouchers = frappe.local.lebanese_deferred_vouchers = set()
+
+    if not vouchers:
+        # Whatever is still deferred at commit time is enriched before it
+        frappe.db.before_commit.add(flush_deferred_gl_entries)
+        frappe.db.after_rollback.add(clear_deferred_gl_entries)
+
+    vouchers.add((doc.voucher_type, doc.voucher_no))
+
+def clear_deferred_gl_entries():
+    """
+    Drop the vouchers of a rolled back transaction, whose entries never
+    landed, so the next voucher registers the commit hook again
+    """
+    frappe.local.lebanese_deferred_vouchers = set()
+
+def flush_deferred_gl_entries():
+    """
+    Enrich the GL Entries of every deferred voucher
+    """
+    vouchers = getattr(frappe.local, "lebanese_deferred_vouchers", None)
+    if not vouchers:
+        return
+
+    frappe.local.lebanese_deferred_vouchers = set()
+
+    for voucher_type, voucher_no in sorted(vouchers):
+        enrich_voucher_gl_entries(voucher_type, voucher_no)
+
+def enrich_voucher_gl_entries(voucher_type, voucher_no):
+    """
+    Fill foreign_currency, foreign_currency_amount, exchange_rate and
+    lbp_amount on every GL Entry of a voucher
+
+    Args:
+        voucher_type (str): Voucher type
+        voucher_no (str): Voucher number
+
+    Returns:
+        int: Number of GL Entries updated
+    """
+    updated = update_gl_currency_info(
+        "gle.voucher_type = %s AND gle.voucher_no = %s",
+        (voucher_type, voucher_no)
+    )
+
+    # Dates outside the daily rate table fall back to the rate lookup
+    remaining = frappe.db.sql("""
+        SELECT name, company, account_currency, posting_date, exchange_rate,
+            IF(debit_in_account_currency > 0, debit_in_account_currency, credit_in_account_currency) AS amount
+        FROM `tabGL Entry`
+        WHERE voucher_type = %s AND voucher_no = %s
+          AND account_currency != 'LBP'
+          AND IFNULL(lbp_rate_type, '') = ''
+    """, (voucher_type, voucher_no), as_dict=1)
+
+    if remaining:
+        update_remaining_gl_entries(remaining)
+
+    return updated + len(remaining)
+
+def update_remaining_gl_entries(entries):
+    """
+    Enrich GL Entries that have no LBP Daily Rate row, grouped by rate
+
+    Args:
+        entries (list): GL Entry rows with name, company, account_currency,
+            posting_date, exchange_rate and amount
+    """
+    # Imported here as accounting.utils defers GL Entries to this module
+    from lebanese_regulations.accounting.utils import get_exchange_rates
+
+    groups = {}
+    for entry in entries:
+        rate_type = get_company_rate_type(entry.company)
+        groups.setdefault(rate_type, []).append(entry)
+
+    for rate_type, rate_entries in groups.items():
+        rates = get_exchange_rates(
+            [(entry.account_currency, "LBP", entry.posting_date) for entry in rate_entries],
+            rate_type
+        )
+
+        for entry in rate_entries:
+            exchange_rate = flt(entry.exchange_rate) or rates[(entry.account_currency, "LBP", entry.posting_date)]
+
+            frappe.db.sql("""
+                UPDATE `tabGL Entry`
+                SET foreign_currency = account_currency,
+                    foreign_currency_amount = %s,
+                    exchange_rate = %s,
+                    lbp_amount = %s,
+                    lbp_rate_type = %s
+                WHERE name = %s
+            """, (entry.amount, exchange_rate, flt(entry.amount) * exchange_rate, rate_type, entry.name))
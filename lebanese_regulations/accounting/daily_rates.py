@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from datetime import timedelta
+
+import frappe
+from frappe.utils import getdate, now_datetime, nowdate
+from lebanese_regulations.accounting.balance_snapshots import on_rates_changed
+from lebanese_regulations.accounting.rate_cache import RATE_TYPES, get_base_currency, get_rate_type
+from lebanese_regulations.accounting.utils import resolve_exchange_rate
+
+DAILY_RATE_FIELDS = ["name", "currency", "rate_type", "date", "exchange_rate", "creation", "modified", "owner", "modified_by", "docstatus"]
+
+def refresh_daily_rates(currency, from_date, to_date=None, rate_type=None):
+    """
+    Rewrite the forward-filled LBP Daily Rate rows of a currency and rate type
+    for a date range
+
+    Args:
+        currency (str): Currency code
+        from_date (str): First date to refresh
+        to_date (str): Last date to refresh, defaults to today
+        rate_type (str): Rate type
+    """
+    rate_type = get_rate_type(rate_type)
+    from_date = getdate(from_date)
+    to_date = getdate(to_date or nowdate())
+
+    if from_date > to_date:
+        return
+
+    frappe.db.delete("LBP Daily Rate", {
+        "currency": currency,
+        "rate_type": rate_type,
+        "date": ["between", [from_date, to_date]]
+    })
+
+    now = now_datetime()
+    user = frappe.session.user
+
+    values = []
+    date = from_date
+    while date <= to_date:
+        # Days before the first known rate get no row
+        exchange_rate = resolve_exchange_rate(currency, "LBP", date, rate_type)
+        if exchange_rate:
+            values.append((f"{currency}-{rate_type}-{date}", currency, rate_type, date, exchange_rate, now, now, user, user, 0))
+
+        date += timedelta(days=1)
+
+    if values:
+        frappe.db.bulk_insert("LBP Daily Rate", fields=DAILY_RATE_FIELDS, values=values)
+
+def update_daily_rates_for_exchange(exchange_doc, deleted=False):
+    """
+    Queue the daily rates affected by a Currency Exchange change for refresh
+    before commit, so the after_insert and on_update events of one insert,
+    or many edits in one transaction, refresh each currency once
+
+    Args:
+        exchange_doc: Currency Exchange document
+        deleted (bool): Whether the document was deleted
+    """
+    changes = getattr(frappe.local, "lebanese_daily_rate_changes", None)
+    if changes is None:
+        changes = frappe.local.lebanese_daily_rate_changes = set()
+
+    if not changes:
+        frappe.db.before_commit.add(flush_daily_rate_changes)
+        frappe.db.after_rollback.add(clear_daily_rate_changes)
+
+    changes.add((exchange_doc.from_currency, exchange_doc.to_currency, getdate(exchange_doc.date),
+        get_rate_type(exchange_doc.get("rate_type"))))
+
+    # The pair, date or rate type itself may have been edited
+    previous = None if deleted else exchange_doc.get_doc_before_save()
+    if previous:
+        changes.add((previous.from_currency, previous.to_currency, getdate(previous.date),
+            get_rate_type(previous.get("rate_type"))))
+
+def clear_daily_rate_changes():
+    """
+    Drop the changes of a rolled back transaction, so the next change
+    registers the commit hook again
+    """
+    frappe.local.lebanese_daily_rate_changes = set()
+
+def flush_daily_rate_changes():
+    """
+    Refresh the daily rates of every queued Currency Exchange change
+    """
+    changes = getattr(frappe.local, "lebanese_daily_rate_changes", None)
+    frappe.local.lebanese_daily_rate_changes = set()
+
+    if changes:
+        update_daily_rates_for_changes(changes)
+
+def update_daily_rates_for_changes(changes):
+    """
+    Refresh the daily rates affected by a set of Currency Exchange changes,
+    once per currency and rate type from the earliest changed date
+
+    Args:
+        changes (list): (from_currency, to_currency, date, rate_type) tuples
+    """
+    from_dates = {}
+    for from_currency, to_currency, date, rate_type in changes:
+        rate_type = get_rate_type(rate_type)
+        for currency in get_affected_currencies(from_currency, to_currency):
+            key = (currency, rate_type)
+            from_dates[key] = min(getdate(date), from_dates.get(key, getdate(date)))
+
+    for (currency, rate_type), from_date in from_dates.items():
+        # Refresh through today, or through the last forward-filled day if that is later
+        last_date = frappe.db.sql("""
+            SELECT MAX(date)
+            FROM `tabLBP Daily Rate`
+            WHERE currency = %s AND rate_type = %s
+        """, (currency, rate_type))[0][0]
+        refresh_daily_rates(currency, from_date, max(getdate(), from_date, getdate(last_date or from_date)), rate_type)
+
+    # Backdated rates change the daily rates the snapshots' LBP sums fell back to
+    rate_type_dates = {}
+    for (currency, rate_type), from_date in from_dates.items():
+        rate_type_dates[rate_type] = min(from_date, rate_type_dates.get(rate_type, from_date))
+
+    for rate_type, from_date in rate_type_dates.items():
+        on_rates_changed(rate_type, from_date)
+
+def get_affected_currencies(from_currency, to_currency):
+    """
+    Get the currencies whose LBP rate can depend on a currency pair
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+
+    Returns:
+        list: Currency codes
+    """
+    pair = {from_currency, to_currency}
+    base_currency = get_base_currency()
+
+    # LBP rates come from the direct pair, the reverse pair or the base currency legs
+    if "LBP" not in pair and base_currency not in pair:
+        return []
+
+    if pair == {"LBP", base_currency}:
+        return get_daily_rate_currencies()
+
+    return sorted(pair - {"LBP", base_currency})
+
+def get_daily_rate_currencies():
+    """
+    Get the currencies kept in LBP Daily Rate
+
+    Returns:
+        list: Currency codes
+    """
+    return frappe.get_all(
+        "Currency",
+        filters={"enabled": 1, "name": ["!=", "LBP"]},
+        pluck="name"
+    )
+
+def extend_daily_rates():
+    """
+    Forward-fill every currency's daily rates of every rate type up to today
+    This is scheduled to run daily
+
+    Currencies without any row of a rate type had no resolvable rate; they
+    are filled by the Currency Exchange change that gives them one, not
+    rebuilt from scratch every night.
+    """
+    today = getdate()
+
+    last_dates = {(row[0], row[1]): row[2] for row in frappe.db.sql("""
+        SELECT currency, rate_type, MAX(date)
+        FROM `tabLBP Daily Rate`
+        GROUP BY currency, rate_type
+    """)}
+
+    currencies = set(get_daily_rate_currencies())
+
+    for (currency, rate_type), last_date in last_dates.items():
+        if currency in currencies and rate_type in RATE_TYPES:
+            refresh_daily_rates(currency, getdate(last_date) + timedelta(days=1), today, rate_type)
+
+def rebuild_daily_rates(currency=None, rate_type=None):
+    """
+    Rebuild the daily rates of one or all currencies from the first stored
+    rate of a rate type
+
+    Args:
+        currency (str): Currency code, all currencies if not given
+        rate_type (str): Rate type, all rate types if not given
+    """
+    currencies = [currency] if currency else get_daily_rate_currencies()
+
+    for rate_type in [rate_type] if rate_type else RATE_TYPES:
+        first_date = frappe.db.sql("""
+            SELECT MIN(date)
+            FROM `tabCurrency Exchange`
+            WHERE rate_type = %s
+        """, (rate_type,))[0][0]
+
+        if not first_date:
+            continue
+
+        for currency_code in currencies:
+            refresh_daily_rates(currency_code, first_date, max(getdate(), getdate(first_date)), rate_type)
+
+    frappe.logger().info(f"LBP daily rates rebuilt for {len(currencies)} currencies")
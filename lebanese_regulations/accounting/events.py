@@ -5,6 +5,10 @@
 import frappe
 from frappe import _
 from frappe.utils import flt, getdate, nowdate
+from lebanese_regulations.accounting.daily_rates import update_daily_rates_for_exchange
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE, get_rate_type, invalidate_rate_timeline
+from lebanese_regulations.accounting.rate_matrix import clear_rate_matrices
+from lebanese_regulations.accounting.report_cache import mark_rates_changed
 
 def on_currency_exchange_update(doc, method=None):
     """
@@ -14,6 +18,12 @@ def on_currency_exchange_update(doc, method=None):
         doc: Currency Exchange document
         method: Method name
     """
+    # Retire the cached rates of the changed pair in every process
+    invalidate_exchange_rate_cache(doc)
+    
+    # Forward-fill the LBP daily rates from the changed date
+    update_daily_rates_for_exchange(doc)
+    
     # Update all open documents with the new exchange rate
     if doc.from_currency == "LBP" or doc.to_currency == "LBP":
         update_open_documents_with_new_rate(doc)
@@ -21,6 +31,39 @@ def on_currency_exchange_update(doc, method=None):
     # Log the exchange rate change
     log_exchange_rate_change(doc)
 
+def on_currency_exchange_delete(doc, method=None):
+    """
+    Handle currency exchange rate deletion
+    
+    Args:
+        doc: Currency Exchange document
+        method: Method name
+    """
+    invalidate_exchange_rate_cache(doc)
+    update_daily_rates_for_exchange(doc, deleted=True)
+
+def invalidate_exchange_rate_cache(exchange_doc):
+    """
+    Invalidate the cached rate timelines touched by a Currency Exchange change
+    
+    Args:
+        exchange_doc: Currency Exchange document
+    """
+    rate_type = get_rate_type(exchange_doc.get("rate_type"))
+    invalidate_rate_timeline(exchange_doc.from_currency, exchange_doc.to_currency, rate_type)
+    
+    # Any pair can feed a cross rate, so cached matrices are all stale
+    clear_rate_matrices()
+    mark_rates_changed(exchange_doc.date)
+    
+    # The pair or rate type itself may have been edited
+    previous = exchange_doc.get_doc_before_save()
+    if previous:
+        mark_rates_changed(previous.date)
+        previous_key = (previous.from_currency, previous.to_currency, get_rate_type(previous.get("rate_type")))
+        if previous_key != (exchange_doc.from_currency, exchange_doc.to_currency, rate_type):
+            invalidate_rate_timeline(*previous_key)
+
 def update_open_documents_with_new_rate(exchange_doc):
     """
     Update open documents with the new exchange rate
@@ -28,6 +71,11 @@ def update_open_documents_with_new_rate(exchange_doc):
     Args:
         exchange_doc: Currency Exchange document
     """
+    # Only companies posting with this rate type follow it
+    companies = get_companies_for_rate_type(exchange_doc.get("rate_type"))
+    if not companies:
+        return
+    
     # Determine which currency is LBP and which is the foreign currency
     if exchange_doc.from_currency == "LBP":
         foreign_currency = exchange_doc.to_currency
@@ -37,33 +85,56 @@ def update_open_documents_with_new_rate(exchange_doc):
         exchange_rate = flt(exchange_doc.exchange_rate)
     
     # Update Sales Invoices
-    update_sales_invoices(foreign_currency, exchange_rate)
+    update_sales_invoices(foreign_currency, exchange_rate, companies)
     
     # Update Purchase Invoices
-    update_purchase_invoices(foreign_currency, exchange_rate)
+    update_purchase_invoices(foreign_currency, exchange_rate, companies)
     
     # Update Journal Entries
-    update_journal_entries(foreign_currency, exchange_rate)
+    update_journal_entries(foreign_currency, exchange_rate, companies)
     
     frappe.msgprint(_("Open documents updated with new exchange rate: 1 {0} = {1} LBP").format(
         foreign_currency, frappe.format_value(exchange_rate, {"fieldtype": "Float", "precision": 4})
     ))
 
-def update_sales_invoices(foreign_currency, exchange_rate):
+def get_companies_for_rate_type(rate_type):
+    """
+    Get the companies posting LBP amounts with a rate type
+    
+    Args:
+        rate_type: Rate type
+        
+    Returns:
+        list: Company names
+    """
+    rate_type = get_rate_type(rate_type)
+    
+    return frappe.db.sql_list("""
+        SELECT name
+        FROM `tabCompany`
+        WHERE IFNULL(NULLIF(lbp_rate_type, ''), %s) = %s
+    """, (DEFAULT_RATE_TYPE, rate_type))
+
+def update_sales_invoices(foreign_currency, exchange_rate, companies=None):
     """
     Update open Sales Invoices with the new exchange rate
     
     Args:
         foreign_currency: Foreign currency code
         exchange_rate: Exchange rate
+        companies: Companies to update, all if not given
     """
+    filters = {
+        "docstatus": 0,
+        "currency": foreign_currency
+    }
+    if companies:
+        filters["company"] = ["in", companies]
+    
     # Get all open Sales Invoices in the foreign currency
     invoices = frappe.get_all(
         "Sales Invoice",
-        filters={
-            "docstatus": 0,
-            "currency": foreign_currency
-        },
+        filters=filters,
         pluck="name"
     )
     
@@ -79,21 +150,26 @@ def update_sales_invoices(foreign_currency, exchange_rate):
             
             frappe.msgprint(_("Updated exchange rate in Sales Invoice {0}").format(invoice.name))
 
-def update_purchase_invoices(foreign_currency, exchange_rate):
+def update_purchase_invoices(foreign_currency, exchange_rate, companies=None):
     """
     Update open Purchase Invoices with the new exchange rate
     
     Args:
         foreign_currency: Foreign currency code
         exchange_rate: Exchange rate
+        companies: Companies to update, all if not given
     """
+    filters = {
+        "docstatus": 0,
+        "currency": foreign_currency
+    }
+    if companies:
+        filters["company"] = ["in", companies]
+    
     # Get all open Purchase Invoices in the foreign currency
     invoices = frappe.get_all(
         "Purchase Invoice",
-        filters={
-            "docstatus": 0,
-            "currency": foreign_currency
-        },
+        filters=filters,
         pluck="name"
     )
     
@@ -109,22 +185,27 @@ def update_purchase_invoices(foreign_currency, exchange_rate):
             
             frappe.msgprint(_("Updated exchange rate in Purchase Invoice {0}").format(invoice.name))
 
-def update_journal_entries(foreign_currency, exchange_rate):
+def update_journal_entries(foreign_currency, exchange_rate, companies=None):
     """
     Update open Journal Entries with the new exchange rate
     
     Args:
         foreign_currency: Foreign currency code
         exchange_rate: Exchange rate
+        companies: Companies to update, all if not given
     """
+    values = {"foreign_currency": foreign_currency, "companies": companies}
+    
     # Get all open Journal Entries with accounts in the foreign currency
     journal_entries = frappe.db.sql("""
         SELECT DISTINCT parent
         FROM `tabJournal Entry Account`
         WHERE docstatus = 0
-          AND account_currency = %s
-          AND parent IN (SELECT name FROM `tabJournal Entry` WHERE docstatus = 0)
-    """, (foreign_currency,), as_dict=1)
+          AND account_currency = %(foreign_currency)s
+          AND parent IN (SELECT name FROM `tabJournal Entry` WHERE docstatus = 0 {company_condition})
+    """.format(
+        company_condition = "AND company IN %(companies)s" if companies else ""
+    ), values, as_dict=1)
     
     for je in journal_entries:
         journal_entry = frappe.get_doc("Journal Entry", je.parent)
@@ -162,5 +243,7 @@ def log_exchange_rate_change(exchange_doc):
     else:
         rate_display = f"1 {exchange_doc.from_currency} = {exchange_doc.exchange_rate} {exchange_doc.to_currency}"
     
+    rate_display += f" ({get_rate_type(exchange_doc.get('rate_type'))})"
+    
     log.content = _("Exchange rate updated: {0}").format(rate_display)
     log.save()
\ No newline at end of file
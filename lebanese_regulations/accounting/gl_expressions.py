@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from frappe.desk.reportview import build_match_conditions
+
+def get_match_condition():
+    """
+    Get the session user's permission condition on GL Entry
+
+    Returns:
+        str: SQL condition on the gle alias, empty when the user sees every entry
+    """
+    match_conditions = build_match_conditions("GL Entry")
+    if not match_conditions:
+        return ""
+
+    # Literal percent signs would be read as placeholders by the named parameters
+    return "({0})".format(match_conditions.replace("`tabGL Entry`.", "gle.").replace("%", "%%"))
+
+def get_exchange_rate_expression():
+    """
+    Get the SQL expression of a GL Entry's LBP rate for the requested rate type
+
+    The rate stored at posting is used when it was computed with the
+    requested rate type, otherwise the forward-filled daily rate. With
+    neither the expression is NULL, so the entry's LBP amounts stay blank
+    and out of SUMs rather than valued at 1 LBP.
+
+    Returns:
+        str: SQL expression over the gle and daily aliases
+    """
+    return """
+        IF(gle.account_currency = 'LBP', 1,
+            COALESCE(
+                IF(IFNULL(NULLIF(gle.lbp_rate_type, ''), %(default_rate_type)s) = %(rate_type)s,
+                    NULLIF(gle.exchange_rate, 0), NULL),
+                daily.exchange_rate))
+    """
+
+def get_lbp_amount_expressions():
+    """
+    Get the SQL expressions of a GL Entry's LBP debit and credit
+
+    LBP accounts use their own amounts. Foreign currency accounts use the
+    stored lbp_amount when it was computed with the requested rate type,
+    otherwise the account currency amount at the rate of
+    get_exchange_rate_expression.
+
+    Returns:
+        tuple: (debit expression, credit expression)
+    """
+    stored = """(gle.account_currency != 'LBP' AND IFNULL(gle.lbp_amount, 0) != 0
+        AND IFNULL(NULLIF(gle.lbp_rate_type, ''), %(default_rate_type)s) = %(rate_type)s)"""
+    rate = get_exchange_rate_expression()
+
+    debit = """IF({stored},
+        IF(gle.debit_in_account_currency > 0, gle.lbp_amount, 0),
+        gle.debit_in_account_currency * {rate})""".format(stored=stored, rate=rate)
+    credit = """IF({stored},
+        IF(gle.debit_in_account_currency > 0, 0, gle.lbp_amount),
+        gle.credit_in_account_currency * {rate})""".format(stored=stored, rate=rate)
+
+    return debit, credit
+
+def get_rate_join():
+    """
+    Get the join of the daily rates used by the LBP expressions
+
+    Returns:
+        str: SQL join clause
+    """
+    return """
+        LEFT JOIN `tabLBP Daily Rate` daily
+            ON daily.currency = gle.account_currency AND daily.date = gle.posting_date
+            AND daily.rate_type = %(rate_type)s
+    """
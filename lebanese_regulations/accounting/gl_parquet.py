@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import glob
+import os
+import shutil
+from datetime import timedelta
+from itertools import islice
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, getdate, now_datetime
+
+# Global default holding the GL Entry modification time the snapshot covers
+PARQUET_WATERMARK_KEY = "lebanese_gl_parquet_watermark"
+
+# Directory of the snapshot, under the site's private files
+PARQUET_DIRECTORY = "lebanese_gl_snapshot"
+
+# Rows converted and written per Parquet row group
+PARQUET_BATCH_SIZE = 50000
+
+# Months modified this long before the watermark are exported again, to
+# catch transactions that committed after the previous run read the table
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+# (column, arrow type) of the snapshot files, in file order
+PARQUET_COLUMNS = [
+    ("name", "string"),
+    ("company", "string"),
+    ("posting_date", "date32"),
+    ("fiscal_year", "string"),
+    ("account", "string"),
+    ("account_currency", "string"),
+    ("party_type", "string"),
+    ("party", "string"),
+    ("voucher_type", "string"),
+    ("voucher_no", "string"),
+    ("against", "string"),
+    ("cost_center", "string"),
+    ("project", "string"),
+    ("finance_book", "string"),
+    ("remarks", "string"),
+    ("is_opening", "string"),
+    ("is_cancelled", "int8"),
+    ("debit", "float64"),
+    ("credit", "float64"),
+    ("debit_in_account_currency", "float64"),
+    ("credit_in_account_currency", "float64"),
+    ("foreign_currency", "string"),
+    ("foreign_currency_amount", "float64"),
+    ("exchange_rate", "float64"),
+    ("lbp_amount", "float64"),
+    ("lbp_rate_type", "string"),
+    ("creation", "timestamp"),
+    ("modified", "timestamp")
+]
+
+# SQL expression of the first day of a GL Entry's month
+MONTH_EXPRESSION = "DATE_SUB(posting_date, INTERVAL DAYOFMONTH(posting_date) - 1 DAY)"
+
+def get_pyarrow():
+    """
+    Import pyarrow, which only the Parquet snapshot needs
+
+    Returns:
+        tuple: (pyarrow, pyarrow.parquet) modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        frappe.throw(_("The GL Parquet snapshot needs pyarrow. Install it with: bench pip install pyarrow"))
+
+    return pyarrow, pyarrow.parquet
+
+def is_parquet_available():
+    """
+    Check whether pyarrow is installed
+
+    Returns:
+        bool: True when the snapshot can be written and read
+    """
+    try:
+        import pyarrow.parquet # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+def get_parquet_schema():
+    """
+    Get the arrow schema of the snapshot files
+
+    Returns:
+        pyarrow.Schema: Schema
+    """
+    pa, pq = get_pyarrow()
+
+    types = {
+        "string": pa.string(),
+        "date32": pa.date32(),
+        "int8": pa.int8(),
+        "float64": pa.float64(),
+        "timestamp": pa.timestamp("us")
+    }
+
+    return pa.schema([(column, types[arrow_type]) for column, arrow_type in PARQUET_COLUMNS])
+
+def get_snapshot_root():
+    """
+    Get the directory of the snapshot
+
+    Returns:
+        str: Absolute path
+    """
+    return frappe.get_site_path("private", "files", PARQUET_DIRECTORY)
+
+def get_partition_path(company, fiscal_year, month):
+    """
+    Get the directory of a company, fiscal year and month partition
+
+    Args:
+        company (str): Company name
+        fiscal_year (str): Fiscal Year name
+        month (date): First day of the month
+
+    Returns:
+        str: Absolute path
+    """
+    return os.path.join(get_snapshot_root(), frappe.scrub(company), frappe.scrub(fiscal_year or "none"),
+        getdate(month).strftime("%Y-%m"))
+
+def export_gl_snapshot(full=False):
+    """
+    Bring the Parquet snapshot of GL Entry up to date
+
+    Every company month with a GL Entry created or modified since the last
+    run is rewritten from the database, so cancellations and reposts are
+    picked up and files never hold duplicates. The first run, or a full
+    run, writes every month.
+
+    Args:
+        full (bool): Rewrite every month
+
+    Returns:
+        int: Number of months written
+    """
+    get_pyarrow()
+
+    started = now_datetime()
+    watermark = None if full else frappe.db.get_global(PARQUET_WATERMARK_KEY)
+
+    condition = ""
+    values = {}
+    if watermark:
+        condition = "WHERE modified > %(since)s"
+        values["since"] = get_datetime(watermark) - WATERMARK_OVERLAP
+
+    partitions = frappe.db.sql("""
+        SELECT company, {month} AS month
+        FROM `tabGL Entry`
+        {condition}
+        GROUP BY company, {month}
+        ORDER BY company, month
+    """.format(month=MONTH_EXPRESSION, condition=condition), values)
+
+    for company, month in partitions:
+        write_partition(company, month)
+
+    frappe.db.set_global(PARQUET_WATERMARK_KEY, str(started))
+    frappe.db.commit()
+
+    frappe.logger().info(f"Exported {len(partitions)} GL Entry months to the Parquet snapshot")
+
+    return len(partitions)
+
+def write_partition(company, month):
+    """
+    Rewrite the snapshot file of one company month
+
+    The file is written next to the partition and moved into place, so
+    readers never see a partial file, and only then are the month's other
+    files removed, here and under any other fiscal year.
+
+    Args:
+        company (str): Company name
+        month (date): First day of the month
+    """
+    pa, pq = get_pyarrow()
+
+    month = getdate(month)
+    fiscal_year = get_fiscal_year_name(company, month)
+    path = get_partition_path(company, fiscal_year, month)
+    os.makedirs(path, exist_ok=True)
+
+    schema = get_parquet_schema()
+    temp_file = os.path.join(path, ".part.parquet.tmp")
+    writer = None
+    written = 0
+
+    try:
+        with frappe.db.unbuffered_cursor():
+            rows = frappe.db.sql("""
+                SELECT name, company, posting_date, %(fiscal_year)s AS fiscal_year, account, account_currency,
+                    party_type, party, voucher_type, voucher_no, against, cost_center, project,
+                    finance_book, remarks, is_opening, is_cancelled,
+                    CAST(debit AS DOUBLE) AS debit,
+                    CAST(credit AS DOUBLE) AS credit,
+                    CAST(debit_in_account_currency AS DOUBLE) AS debit_in_account_currency,
+                    CAST(credit_in_account_currency AS DOUBLE) AS credit_in_account_currency,
+                    foreign_currency,
+                    CAST(foreign_currency_amount AS DOUBLE) AS foreign_currency_amount,
+                    CAST(exchange_rate AS DOUBLE) AS exchange_rate,
+                    CAST(lbp_amount AS DOUBLE) AS lbp_amount,
+                    lbp_rate_type, creation, modified
+                FROM `tabGL Entry`
+                WHERE company = %(company)s
+                  AND posting_date BETWEEN %(month)s AND LAST_DAY(%(month)s)
+                ORDER BY posting_date, creation, name
+            """, {"company": company, "month": month, "fiscal_year": fiscal_year}, as_dict=1, as_iterator=True)
+
+            while True:
+                batch = list(islice(rows, PARQUET_BATCH_SIZE))
+                if not batch:
+                    break
+
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_file, schema, compression="zstd")
+
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # Move the new file into place first, so the month is never missing
+    part_file = os.path.join(path, "part.parquet")
+    if written:
+        os.replace(temp_file, part_file)
+    else:
+        for stale_file in (temp_file, part_file):
+            if os.path.exists(stale_file):
+                os.remove(stale_file)
+
+    # Then drop whatever else the partition held before
+    for old_file in glob.glob(os.path.join(path, "*.parquet")):
+        if old_file != part_file:
+            os.remove(old_file)
+
+    # A month filed under another fiscal year before the fiscal years changed
+    # would otherwise be read twice
+    month_name = os.path.basename(path)
+    for old_path in glob.glob(os.path.join(get_snapshot_root(), frappe.scrub(company), "*", month_name)):
+        if os.path.normpath(old_path) != os.path.normpath(path):
+            shutil.rmtree(old_path, ignore_errors=True)
+
+def get_fiscal_year_name(company, date):
+    """
+    Get the Fiscal Year of a company covering a date
+
+    Args:
+        company (str): Company name
+        date (date): Date
+
+    Returns:
+        str: Fiscal Year name, None when no Fiscal Year covers the date
+    """
+    fiscal_years = getattr(frappe.local, "lebanese_fiscal_years", None)
+    if fiscal_years is None:
+        fiscal_years = frappe.local.lebanese_fiscal_years = frappe.db.sql("""
+            SELECT fy.name, fy.year_start_date, fy.year_end_date,
+                GROUP_CONCAT(fyc.company SEPARATOR '\n') AS companies
+            FROM `tabFiscal Year` fy
+            LEFT JOIN `tabFiscal Year Company` fyc ON fyc.parent = fy.name
+            WHERE fy.disabled = 0
+            GROUP BY fy.name, fy.year_start_date, fy.year_end_date
+            ORDER BY fy.year_start_date DESC
+        """, as_dict=1)
+
+    for fiscal_year in fiscal_years:
+        # Fiscal Years without companies apply to every company
+        companies = fiscal_year.companies.split("\n") if fiscal_year.companies else None
+        if fiscal_year.year_start_date <= date <= fiscal_year.year_end_date and (not companies or company in companies):
+            return fiscal_year.name
+
+    return None
+
+def get_closed_until(company):
+    """
+    Get the last date of a company's closed periods
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        date: End of the latest submitted Period Closing Voucher, None if there is none
+    """
+    closed_until = frappe.db.sql("""
+        SELECT MAX(period_end_date)
+        FROM `tabPeriod Closing Voucher`
+        WHERE company = %s AND docstatus = 1
+    """, (company,))[0][0]
+
+    return getdate(closed_until) if closed_until else None
+
+def can_read_gl_snapshot(company, to_date):
+    """
+    Check whether the snapshot can answer for a company up to a date: the
+    date is in a closed period and the snapshot was written after it closed
+
+    Args:
+        company (str): Company name
+        to_date (str): Last date needed
+
+    Returns:
+        bool: True when the snapshot covers the dates
+    """
+    if not is_parquet_available():
+        return False
+
+    closed_until = get_closed_until(company)
+    watermark = frappe.db.get_global(PARQUET_WATERMARK_KEY)
+    if not closed_until or not watermark or getdate(to_date) > closed_until:
+        return False
+
+    return get_datetime(watermark).date() > closed_until
+
+def read_gl_snapshot(company, to_date, columns=None, filter_expression=None, from_date=None):
+    """
+    Read a company's snapshot rows up to a date
+
+    Args:
+        company (str): Company name
+        to_date (str): Last posting date read
+        columns (list): Columns to read, all if not given
+        filter_expression (pyarrow.compute.Expression): Extra row filter
+        from_date (str): First posting date read, from the first month if not given
+
+    Returns:
+        pyarrow.Table: Rows
+    """
+    scanner = get_snapshot_scanner(company, to_date, columns, filter_expression, from_date)
+    if scanner is None:
+        return get_parquet_schema().empty_table()
+
+    return scanner.to_table()
+
+def scan_gl_snapshot(company, to_date, columns=None, filter_expression=None, from_date=None):
+    """
+    Read a company's snapshot rows up to a date batch by batch, for totals
+    over more rows than should be held in memory at once
+
+    Args:
+        company (str): Company name
+        to_date (str): Last posting date read
+        columns (list): Columns to read, all if not given
+        filter_expression (pyarrow.compute.Expression): Extra row filter
+        from_date (str): First posting date read, from the first month if not given
+
+    Returns:
+        iterator: pyarrow.RecordBatch of up to PARQUET_BATCH_SIZE rows
+    """
+    scanner = get_snapshot_scanner(company, to_date, columns, filter_expression, from_date)
+    if scanner is None:
+        return iter(())
+
+    return (batch for batch in scanner.to_batches() if batch.num_rows)
+
+def get_snapshot_scanner(company, to_date, columns=None, filter_expression=None, from_date=None):
+    """
+    Get a scanner over a company's snapshot files between two dates, with
+    the row filter pushed down into the Parquet reads
+
+    Args:
+        company (str): Company name
+        to_date (str): Last posting date read
+        columns (list): Columns to read, all if not given
+        filter_expression (pyarrow.compute.Expression): Extra row filter
+        from_date (str): First posting date read, from the first month if not given
+
+    Returns:
+        pyarrow.dataset.Scanner: Scanner, None when no file covers the dates
+    """
+    pa, pq = get_pyarrow()
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    to_month = getdate(to_date).strftime("%Y-%m")
+    from_month = getdate(from_date).strftime("%Y-%m") if from_date else ""
+
+    # Month directories sort as text, so whole months are picked from the path
+    files = [
+        file_path
+        for file_path in glob.glob(os.path.join(get_snapshot_root(), frappe.scrub(company), "*", "*", "*.parquet"))
+        if from_month <= os.path.basename(os.path.dirname(file_path)) <= to_month
+    ]
+
+    if not files:
+        return None
+
+    expression = pc.field("posting_date") <= pa.scalar(getdate(to_date), pa.date32())
+    if from_date:
+        expression = expression & (pc.field("posting_date") >= pa.scalar(getdate(from_date), pa.date32()))
+    if filter_expression is not None:
+        expression = expression & filter_expression
+
+    return ds.dataset(sorted(files), schema=get_parquet_schema(), format="parquet").scanner(
+        columns=columns, filter=expression, batch_size=PARQUET_BATCH_SIZE)
+
+def run_nightly_gl_snapshot():
+    """
+    Nightly scheduler entry point, skipped on sites without pyarrow
+    """
+    if not is_parquet_available():
+        return
+
+    export_gl_snapshot()
+
+@frappe.whitelist()
+def enqueue_gl_snapshot_export(full=0):
+    """
+    Bring the GL Parquet snapshot up to date as a background job
+
+    Args:
+        full (int): Rewrite every month
+    """
+    frappe.only_for("System Manager")
+    get_pyarrow()
+
+    frappe.enqueue(
+        "lebanese_regulations.accounting.gl_parquet.export_gl_snapshot",
+        queue="long",
+        timeout=4 * 60 * 60,
+        full=bool(int(full))
+    )
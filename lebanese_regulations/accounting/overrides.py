@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from erpnext.setup.utils import get_exchange_rate as standard_get_exchange_rate
+from frappe.utils import flt, nowdate
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+from lebanese_regulations.accounting.utils import resolve_exchange_rate
+
+@frappe.whitelist()
+def get_exchange_rate(from_currency, to_currency, transaction_date=None, args=None):
+    """
+    Override ERPNext's get_exchange_rate so documents pick the rate of the
+    company's rate type, not whichever rate type was entered last
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        transaction_date (str): Date for exchange rate, today if not given
+        args (str): for_buying or for_selling, passed on to ERPNext
+
+    Returns:
+        float: Exchange rate
+    """
+    if not (from_currency and to_currency):
+        return
+
+    if from_currency == to_currency:
+        return 1
+
+    # The form's company, else the user's default company
+    company = frappe.form_dict.get("company") or frappe.defaults.get_user_default("Company")
+    rate_type = get_company_rate_type(company)
+
+    exchange_rate = resolve_exchange_rate(from_currency, to_currency, transaction_date or nowdate(), rate_type)
+    if exchange_rate:
+        return flt(exchange_rate)
+
+    # ERPNext's own lookup would take a rate of another type; it is only
+    # used to fetch from the rate provider for pairs without any rate
+    if frappe.db.exists("Currency Exchange", {"from_currency": from_currency, "to_currency": to_currency}) \
+        or frappe.db.exists("Currency Exchange", {"from_currency": to_currency, "to_currency": from_currency}):
+        return 0.0
+
+    return standard_get_exchange_rate(from_currency, to_currency, transaction_date, args)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from bisect import bisect_right
+from datetime import date as datetime_date
+
+import frappe
+from frappe.utils import cint, flt, getdate
+from lebanese_regulations.accounting.rate_metrics import record_event, record_miss
+
+# Redis keys of the shared rate cache
+RATE_VERSION_KEY = "lebanese_regulations:exchange_rate_version"
+RATE_BUCKET_KEY = "lebanese_regulations:exchange_rates"
+
+# Seconds a rate bucket stays in redis after it was loaded
+RATE_BUCKET_EXPIRY = 7 * 24 * 60 * 60
+
+# Concurrent LBP rate types recorded on Currency Exchange
+RATE_TYPES = ("Official", "Sayrafa", "Market")
+DEFAULT_RATE_TYPE = "Official"
+
+# In-process exchange rate timelines, one dict per site:
+# {site: {(rate_type, from_currency, to_currency, year): RateTimeline}}
+_timelines = {}
+
+class RateTimeline:
+    """
+    Sorted date/rate arrays of the Currency Exchange rows for one rate type,
+    currency pair and calendar year, led by the last rate before the year starts
+    """
+    __slots__ = ("dates", "rates", "version")
+
+    def __init__(self, dates, rates, version=0):
+        self.dates = dates
+        self.rates = rates
+        self.version = version
+
+    def rate_on(self, date):
+        """
+        Get the rate in effect on or before a date
+
+        Args:
+            date (date): Date to get the rate for
+
+        Returns:
+            float: Exchange rate, or None if there is no rate on or before the date
+        """
+        idx = bisect_right(self.dates, date)
+        if not idx:
+            return None
+
+        return self.rates[idx - 1]
+
+def get_site_timelines():
+    """
+    Get the timeline cache of the current site
+
+    Returns:
+        dict: Timelines keyed by (rate_type, from_currency, to_currency, year)
+    """
+    return _timelines.setdefault(frappe.local.site, {})
+
+def get_rate_type(rate_type=None):
+    """
+    Get the rate type to use, defaulting to the official rate
+
+    Args:
+        rate_type (str): Requested rate type
+
+    Returns:
+        str: Rate type
+    """
+    return rate_type or DEFAULT_RATE_TYPE
+
+def get_company_rate_type(company):
+    """
+    Get the LBP rate type a company posts and reports with
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        str: Rate type
+    """
+    return get_rate_type(company and frappe.get_cached_value("Company", company, "lbp_rate_type"))
+
+def get_rate_version(from_currency=None, to_currency=None, rate_type=None):
+    """
+    Get the shared version counter of a currency pair and rate type, or the
+    global counter bumped by every rate change when no pair is given
+
+    The counter is read from redis once per request or job.
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+
+    Returns:
+        int: Version counter
+    """
+    versions = getattr(frappe.local, "exchange_rate_versions", None)
+    if versions is None:
+        versions = frappe.local.exchange_rate_versions = {}
+
+    key = get_rate_version_key(from_currency, to_currency, rate_type)
+    if key not in versions:
+        versions[key] = cint(frappe.cache().get(frappe.cache().make_key(key)))
+
+    return versions[key]
+
+def bump_rate_version(from_currency=None, to_currency=None, rate_type=None):
+    """
+    Increment the shared version counter of a currency pair and rate type
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+    """
+    key = get_rate_version_key(from_currency, to_currency, rate_type)
+    version = frappe.cache().incr(frappe.cache().make_key(key))
+
+    versions = getattr(frappe.local, "exchange_rate_versions", None)
+    if versions is not None:
+        versions[key] = cint(version)
+
+def get_rate_version_key(from_currency=None, to_currency=None, rate_type=None):
+    """
+    Get the redis key of a version counter
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+
+    Returns:
+        str: Redis key
+    """
+    if not from_currency:
+        return RATE_VERSION_KEY
+
+    return f"{RATE_VERSION_KEY}:{get_rate_type(rate_type)}:{from_currency}:{to_currency}"
+
+def get_rate_timeline(from_currency, to_currency, year, rate_type=None):
+    """
+    Get the cached rate timeline of a currency pair and rate type for a year,
+    trying the process cache, then redis, then the database
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        year (int): Calendar year
+        rate_type (str): Rate type
+
+    Returns:
+        RateTimeline: Rate timeline for the pair and year
+    """
+    rate_type = get_rate_type(rate_type)
+
+    timeline = peek_rate_timeline(from_currency, to_currency, year, rate_type)
+    if timeline is None:
+        record_miss(from_currency, to_currency, rate_type)
+
+        version = get_rate_version(from_currency, to_currency, rate_type)
+        timeline = load_rate_timeline(from_currency, to_currency, year, rate_type)
+        timeline.version = version
+
+        frappe.cache().set_value(
+            get_rate_bucket_key(from_currency, to_currency, year, version, rate_type),
+            (timeline.dates, timeline.rates),
+            expires_in_sec=RATE_BUCKET_EXPIRY
+        )
+        get_site_timelines()[(rate_type, from_currency, to_currency, year)] = timeline
+
+    return timeline
+
+def peek_rate_timeline(from_currency, to_currency, year, rate_type=None):
+    """
+    Get the rate timeline of a currency pair and rate type for a year if it
+    is already cached in this process or in redis
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        year (int): Calendar year
+        rate_type (str): Rate type
+
+    Returns:
+        RateTimeline: Rate timeline, or None if the bucket is not cached
+    """
+    rate_type = get_rate_type(rate_type)
+
+    timelines = get_site_timelines()
+    key = (rate_type, from_currency, to_currency, year)
+    version = get_rate_version(from_currency, to_currency, rate_type)
+
+    timeline = timelines.get(key)
+    if timeline is not None and timeline.version == version:
+        record_event("timeline_hit_local")
+        return timeline
+
+    cached = frappe.cache().get_value(get_rate_bucket_key(from_currency, to_currency, year, version, rate_type))
+    if cached is None:
+        return None
+
+    record_event("timeline_hit_redis")
+    timeline = RateTimeline(cached[0], cached[1], version)
+    timelines[key] = timeline
+
+    return timeline
+
+def get_rate_bucket_key(from_currency, to_currency, year, version, rate_type=None):
+    """
+    Get the redis key of a rate bucket
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        year (int): Calendar year
+        version (int): Version counter of the pair
+        rate_type (str): Rate type
+
+    Returns:
+        str: Redis key
+    """
+    return f"{RATE_BUCKET_KEY}:{get_rate_type(rate_type)}:{from_currency}:{to_currency}:{year}:{version}"
+
+def load_rate_timeline(from_currency, to_currency, year, rate_type=None):
+    """
+    Load the Currency Exchange rows of a currency pair and rate type for a
+    year in date order, led by the last row before the year
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        year (int): Calendar year
+        rate_type (str): Rate type
+
+    Returns:
+        RateTimeline: Rate timeline for the pair and year
+    """
+    values = {
+        "from_currency": from_currency,
+        "to_currency": to_currency,
+        "rate_type": get_rate_type(rate_type),
+        "year_start": datetime_date(year, 1, 1),
+        "year_end": datetime_date(year, 12, 31)
+    }
+
+    # Rows of the same date are ordered by creation so the latest one wins
+    rows = frappe.db.sql("""
+        (SELECT date, exchange_rate, creation
+         FROM `tabCurrency Exchange`
+         WHERE from_currency = %(from_currency)s AND to_currency = %(to_currency)s
+           AND rate_type = %(rate_type)s AND date < %(year_start)s
+         ORDER BY date DESC, creation DESC
+         LIMIT 1)
+        UNION ALL
+        (SELECT date, exchange_rate, creation
+         FROM `tabCurrency Exchange`
+         WHERE from_currency = %(from_currency)s AND to_currency = %(to_currency)s
+           AND rate_type = %(rate_type)s AND date BETWEEN %(year_start)s AND %(year_end)s)
+        ORDER BY date ASC, creation ASC
+    """, values)
+
+    return RateTimeline(
+        [getdate(row[0]) for row in rows],
+        [flt(row[1]) for row in rows]
+    )
+
+def get_cached_rate(from_currency, to_currency, date, rate_type=None):
+    """
+    Get the exchange rate on or before a date from the cached timelines,
+    falling back to the inverse of the reverse pair
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        date (str): Date for exchange rate
+        rate_type (str): Rate type
+
+    Returns:
+        float: Exchange rate, or None if no rate is found
+    """
+    date = getdate(date)
+
+    exchange_rate = get_rate_timeline(from_currency, to_currency, date.year, rate_type).rate_on(date)
+
+    if not exchange_rate:
+        # Try reverse lookup
+        exchange_rate = get_rate_timeline(to_currency, from_currency, date.year, rate_type).rate_on(date)
+
+        if exchange_rate:
+            exchange_rate = 1.0 / flt(exchange_rate)
+
+    return exchange_rate or None
+
+def peek_cached_rate(from_currency, to_currency, date, rate_type=None):
+    """
+    Get the exchange rate on or before a date without touching the database
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        date (date): Date for exchange rate
+        rate_type (str): Rate type
+
+    Returns:
+        tuple: (resolved, exchange_rate); resolved is False when a needed
+            bucket is not cached
+    """
+    direct = peek_rate_timeline(from_currency, to_currency, date.year, rate_type)
+    if direct is None:
+        return False, None
+
+    exchange_rate = direct.rate_on(date)
+    if exchange_rate:
+        return True, exchange_rate
+
+    reverse = peek_rate_timeline(to_currency, from_currency, date.year, rate_type)
+    if reverse is None:
+        return False, None
+
+    exchange_rate = reverse.rate_on(date)
+    return True, (1.0 / flt(exchange_rate)) if exchange_rate else None
+
+def get_triangulated_rate(from_currency, to_currency, date, rate_type=None, base_currency=None):
+    """
+    Get the exchange rate between two currencies through the base currency
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        date (str): Date for exchange rate
+        rate_type (str): Rate type
+        base_currency (str): Currency to triangulate through
+
+    Returns:
+        float: Exchange rate, or None if either leg is missing
+    """
+    base_currency = base_currency or get_base_currency()
+    if base_currency in (from_currency, to_currency):
+        return None
+
+    to_base = get_cached_rate(from_currency, base_currency, date, rate_type)
+    from_base = get_cached_rate(base_currency, to_currency, date, rate_type)
+
+    if to_base and from_base:
+        return to_base * from_base
+
+    return None
+
+def get_base_currency():
+    """
+    Get the currency exchange rates are triangulated through
+
+    Returns:
+        str: Default currency of the Lebanese company, or USD
+    """
+    return frappe.db.get_value("Company", {"country": "Lebanon"}, "default_currency", cache=True) or "USD"
+
+def invalidate_rate_timeline(from_currency, to_currency, rate_type=None):
+    """
+    Invalidate the cached timelines of a currency pair and rate type in every
+    process by bumping its shared version counter
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+    """
+    rate_type = get_rate_type(rate_type)
+
+    bump_rate_version(from_currency, to_currency, rate_type)
+    bump_rate_version()
+
+    # Bump again once the change is committed, retiring anything another
+    # process cached from the database in the meantime. A rollback bumps
+    # too, retiring timelines cached with the rate that never committed.
+    for callbacks in (frappe.db.after_commit, frappe.db.after_rollback):
+        callbacks.add(lambda: bump_rate_version(from_currency, to_currency, rate_type))
+        callbacks.add(bump_rate_version)
+
+    timelines = get_site_timelines()
+    for key in [key for key in timelines if key[:3] == (rate_type, from_currency, to_currency)]:
+        timelines.pop(key, None)
+
+def clear_rate_cache():
+    """
+    Drop every cached timeline of the current site in this process
+    """
+    _timelines.pop(frappe.local.site, None)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import csv
+import io
+import json
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, getdate, now_datetime
+from lebanese_regulations.accounting.daily_rates import update_daily_rates_for_changes
+from lebanese_regulations.accounting.events import update_open_documents_with_new_rate
+from lebanese_regulations.accounting.rate_cache import RATE_TYPES, get_rate_type, invalidate_rate_timeline
+from lebanese_regulations.accounting.rate_matrix import clear_rate_matrices
+from lebanese_regulations.accounting.report_cache import mark_rates_changed
+from lebanese_regulations.accounting.utils import get_currency_exchange_name
+
+# Currency Exchange rows written per INSERT statement
+IMPORT_BATCH_SIZE = 1000
+
+# Columns of a Currency Exchange upsert, in VALUES order
+EXCHANGE_RATE_COLUMNS = [
+    "name", "date", "from_currency", "to_currency", "exchange_rate", "rate_type",
+    "for_buying", "for_selling", "for_month_end", "creation", "modified", "owner", "modified_by"
+]
+
+def import_exchange_rates(file_path=None, content=None, file_format=None, rate_type=None, propagate=True):
+    """
+    Import Currency Exchange rates from a CSV or JSON file without running
+    the per-document hooks
+
+    Rows are validated in memory and written with multi-row upserts. The
+    caches and daily rates are then refreshed once for the whole file, and
+    open documents are updated at most once per currency and rate type.
+
+    CSV files need a header row; JSON files hold a list of objects. Both use
+    the keys date, from_currency, to_currency and exchange_rate, and may add
+    rate_type, for_buying and for_selling.
+
+    Args:
+        file_path (str): Path of the file to import
+        content (str): File content, instead of file_path
+        file_format (str): "csv" or "json", guessed from the file name if not given
+        rate_type (str): Rate type of rows that do not set one
+        propagate (bool): Whether to update open documents with the new current rates
+
+    Returns:
+        dict: Number of rows imported, pairs touched and currencies propagated
+    """
+    if file_path:
+        file_format = file_format or os.path.splitext(file_path)[1].lstrip(".")
+        with open(file_path, encoding="utf-8-sig") as f:
+            content = f.read()
+
+    rows = validate_exchange_rate_rows(parse_exchange_rate_file(content, file_format), rate_type)
+    if not rows:
+        return {"imported": 0, "pairs": 0, "propagated": 0}
+
+    upsert_exchange_rate_rows(rows)
+
+    # One invalidation and one daily rate refresh for the whole file
+    pairs = {(row.from_currency, row.to_currency, row.rate_type) for row in rows}
+    for pair in pairs:
+        invalidate_rate_timeline(*pair)
+    clear_rate_matrices()
+
+    update_daily_rates_for_changes([
+        (row.from_currency, row.to_currency, row.date, row.rate_type) for row in rows
+    ])
+
+    propagated = propagate_current_rates(rows) if propagate else 0
+
+    frappe.logger().info(f"Imported {len(rows)} exchange rates for {len(pairs)} currency pairs")
+
+    return {"imported": len(rows), "pairs": len(pairs), "propagated": propagated}
+
+def parse_exchange_rate_file(content, file_format):
+    """
+    Parse the rows of a CSV or JSON rate file
+
+    Args:
+        content (str): File content
+        file_format (str): "csv" or "json"
+
+    Returns:
+        list: Rows as dicts
+    """
+    file_format = (file_format or "").lower()
+
+    if file_format == "json":
+        rows = json.loads(content or "[]")
+        if not isinstance(rows, list):
+            frappe.throw(_("Exchange rate JSON must be a list of rows"))
+        return rows
+
+    if file_format == "csv":
+        return list(csv.DictReader(io.StringIO(content or "")))
+
+    frappe.throw(_("Unsupported exchange rate file format: {0}").format(file_format))
+
+def validate_exchange_rate_rows(rows, rate_type=None):
+    """
+    Validate and normalize imported rate rows in memory
+
+    All errors are reported together. Later rows replace earlier rows that
+    resolve to the same Currency Exchange name.
+
+    Args:
+        rows (list): Rows as dicts
+        rate_type (str): Rate type of rows that do not set one
+
+    Returns:
+        list: Normalized rows, ordered by date
+    """
+    currencies = set(frappe.get_all("Currency", pluck="name"))
+    errors = []
+    valid = {}
+
+    for idx, row in enumerate(rows, start=1):
+        row = frappe._dict({(key or "").strip(): value for key, value in row.items()})
+
+        try:
+            date = getdate(row.date) if row.date else None
+        except Exception:
+            date = None
+
+        from_currency = (row.from_currency or "").strip()
+        to_currency = (row.to_currency or "").strip()
+        row_rate_type = get_rate_type((row.rate_type or "").strip() or rate_type)
+        exchange_rate = flt(row.exchange_rate)
+
+        if not date:
+            errors.append(_("Row {0}: invalid date {1}").format(idx, row.date))
+        elif from_currency not in currencies or to_currency not in currencies:
+            errors.append(_("Row {0}: unknown currency pair {1}/{2}").format(idx, from_currency, to_currency))
+        elif from_currency == to_currency:
+            errors.append(_("Row {0}: From and To currencies are the same").format(idx))
+        elif exchange_rate <= 0:
+            errors.append(_("Row {0}: exchange rate must be greater than zero").format(idx))
+        elif row_rate_type not in RATE_TYPES:
+            errors.append(_("Row {0}: unknown rate type {1}").format(idx, row_rate_type))
+        else:
+            for_buying = cint(row.for_buying) if row.get("for_buying") not in (None, "") else 1
+            for_selling = cint(row.for_selling) if row.get("for_selling") not in (None, "") else 1
+            name = get_currency_exchange_name(date, from_currency, to_currency, for_buying, for_selling, row_rate_type)
+
+            valid[name] = frappe._dict({
+                "name": name,
+                "date": date,
+                "from_currency": from_currency,
+                "to_currency": to_currency,
+                "exchange_rate": exchange_rate,
+                "rate_type": row_rate_type,
+                "for_buying": for_buying,
+                "for_selling": for_selling
+            })
+
+    if errors:
+        frappe.throw("<br>".join(errors), title=_("Invalid Exchange Rates"))
+
+    return sorted(valid.values(), key=lambda row: row.date)
+
+def upsert_exchange_rate_rows(rows):
+    """
+    Create or update Currency Exchange records with multi-row upserts
+
+    Names follow the Currency Exchange autoname, so existing records are
+    updated in place. Document hooks do not run; callers refresh the rate
+    caches, while cached report results are retired here.
+
+    Args:
+        rows (list): Dicts with name, date, from_currency, to_currency,
+            exchange_rate and optionally rate_type, for_buying, for_selling
+            and for_month_end
+    """
+    if not rows:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user
+
+    # Results covering the earliest written date onwards are stale
+    mark_rates_changed(min(getdate(row["date"]) for row in rows))
+
+    for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[i:i + IMPORT_BATCH_SIZE]
+
+        values = []
+        for row in batch:
+            values.extend([
+                row["name"], row["date"], row["from_currency"], row["to_currency"], flt(row["exchange_rate"]),
+                get_rate_type(row.get("rate_type")), cint(row.get("for_buying", 1)), cint(row.get("for_selling", 1)),
+                cint(row.get("for_month_end")), now, now, user, user
+            ])
+
+        placeholders = "({0})".format(", ".join(["%s"] * len(EXCHANGE_RATE_COLUMNS)))
+
+        frappe.db.sql("""
+            INSERT INTO `tabCurrency Exchange`
+                ({columns})
+            VALUES {rows}
+            ON DUPLICATE KEY UPDATE
+                exchange_rate = VALUES(exchange_rate),
+                for_month_end = GREATEST(for_month_end, VALUES(for_month_end)),
+                modified = VALUES(modified),
+                modified_by = VALUES(modified_by)
+        """.format(
+            columns=", ".join(EXCHANGE_RATE_COLUMNS),
+            rows=", ".join([placeholders] * len(batch))
+        ), values)
+
+def propagate_current_rates(rows):
+    """
+    Update open documents once per LBP pair and rate type whose newest
+    imported rate is the rate currently in effect
+
+    Args:
+        rows (list): Imported rows, ordered by date
+
+    Returns:
+        int: Number of pairs propagated
+    """
+    newest = {}
+    for row in rows:
+        if "LBP" in (row.from_currency, row.to_currency):
+            newest[(row.from_currency, row.to_currency, row.rate_type)] = row
+
+    propagated = 0
+    for (from_currency, to_currency, rate_type), row in newest.items():
+        # Historical imports leave open documents alone
+        latest_date = frappe.db.sql("""
+            SELECT MAX(date)
+            FROM `tabCurrency Exchange`
+            WHERE from_currency = %s AND to_currency = %s AND rate_type = %s
+        """, (from_currency, to_currency, rate_type))[0][0]
+
+        if latest_date and getdate(latest_date) > row.date:
+            continue
+
+        update_open_documents_with_new_rate(row)
+        propagated += 1
+
+    return propagated
+
+@frappe.whitelist()
+def import_exchange_rates_from_file(file_url, rate_type=None, propagate=1):
+    """
+    Import the exchange rates of an uploaded CSV or JSON file
+
+    Args:
+        file_url (str): URL of the uploaded File
+        rate_type (str): Rate type of rows that do not set one
+        propagate (int): Whether to update open documents with the new current rates
+
+    Returns:
+        dict: Import summary
+    """
+    frappe.only_for(["System Manager", "Accounts Manager"])
+
+    file_doc = frappe.get_doc("File", {"file_url": file_url})
+    result = import_exchange_rates(
+        file_path=file_doc.get_full_path(),
+        rate_type=rate_type,
+        propagate=cint(propagate)
+    )
+
+    frappe.msgprint(_("Imported {0} exchange rates for {1} currency pairs").format(
+        result["imported"], result["pairs"]
+    ))
+
+    return result
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import numpy as np
+
+import frappe
+from frappe.utils import flt, getdate
+from lebanese_regulations.accounting.rate_cache import RATE_BUCKET_EXPIRY, get_base_currency, get_rate_type, get_rate_version
+from lebanese_regulations.accounting.rate_metrics import record_event
+
+# Maximum number of per-date matrices kept per site
+MAX_CACHED_MATRICES = 32
+
+# Redis key of the shared matrix cache
+RATE_MATRIX_KEY = "lebanese_regulations:exchange_rate_matrix"
+
+# Cross-rate matrices, one dict per site:
+# {site: {(rate_type, date, base_currency, version): RateMatrix}}
+_matrices = {}
+
+class RateMatrix:
+    """
+    Currency x currency exchange rate matrix for one rate type and date
+
+    values[i, j] is the number of units of currencies[j] for one unit of
+    currencies[i], or NaN when the pair cannot be resolved.
+    """
+
+    def __init__(self, date, currencies, values):
+        self.date = date
+        self.currencies = currencies
+        self.index = {currency: i for i, currency in enumerate(currencies)}
+        self.values = values
+
+    def get_rate(self, from_currency, to_currency):
+        """
+        Get the exchange rate between two currencies
+
+        Args:
+            from_currency (str): From currency
+            to_currency (str): To currency
+
+        Returns:
+            float: Exchange rate, or None if the pair cannot be resolved
+        """
+        if from_currency == to_currency:
+            return 1.0
+
+        i = self.index.get(from_currency)
+        j = self.index.get(to_currency)
+        if i is None or j is None:
+            return None
+
+        rate = self.values[i, j]
+        return None if np.isnan(rate) else float(rate)
+
+    def get_rates_to(self, currencies, to_currency):
+        """
+        Get the exchange rates of several currencies against one currency
+
+        Args:
+            currencies (list): From currencies
+            to_currency (str): To currency
+
+        Returns:
+            numpy.ndarray: Exchange rates, NaN where a pair cannot be resolved
+        """
+        rates = np.full(len(currencies), np.nan)
+
+        j = self.index.get(to_currency)
+        if j is None:
+            return rates
+
+        for k, currency in enumerate(currencies):
+            if currency == to_currency:
+                rates[k] = 1.0
+            elif currency in self.index:
+                rates[k] = self.values[self.index[currency], j]
+
+        return rates
+
+def get_rate_matrix(date, base_currency=None, rate_type=None):
+    """
+    Get the cross-rate matrix for a date, building it on first use
+
+    Args:
+        date (str): Date for exchange rates
+        base_currency (str): Currency to triangulate through
+        rate_type (str): Rate type
+
+    Returns:
+        RateMatrix: Rate matrix for the date
+    """
+    date = getdate(date)
+    base_currency = base_currency or get_base_currency()
+    rate_type = get_rate_type(rate_type)
+
+    # Any rate change bumps the global version, which retires every matrix
+    version = get_rate_version()
+
+    matrices = _matrices.setdefault(frappe.local.site, {})
+    key = (rate_type, date, base_currency, version)
+
+    matrix = matrices.get(key)
+    if matrix is None:
+        cache_key = f"{RATE_MATRIX_KEY}:{rate_type}:{date}:{base_currency}:{version}"
+        cached = frappe.cache().get_value(cache_key)
+
+        if cached is not None:
+            record_event("matrix_hit_redis")
+            matrix = RateMatrix(date, cached[0], cached[1])
+        else:
+            record_event("matrix_miss")
+            matrix = build_rate_matrix(date, base_currency, rate_type)
+            frappe.cache().set_value(cache_key, (matrix.currencies, matrix.values),
+                expires_in_sec=RATE_BUCKET_EXPIRY)
+
+        # Evict the oldest matrix once the cache is full
+        if len(matrices) >= MAX_CACHED_MATRICES:
+            matrices.pop(next(iter(matrices)))
+
+        matrices[key] = matrix
+    else:
+        record_event("matrix_hit_local")
+
+    return matrix
+
+def build_rate_matrix(date, base_currency, rate_type=None):
+    """
+    Build the cross-rate matrix for a date from every stored Currency Exchange
+    row of a rate type
+
+    Pairs are resolved in the same order as get_exchange_rate: the direct
+    rate, then the inverse of the reverse pair, then triangulation through
+    the base currency.
+
+    Args:
+        date (date): Date for exchange rates
+        base_currency (str): Currency to triangulate through
+        rate_type (str): Rate type
+
+    Returns:
+        RateMatrix: Rate matrix for the date
+    """
+    # Latest rate of every stored pair on or before the date
+    rows = frappe.db.sql("""
+        SELECT from_currency, to_currency, exchange_rate
+        FROM (
+            SELECT from_currency, to_currency, exchange_rate,
+                ROW_NUMBER() OVER (
+                    PARTITION BY from_currency, to_currency
+                    ORDER BY date DESC, creation DESC
+                ) AS row_no
+            FROM `tabCurrency Exchange`
+            WHERE date <= %s AND rate_type = %s
+        ) latest
+        WHERE row_no = 1
+    """, (date, get_rate_type(rate_type)))
+
+    currencies = sorted({row[0] for row in rows} | {row[1] for row in rows} | {base_currency})
+    index = {currency: i for i, currency in enumerate(currencies)}
+
+    # Direct rates
+    direct = np.full((len(currencies), len(currencies)), np.nan)
+    for from_currency, to_currency, exchange_rate in rows:
+        if flt(exchange_rate):
+            direct[index[from_currency], index[to_currency]] = flt(exchange_rate)
+
+    # Inverse of the reverse pair where no direct rate exists
+    values = direct.copy()
+    missing = np.isnan(values) & ~np.isnan(direct.T)
+    values[missing] = 1.0 / direct.T[missing]
+
+    np.fill_diagonal(values, 1.0)
+
+    # Triangulate the remaining pairs through the base currency
+    b = index[base_currency]
+    derived = np.outer(values[:, b], values[b, :])
+    missing = np.isnan(values)
+    values[missing] = derived[missing]
+
+    return RateMatrix(date, currencies, values)
+
+def clear_rate_matrices():
+    """
+    Drop every cached rate matrix of the current site
+    """
+    _matrices.pop(frappe.local.site, None)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+
+# Redis hash holding the shared counters
+RATE_METRICS_KEY = "lebanese_regulations:exchange_rate_metrics"
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# Counters are pushed to redis after this many events or seconds
+FLUSH_EVERY_EVENTS = 500
+FLUSH_INTERVAL_SECONDS = 10
+
+# Counters not yet pushed to redis, one dict per site:
+# {site: {"counters": {name: amount}, "events": int, "flushed_at": float}}
+_pending = {}
+
+def record_event(name, amount=1):
+    """
+    Count an exchange rate lookup event
+
+    Counters are kept in process and pushed to redis in batches, so
+    recording costs a dict update on the lookup path.
+
+    Args:
+        name (str): Counter name
+        amount (float): Amount to add
+    """
+    pending = get_site_pending()
+    counters = pending["counters"]
+    counters[name] = counters.get(name, 0) + amount
+    pending["events"] += 1
+
+    if pending["events"] >= FLUSH_EVERY_EVENTS or time.monotonic() - pending["flushed_at"] >= FLUSH_INTERVAL_SECONDS:
+        flush_rate_metrics()
+
+def record_miss(from_currency, to_currency, rate_type=None):
+    """
+    Count a rate timeline that had to be loaded from the database
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+    """
+    record_event("timeline_miss")
+    record_event(f"miss:{rate_type or ''}:{from_currency}:{to_currency}")
+
+def record_fallback(from_currency, to_currency, rate_type=None):
+    """
+    Count a lookup that found no rate and fell back to 1.0
+
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        rate_type (str): Rate type
+    """
+    record_event("fallback")
+    record_event(f"fallback:{rate_type or ''}:{from_currency}:{to_currency}")
+
+def record_missing_rates(counts, rate_type=None):
+    """
+    Count report entries left without an LBP amount for lack of a rate
+
+    Args:
+        counts (dict): Number of entries by account currency
+        rate_type (str): Rate type
+    """
+    for currency, count in counts.items():
+        record_event("missing_rate", count)
+        record_event(f"missing_rate:{rate_type or ''}:{currency}:LBP", count)
+
+@contextmanager
+def timed_lookup(kind):
+    """
+    Count a lookup and add its duration to the latency histogram
+
+    Args:
+        kind (str): Lookup kind, e.g. "get_exchange_rate"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        bucket = next((bound for bound in LATENCY_BUCKETS_MS if elapsed_ms <= bound), "inf")
+        record_event(f"latency:{kind}:le:{bucket}")
+        record_event(f"latency:{kind}:count")
+        record_event(f"latency:{kind}:sum_ms", elapsed_ms)
+
+def get_site_pending():
+    """
+    Get the unflushed counters of the current site
+
+    Returns:
+        dict: Pending counters and flush state
+    """
+    pending = _pending.get(frappe.local.site)
+    if pending is None:
+        pending = _pending[frappe.local.site] = {"counters": {}, "events": 0, "flushed_at": time.monotonic()}
+
+    return pending
+
+def flush_rate_metrics():
+    """
+    Push the counters of this process to the shared redis hash
+    """
+    pending = get_site_pending()
+    counters = pending["counters"]
+
+    pending["counters"] = {}
+    pending["events"] = 0
+    pending["flushed_at"] = time.monotonic()
+
+    if not counters:
+        return
+
+    try:
+        # A raw pipeline keeps the hash values as plain numbers
+        pipeline = frappe.cache().pipeline()
+        key = frappe.cache().make_key(RATE_METRICS_KEY)
+        for name, amount in counters.items():
+            if isinstance(amount, float):
+                pipeline.hincrbyfloat(key, name, amount)
+            else:
+                pipeline.hincrby(key, name, amount)
+        pipeline.execute()
+    except Exception:
+        # Metrics must never break a rate lookup
+        frappe.logger().warning("Could not flush exchange rate metrics", exc_info=True)
+
+def get_rate_metrics(top=20):
+    """
+    Get the shared exchange rate lookup metrics
+
+    Args:
+        top (int): Number of missing and fallback pairs to list
+
+    Returns:
+        dict: Counters, cache hit ratio, latency histograms and the pairs
+            that miss, fall back or lack a report rate most often
+    """
+    flush_rate_metrics()
+
+    pipeline = frappe.cache().pipeline()
+    pipeline.hgetall(frappe.cache().make_key(RATE_METRICS_KEY))
+    raw = pipeline.execute()[0] or {}
+
+    counters = {}
+    misses = {}
+    fallbacks = {}
+    missing_rates = {}
+    latency = {}
+
+    for name, value in raw.items():
+        name = frappe.safe_decode(name)
+        value = flt(frappe.safe_decode(value))
+
+        if name.startswith("miss:"):
+            misses[name[len("miss:"):]] = cint(value)
+        elif name.startswith("fallback:"):
+            fallbacks[name[len("fallback:"):]] = cint(value)
+        elif name.startswith("missing_rate:"):
+            missing_rates[name[len("missing_rate:"):]] = cint(value)
+        elif name.startswith("latency:"):
+            kind, metric = name[len("latency:"):].split(":", 1)
+            histogram = latency.setdefault(kind, {"count": 0, "sum_ms": 0.0, "buckets": {}})
+            if metric.startswith("le:"):
+                histogram["buckets"][metric[len("le:"):]] = cint(value)
+            else:
+                histogram[metric] = value
+        else:
+            counters[name] = cint(value)
+
+    for histogram in latency.values():
+        histogram["count"] = cint(histogram["count"])
+        histogram["avg_ms"] = flt(histogram["sum_ms"] / histogram["count"], 3) if histogram["count"] else 0
+
+    hits = counters.get("timeline_hit_local", 0) + counters.get("timeline_hit_redis", 0)
+    loads = hits + counters.get("timeline_miss", 0)
+
+    return {
+        "counters": counters,
+        "timeline_hit_ratio": flt(hits / loads, 4) if loads else None,
+        "latency": latency,
+        "top_misses": sorted(misses.items(), key=lambda item: item[1], reverse=True)[:cint(top)],
+        "top_fallbacks": sorted(fallbacks.items(), key=lambda item: item[1], reverse=True)[:cint(top)],
+        "top_missing_rates": sorted(missing_rates.items(), key=lambda item: item[1], reverse=True)[:cint(top)]
+    }
+
+def reset_rate_metrics():
+    """
+    Clear the shared exchange rate lookup metrics
+    """
+    get_site_pending()["counters"] = {}
+    frappe.cache().delete(frappe.cache().make_key(RATE_METRICS_KEY))
+
+def print_rate_metrics(top=20):
+    """
+    Print the exchange rate lookup metrics, for use from bench console
+
+    Args:
+        top (int): Number of missing and fallback pairs to list
+    """
+    metrics = get_rate_metrics(top)
+
+    print("Timeline hit ratio: {0}".format(metrics["timeline_hit_ratio"]))
+    for name, value in sorted(metrics["counters"].items()):
+        print("  {0}: {1}".format(name, value))
+
+    for kind, histogram in sorted(metrics["latency"].items()):
+        print("{0}: {1} lookups, avg {2} ms".format(kind, histogram["count"], histogram["avg_ms"]))
+        for bound in [str(bound) for bound in LATENCY_BUCKETS_MS] + ["inf"]:
+            if histogram["buckets"].get(bound):
+                print("  <= {0} ms: {1}".format(bound, histogram["buckets"][bound]))
+
+    for label, pairs in (
+        ("Most missed", metrics["top_misses"]),
+        ("Most fallbacks to 1.0", metrics["top_fallbacks"]),
+        ("Most report entries without a rate", metrics["top_missing_rates"])
+    ):
+        if pairs:
+            print(label + ":")
+            for pair, count in pairs:
+                print("  {0}: {1}".format(pair, count))
+
+@frappe.whitelist()
+def get_exchange_rate_metrics(top=20):
+    """
+    Get the exchange rate lookup metrics
+
+    Args:
+        top (int): Number of missing and fallback pairs to list
+
+    Returns:
+        dict: Lookup metrics
+    """
+    frappe.only_for(["System Manager", "Accounts Manager"])
+
+    return get_rate_metrics(cint(top) or 20)
+
+@frappe.whitelist()
+def reset_exchange_rate_metrics():
+    """
+    Clear the exchange rate lookup metrics
+    """
+    frappe.only_for("System Manager")
+
+    reset_rate_metrics()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, getdate
+
+# Redis keys of the report result cache
+REPORT_RESULT_KEY = "lebanese_regulations:report_result"
+LEDGER_VERSION_KEY = "lebanese_regulations:ledger_versions"
+RATE_CHANGE_VERSION_KEY = "lebanese_regulations:rate_change_versions"
+
+# Seconds a cached report result is kept
+REPORT_RESULT_EXPIRY = 24 * 60 * 60
+
+# Results with more rows than this are not cached
+MAX_CACHED_ROWS = 200000
+
+def get_report_result(report_name, filters, compute, refresh=None):
+    """
+    Get a report result from the cache, computing and caching it on a miss
+
+    A result stays valid until a GL Entry of its company, or a Currency
+    Exchange rate, dated on or before its to_date changes. Earlier dates
+    count too, since they feed opening balances and forward-filled rates.
+
+    Reports that can bring a stale result up to date pass refresh. Their
+    compute then returns (result, state), and refresh(state) returns the
+    same pair, or None to fall back to compute. Refresh is only tried when
+    the ledger changed and the rates did not.
+
+    Args:
+        report_name (str): Report name
+        filters (dict): Report filters with company and to_date
+        compute (callable): Computes the result when it is not cached
+        refresh (callable): Updates a cached result from its state
+
+    Returns:
+        Result of compute, or the cached copy of it
+    """
+    key = get_report_result_key(report_name, filters)
+    versions = get_dependency_versions(filters.get("company"), filters.get("to_date"))
+
+    # The refresh state holds the user's rows, so it is never shared either
+    cached = frappe.cache().get_value(key)
+    if cached is not None and cached.get("user") != frappe.session.user:
+        cached = None
+
+    if cached is not None and cached.get("versions") == versions:
+        return cached["result"]
+
+    computed = None
+    if refresh and cached is not None and cached.get("state") is not None \
+            and cached["versions"].get("rates") == versions["rates"]:
+        computed = refresh(cached["state"])
+
+    if computed is None:
+        computed = compute()
+
+    result, state = computed if refresh else (computed, None)
+
+    data = result[1] if isinstance(result, (list, tuple)) and len(result) > 1 else None
+    if data is None or len(data) <= MAX_CACHED_ROWS:
+        frappe.cache().set_value(
+            key,
+            {"versions": versions, "user": frappe.session.user, "result": result, "state": state},
+            expires_in_sec=REPORT_RESULT_EXPIRY
+        )
+
+    return result
+
+def get_report_result_key(report_name, filters):
+    """
+    Get the cache key of a report result
+
+    Results are kept per user, as each user's permissions narrow the
+    entries a result covers.
+
+    Args:
+        report_name (str): Report name
+        filters (dict): Report filters
+
+    Returns:
+        str: Redis key
+    """
+    return "{0}:{1}:{2}:{3}:{4}".format(
+        REPORT_RESULT_KEY, frappe.scrub(report_name), filters.get("company") or "", frappe.session.user,
+        get_filters_hash(filters)
+    )
+
+def get_filters_hash(filters):
+    """
+    Hash a normalized filter set, so equivalent filters share a cache entry
+
+    Empty values are dropped, dates are normalized and lists are sorted.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        str: Hex digest
+    """
+    normalized = {}
+    for key, value in (filters or {}).items():
+        if value in (None, "", [], 0, "0"):
+            continue
+
+        if key.endswith("_date") or key == "date":
+            value = str(getdate(value))
+        elif isinstance(value, (list, tuple)):
+            value = sorted(str(v) for v in value)
+        else:
+            value = str(value)
+
+        normalized[key] = value
+
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+def get_dependency_versions(company, to_date):
+    """
+    Get the change counters a result for a company up to a date depends on
+
+    Args:
+        company (str): Company name
+        to_date (str): Last date of the result
+
+    Returns:
+        dict: Ledger and rate counters by month, for months up to to_date
+    """
+    to_month = get_month_key(to_date) if to_date else "9999-12"
+
+    pipeline = frappe.cache().pipeline()
+    pipeline.hgetall(frappe.cache().make_key(f"{LEDGER_VERSION_KEY}:{company}"))
+    pipeline.hgetall(frappe.cache().make_key(RATE_CHANGE_VERSION_KEY))
+    ledger, rates = pipeline.execute()
+
+    def up_to(counters):
+        return {
+            frappe.safe_decode(month): cint(frappe.safe_decode(version))
+            for month, version in (counters or {}).items()
+            if frappe.safe_decode(month) <= to_month
+        }
+
+    return {"ledger": up_to(ledger), "rates": up_to(rates)}
+
+def get_month_key(date):
+    """
+    Get the month a change counter is kept under
+
+    Args:
+        date (str): Date
+
+    Returns:
+        str: Month as YYYY-MM
+    """
+    return getdate(date).strftime("%Y-%m")
+
+def mark_ledger_changed(company, date):
+    """
+    Retire the cached results of a company covering a date, once the
+    current transaction commits
+
+    Args:
+        company (str): Company name
+        date (str): Posting date of the change
+    """
+    queue_change((f"{LEDGER_VERSION_KEY}:{company}", get_month_key(date)))
+
+def mark_rates_changed(date):
+    """
+    Retire the cached results of every company covering a date, once the
+    current transaction commits
+
+    Args:
+        date (str): Date of the changed exchange rate
+    """
+    queue_change((RATE_CHANGE_VERSION_KEY, get_month_key(date)))
+
+def queue_change(change):
+    """
+    Queue a counter bump for after commit, so one voucher or import bumps
+    each month once
+
+    Args:
+        change (tuple): (redis hash, month)
+    """
+    changes = getattr(frappe.local, "lebanese_report_changes", None)
+    if changes is None:
+        changes = frappe.local.lebanese_report_changes = set()
+
+    if not changes:
+        frappe.db.after_commit.add(flush_changes)
+        frappe.db.after_rollback.add(clear_changes)
+
+    changes.add(change)
+
+def clear_changes():
+    """
+    Drop the changes of a rolled back transaction, so the next change
+    registers the commit hook again
+    """
+    frappe.local.lebanese_report_changes = set()
+
+def flush_changes():
+    """
+    Bump the counters of every queued change
+    """
+    changes = getattr(frappe.local, "lebanese_report_changes", None)
+    frappe.local.lebanese_report_changes = set()
+
+    if not changes:
+        return
+
+    pipeline = frappe.cache().pipeline()
+    for key, month in changes:
+        pipeline.hincrby(frappe.cache().make_key(key), month, 1)
+    pipeline.execute()
+
+def on_gl_entry_insert(doc, method=None):
+    """
+    Retire the cached report results a new GL Entry affects
+
+    Reverse entries also retire the month of the voucher they cancel, whose
+    original entries are flagged as cancelled without document events.
+
+    Args:
+        doc: GL Entry document
+    """
+    mark_ledger_changed(doc.company, doc.posting_date)
+
+    if cint(doc.is_cancelled):
+        seen = getattr(frappe.local, "lebanese_cancelled_vouchers", None)
+        if seen is None:
+            seen = frappe.local.lebanese_cancelled_vouchers = set()
+
+        voucher = (doc.voucher_type, doc.voucher_no)
+        if voucher in seen:
+            return
+        seen.add(voucher)
+
+        for company, posting_date in frappe.db.sql("""
+            SELECT DISTINCT company, posting_date
+            FROM `tabGL Entry`
+            WHERE voucher_type = %s AND voucher_no = %s
+        """, voucher):
+            mark_ledger_changed(company, posting_date)
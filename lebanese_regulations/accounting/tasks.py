@@ -2,9 +2,18 @@
 # Copyright (c) 2023, Your Name and contributors
 # For license information, please see license.txt
 
+import numpy as np
+
 import frappe
 from frappe import _
 from frappe.utils import flt, getdate, nowdate, add_months, get_first_day, get_last_day
+from lebanese_regulations.accounting.bulk_posting import bulk_gl_posting
+from lebanese_regulations.accounting.rate_cache import (
+    DEFAULT_RATE_TYPE, RATE_TYPES, get_cached_rate, get_rate_type, invalidate_rate_timeline
+)
+from lebanese_regulations.accounting.rate_import import upsert_exchange_rate_rows
+from lebanese_regulations.accounting.rate_matrix import get_rate_matrix
+from lebanese_regulations.accounting.utils import get_currency_exchange_name
 
 def process_month_end_exchange_rates():
     """
@@ -26,101 +35,64 @@ def process_month_end_exchange_rates():
     if not currencies:
         return
     
-    # Process each currency
-    for currency in currencies:
-        # Get the latest exchange rate for the currency against LBP
-        latest_rate = get_latest_exchange_rate(currency, prev_month_end)
+    for rate_type in RATE_TYPES:
+        # Resolve every currency's month-end rate from one cross-rate matrix per rate type
+        month_end_rates = get_month_end_exchange_rates(currencies, prev_month_end, rate_type)
         
-        if not latest_rate:
-            frappe.log_error(f"No exchange rate found for {currency}/LBP for {prev_month_end}", 
-                            "Month End Exchange Rate Processing")
+        # Rate types nobody records are skipped quietly
+        if not month_end_rates and rate_type != DEFAULT_RATE_TYPE:
             continue
         
-        # Create a month-end exchange rate record
-        create_month_end_exchange_rate(currency, latest_rate, prev_month_end)
+        missing = [currency for currency in currencies if currency not in month_end_rates]
+        if missing:
+            frappe.log_error(f"No {rate_type} exchange rate found for {', '.join(missing)} against LBP for {prev_month_end}",
+                            "Month End Exchange Rate Processing")
+        
+        # Create or update all month-end exchange rate records of the rate type at once
+        upsert_month_end_exchange_rates(month_end_rates, prev_month_end, rate_type)
         
-        # Create revaluation entries for open foreign currency transactions
-        create_revaluation_entries(currency, latest_rate, prev_month_end)
+        for currency, latest_rate in month_end_rates.items():
+            # Create revaluation entries for open foreign currency transactions
+            create_revaluation_entries(currency, latest_rate, prev_month_end, rate_type)
     
-    frappe.msgprint(_("Month-end exchange rates processed for {0}").format(
-        prev_month_end.strftime("%B %Y")
-    ))
+    frappe.logger().info(f"Month-end exchange rates processed for {prev_month_end.strftime('%B %Y')}")
 
-def get_latest_exchange_rate(currency, date):
+def get_latest_exchange_rate(currency, date, rate_type=None):
     """
     Get the latest exchange rate for a currency against LBP
     
     Args:
         currency: Currency code
         date: Date to get the rate for
+        rate_type: Rate type, defaults to the official rate
         
     Returns:
-        float: Exchange rate
+        float: LBP per unit of currency, or None if no rate can be resolved
     """
-    # Try to get direct LBP to currency rate
-    exchange_rate = frappe.db.get_value(
-        "Currency Exchange",
-        {
-            "from_currency": "LBP",
-            "to_currency": currency,
-            "date": ["<=", date]
-        },
-        "exchange_rate",
-        order_by="date desc"
-    )
-    
-    if exchange_rate:
-        return flt(exchange_rate)
-    
-    # Try to get currency to LBP rate
-    exchange_rate = frappe.db.get_value(
-        "Currency Exchange",
-        {
-            "from_currency": currency,
-            "to_currency": "LBP",
-            "date": ["<=", date]
-        },
-        "exchange_rate",
-        order_by="date desc"
-    )
-    
-    if exchange_rate:
-        return flt(1.0 / exchange_rate)
-    
-    # If no direct rate, try to get via base currency (usually USD)
-    base_currency = frappe.get_cached_value("Company", {"country": "Lebanon"}, "default_currency") or "USD"
+    # Direct, inverse and base-currency-derived rates all come from the date's cross-rate matrix
+    return get_rate_matrix(date, rate_type=rate_type).get_rate(currency, "LBP")
+
+def get_month_end_exchange_rates(currencies, date, rate_type=None):
+    """
+    Get the month-end exchange rates of several currencies against LBP
     
-    if base_currency != "LBP" and base_currency != currency:
-        # Get rate from base currency to LBP
-        base_to_lbp = frappe.db.get_value(
-            "Currency Exchange",
-            {
-                "from_currency": base_currency,
-                "to_currency": "LBP",
-                "date": ["<=", date]
-            },
-            "exchange_rate",
-            order_by="date desc"
-        )
-        
-        # Get rate from base currency to target currency
-        base_to_currency = frappe.db.get_value(
-            "Currency Exchange",
-            {
-                "from_currency": base_currency,
-                "to_currency": currency,
-                "date": ["<=", date]
-            },
-            "exchange_rate",
-            order_by="date desc"
-        )
+    Args:
+        currencies: Currency codes
+        date: Month-end date
+        rate_type: Rate type, defaults to the official rate
         
-        if base_to_lbp and base_to_currency:
-            return flt(base_to_lbp / base_to_currency)
+    Returns:
+        dict: LBP per unit of currency, for the currencies with a rate
+    """
+    rates = get_rate_matrix(date, rate_type=rate_type).get_rates_to(currencies, "LBP")
     
-    return None
+    return {
+        currency: float(rate)
+        for currency, rate in zip(currencies, rates)
+        if not np.isnan(rate) and rate
+    }
 
-def create_month_end_exchange_rate(currency, rate, date):
+def create_month_end_exchange_rate(currency, rate, date, rate_type=None):
     """
     Create a month-end exchange rate record
     
@@ -128,42 +100,56 @@ def create_month_end_exchange_rate(currency, rate, date):
         currency: Currency code
         rate: Exchange rate
         date: Date for the exchange rate
+        rate_type: Rate type, defaults to the official rate
+    """
+    upsert_month_end_exchange_rates({currency: rate}, date, rate_type)
+
+def upsert_month_end_exchange_rates(rates, date, rate_type=None):
     """
-    # Check if a month-end rate already exists
-    existing = frappe.db.exists(
-        "Currency Exchange",
+    Create or update the month-end exchange rate records of several currencies
+    with one multi-row upsert
+    
+    Only currencies with a rate of their own against LBP get a record.
+    A triangulated rate stored as a direct X/LBP row would replace the
+    triangulation for every later date, which LBP Daily Rate does not.
+    
+    Args:
+        rates (dict): LBP per unit of currency, keyed by currency
+        date: Date for the exchange rates
+        rate_type: Rate type, defaults to the official rate
+    """
+    rate_type = get_rate_type(rate_type)
+    rates = {
+        currency: rate
+        for currency, rate in rates.items()
+        if get_cached_rate(currency, "LBP", date, rate_type)
+    }
+    
+    if not rates:
+        return
+    
+    upsert_exchange_rate_rows([
         {
+            "name": get_currency_exchange_name(date, currency, "LBP", rate_type=rate_type),
+            "date": date,
             "from_currency": currency,
             "to_currency": "LBP",
-            "date": date,
+            "exchange_rate": rate,
+            "rate_type": rate_type,
             "for_month_end": 1
         }
-    )
+        for currency, rate in rates.items()
+    ])
     
-    if existing:
-        # Update existing record
-        exchange = frappe.get_doc("Currency Exchange", existing)
-        if exchange.exchange_rate != rate:
-            exchange.exchange_rate = rate
-            exchange.save()
-            frappe.msgprint(_("Updated month-end exchange rate for {0}/LBP: {1}").format(
-                currency, frappe.format_value(rate, {"fieldtype": "Float", "precision": 4})
-            ))
-    else:
-        # Create new record
-        exchange = frappe.new_doc("Currency Exchange")
-        exchange.from_currency = currency
-        exchange.to_currency = "LBP"
-        exchange.exchange_rate = rate
-        exchange.date = date
-        exchange.for_month_end = 1
-        exchange.insert()
-        
-        frappe.msgprint(_("Created month-end exchange rate for {0}/LBP: {1}").format(
-            currency, frappe.format_value(rate, {"fieldtype": "Float", "precision": 4})
-        ))
+    # The upsert bypasses document hooks. Month-end rates of direct pairs equal the
+    # rates already in effect, so open documents and daily rates stay as they are;
+    # only the caches are retired.
+    for currency in rates:
+        invalidate_rate_timeline(currency, "LBP", rate_type)
+    
+    frappe.logger().info(f"Month-end {rate_type} exchange rates saved for {len(rates)} currencies")
 
-def create_revaluation_entries(currency, rate, date):
+def create_revaluation_entries(currency, rate, date, rate_type=None):
     """
     Create revaluation entries for open foreign currency transactions
     
@@ -171,13 +157,15 @@ def create_revaluation_entries(currency, rate, date):
         currency: Currency code
         rate: Exchange rate
         date: Date for the revaluation
+        rate_type: Rate type the rate belongs to, defaults to the official rate
     """
-    # Get all companies with LBP as default currency
-    companies = frappe.get_all(
-        "Company",
-        filters={"default_currency": "LBP"},
-        pluck="name"
-    )
+    # Get all companies with LBP as default currency posting with this rate type
+    companies = frappe.db.sql_list("""
+        SELECT name
+        FROM `tabCompany`
+        WHERE default_currency = 'LBP'
+          AND IFNULL(NULLIF(lbp_rate_type, ''), %s) = %s
+    """, (DEFAULT_RATE_TYPE, get_rate_type(rate_type)))
     
     if not companies:
         return
@@ -187,25 +175,13 @@ def create_revaluation_entries(currency, rate, date):
         exchange_gain_loss_account = frappe.get_cached_value("Company", company, "exchange_gain_loss_account")
         
         if not exchange_gain_loss_account:
-            frappe.msgprint(_("Exchange Gain/Loss Account not set for company {0}. Skipping revaluation.").format(company),
-                           alert=True, indicator="orange")
+            frappe.logger().warning(f"Exchange Gain/Loss Account not set for company {company}. Skipping revaluation.")
             continue
         
-        # Get all open GL entries in the foreign currency
-        gl_entries = frappe.db.sql("""
-            SELECT 
-                name, account, party_type, party, 
-                account_currency, debit, credit,
-                debit_in_account_currency, credit_in_account_currency,
-                exchange_rate
-            FROM `tabGL Entry`
-            WHERE company = %s
-              AND account_currency = %s
-              AND is_cancelled = 0
-              AND posting_date <= %s
-        """, (company, currency, date), as_dict=1)
+        # Stream the open balances of the currency, netted per account and party
+        lines, total_gain_loss = get_revaluation_lines(company, currency, rate, date)
         
-        if not gl_entries:
+        if not lines:
             continue
         
         # Create revaluation entry
@@ -217,47 +193,8 @@ def create_revaluation_entries(currency, rate, date):
         )
         je.multi_currency = 1
         
-        # Process each GL entry
-        total_gain_loss = 0
-        
-        for entry in gl_entries:
-            # Calculate the new LBP amount based on the month-end rate
-            if entry.debit_in_account_currency > 0:
-                original_amount = entry.debit
-                foreign_amount = entry.debit_in_account_currency
-                new_amount = flt(foreign_amount * rate)
-                gain_loss = new_amount - original_amount
-            else:
-                original_amount = entry.credit
-                foreign_amount = entry.credit_in_account_currency
-                new_amount = flt(foreign_amount * rate)
-                gain_loss = original_amount - new_amount
-            
-            if abs(gain_loss) < 0.01:
-                continue
-            
-            total_gain_loss += gain_loss
-            
-            # Add account to journal entry
-            account_dict = {
-                "account": entry.account,
-                "party_type": entry.party_type,
-                "party": entry.party,
-                "account_currency": entry.account_currency,
-                "exchange_rate": rate,
-                "reference_type": "GL Entry",
-                "reference_name": entry.name
-            }
-            
-            # Set debit or credit based on gain/loss
-            if gain_loss > 0:
-                account_dict["debit_in_account_currency"] = abs(foreign_amount)
-                account_dict["debit"] = abs(gain_loss)
-            else:
-                account_dict["credit_in_account_currency"] = abs(foreign_amount)
-                account_dict["credit"] = abs(gain_loss)
-                
-            je.append("accounts", account_dict)
+        for line in lines:
+            je.append("accounts", line)
         
         # Add exchange gain/loss account to balance the entry
         if abs(total_gain_loss) >= 0.01:
@@ -277,8 +214,81 @@ def create_revaluation_entries(currency, rate, date):
             je.append("accounts", balance_dict)
             
             je.insert()
-            je.submit()
+            with bulk_gl_posting():
+                je.submit()
+            
+            frappe.logger().info(f"Created revaluation entry {je.name} for {currency}/{company}")
+
+def get_revaluation_lines(company, currency, rate, date):
+    """
+    Build the journal lines revaluing a company's open balances in a currency
+    
+    Balances are netted per account and party in SQL and streamed from a
+    server-side cursor, so memory and the entry size follow the number of
+    open balances rather than the transaction history. Each balance is
+    taken out at its book rate and put back at the month-end rate, which
+    leaves the foreign amount unchanged and moves the LBP value by the gain
+    or loss.
+    
+    Args:
+        company: Company name
+        currency: Currency code
+        rate: Month-end LBP per unit of currency
+        date: Date for the revaluation
+        
+    Returns:
+        tuple: (journal line dicts, total gain or loss in LBP)
+    """
+    lines = []
+    total_gain_loss = 0
+    
+    # No other query may run on the connection while the cursor is open
+    with frappe.db.unbuffered_cursor():
+        balances = frappe.db.sql("""
+            SELECT account, party_type, party, account_currency,
+                SUM(debit_in_account_currency) - SUM(credit_in_account_currency) AS balance,
+                SUM(debit) - SUM(credit) AS book_balance
+            FROM `tabGL Entry`
+            WHERE company = %s
+              AND account_currency = %s
+              AND is_cancelled = 0
+              AND posting_date <= %s
+            GROUP BY account, party_type, party, account_currency
+            HAVING balance != 0
+        """, (company, currency, date), as_dict=1, as_iterator=True)
+        
+        for entry in balances:
+            balance = flt(entry.balance)
+            book_balance = flt(entry.book_balance)
+            gain_loss = flt(balance * rate) - book_balance
+            
+            if abs(gain_loss) < 0.01:
+                continue
             
-            frappe.msgprint(_("Created revaluation entry {0} for {1}/{2}").format(
-                je.name, currency, company
-            ))
\ No newline at end of file
+            total_gain_loss += gain_loss
+            
+            # Debit balances are revalued on the debit side, credit balances on the credit side
+            new_side, book_side = ("debit", "credit") if balance > 0 else ("credit", "debit")
+            
+            account_dict = {
+                "account": entry.account,
+                "party_type": entry.party_type,
+                "party": entry.party,
+                "account_currency": entry.account_currency
+            }
+            
+            # The balance at the month-end rate
+            lines.append(dict(account_dict, **{
+                "exchange_rate": rate,
+                f"{new_side}_in_account_currency": abs(balance),
+                new_side: abs(flt(balance * rate))
+            }))
+            
+            # The balance at its book rate
+            lines.append(dict(account_dict, **{
+                "exchange_rate": abs(book_balance / balance),
+                f"{book_side}_in_account_currency": abs(balance),
+                book_side: abs(book_balance)
+            }))
+    
+    return lines, total_gain_loss
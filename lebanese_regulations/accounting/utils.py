@@ -4,7 +4,20 @@
 
 import frappe
 from frappe import _
-from frappe.utils import flt, get_datetime
+from frappe.utils import cint, flt, get_datetime, getdate
+from lebanese_regulations.accounting.balance_snapshots import (
+    get_ledger_balances, get_snapshot_balances, has_balance_snapshots
+)
+from lebanese_regulations.accounting.bulk_posting import defer_gl_entry, is_bulk_gl_posting
+from lebanese_regulations.accounting.gl_expressions import get_match_condition
+from lebanese_regulations.accounting.rate_cache import (
+    DEFAULT_RATE_TYPE, get_cached_rate, get_company_rate_type, get_rate_type,
+    get_triangulated_rate, peek_cached_rate
+)
+from lebanese_regulations.accounting.rate_metrics import record_event, record_fallback, timed_lookup
+
+# Number of rate requests resolved per SQL statement
+EXCHANGE_RATE_BATCH_SIZE = 500
 
 def add_currency_info(doc, method=None):
     """
@@ -13,94 +26,338 @@ def add_currency_info(doc, method=None):
     if not doc.account_currency or doc.account_currency == "LBP":
         return
     
+    # Bulk posters enrich the whole voucher in one statement instead
+    if is_bulk_gl_posting():
+        defer_gl_entry(doc)
+        return
+    
     # Set foreign currency to account currency
     doc.foreign_currency = doc.account_currency
     doc.foreign_currency_amount = doc.debit_in_account_currency if doc.debit_in_account_currency > 0 else doc.credit_in_account_currency
     
-    # Get exchange rate
+    # Get exchange rate of the rate type the company posts with
+    doc.lbp_rate_type = get_company_rate_type(doc.company)
     if not doc.exchange_rate:
-        doc.exchange_rate = get_exchange_rate(doc.account_currency, "LBP", doc.posting_date)
+        doc.exchange_rate = get_exchange_rate(doc.account_currency, "LBP", doc.posting_date, doc.lbp_rate_type)
     
     # Calculate LBP amount
     doc.lbp_amount = flt(doc.foreign_currency_amount) * flt(doc.exchange_rate)
 
-def get_exchange_rate(from_currency, to_currency, date):
+def get_exchange_rate(from_currency, to_currency, date, rate_type=None):
     """
     Get exchange rate between two currencies
     """
+    with timed_lookup("get_exchange_rate"):
+        exchange_rate = resolve_exchange_rate(from_currency, to_currency, date, rate_type)
+    
+    if not exchange_rate:
+        record_fallback(from_currency, to_currency, rate_type)
+    
+    return exchange_rate or 1.0
+
+def resolve_exchange_rate(from_currency, to_currency, date, rate_type=None):
+    """
+    Resolve the exchange rate between two currencies
+    
+    Args:
+        from_currency (str): From currency
+        to_currency (str): To currency
+        date (str): Date for exchange rate
+        rate_type (str): Rate type, defaults to the official rate
+        
+    Returns:
+        float: Exchange rate, or None if no rate can be resolved
+    """
     if from_currency == to_currency:
         return 1.0
     
-    # Get exchange rate from Currency Exchange
-    exchange_rate = frappe.db.get_value("Currency Exchange",
-        {
-            "from_currency": from_currency,
-            "to_currency": to_currency,
-            "date": ("<=", date)
-        },
-        "exchange_rate",
-        order_by="date desc"
-    )
+    # Resolve from the cached rate timelines (direct pair, then reverse pair)
+    exchange_rate = get_cached_rate(from_currency, to_currency, date, rate_type)
     
     if not exchange_rate:
-        # Try reverse lookup
-        exchange_rate = frappe.db.get_value("Currency Exchange",
-            {
-                "from_currency": to_currency,
-                "to_currency": from_currency,
-                "date": ("<=", date)
-            },
-            "exchange_rate",
-            order_by="date desc"
-        )
-        
-        if exchange_rate:
-            exchange_rate = 1.0 / flt(exchange_rate)
+        # Triangulate through the base currency
+        exchange_rate = get_triangulated_rate(from_currency, to_currency, date, rate_type)
     
-    return exchange_rate or 1.0
+    return exchange_rate or None
+
+def get_exchange_rates(requests, rate_type=None, fallback=1.0):
+    """
+    Get exchange rates for many currency pairs and dates at once
+    
+    Args:
+        requests (iterable): (from_currency, to_currency, date) tuples
+        rate_type (str): Rate type of every request, defaults to the official rate
+        fallback (float): Rate of requests without any rate, None to leave them unresolved
+        
+    Returns:
+        dict: Exchange rate keyed by (from_currency, to_currency, date), dates normalized with getdate
+    """
+    with timed_lookup("get_exchange_rates"):
+        return resolve_exchange_rates(requests, rate_type, fallback)
+
+def resolve_exchange_rates(requests, rate_type=None, fallback=1.0):
+    """
+    Resolve exchange rates for many currency pairs and dates at once
+    
+    Args:
+        requests (iterable): (from_currency, to_currency, date) tuples
+        rate_type (str): Rate type of every request
+        fallback (float): Rate of requests without any rate, None to leave them unresolved
+        
+    Returns:
+        dict: Exchange rate keyed by (from_currency, to_currency, date)
+    """
+    rate_type = get_rate_type(rate_type)
+    rates = {}
+    pending = []
+    
+    # Dedupe the requests and answer same-currency pairs directly
+    for from_currency, to_currency, date in requests:
+        key = (from_currency, to_currency, getdate(date))
+        if key in rates:
+            continue
+        
+        if from_currency == to_currency:
+            rates[key] = 1.0
+            continue
+        
+        # Answer from the shared rate cache when the pair's buckets are warm
+        resolved, exchange_rate = peek_cached_rate(*key, rate_type)
+        if resolved:
+            record_event("batch_cache_answered")
+            exchange_rate = exchange_rate or get_triangulated_rate(*key, rate_type)
+            if not exchange_rate and fallback is not None:
+                record_fallback(key[0], key[1], rate_type)
+            rates[key] = exchange_rate or fallback
+        else:
+            rates[key] = None
+            pending.append(key)
+    
+    record_event("batch_requests", len(rates))
+    record_event("batch_db_resolved", len(pending))
+    
+    for i in range(0, len(pending), EXCHANGE_RATE_BATCH_SIZE):
+        batch = pending[i:i + EXCHANGE_RATE_BATCH_SIZE]
+        
+        # LBP pairs are answered by an equality join on the daily rate table
+        daily_rates = query_daily_rates(batch, rate_type)
+        rates.update(daily_rates)
+        
+        batch = [key for key in batch if key not in daily_rates]
+        if batch:
+            rates.update(query_exchange_rates(batch, rate_type, fallback))
+    
+    return rates
+
+def query_daily_rates(keys, rate_type=None):
+    """
+    Resolve the LBP pairs of a batch of rate requests with an equality join
+    on LBP Daily Rate
+    
+    Args:
+        keys (list): Distinct (from_currency, to_currency, date) tuples
+        rate_type (str): Rate type
+        
+    Returns:
+        dict: Exchange rate keyed by request, for the requests found
+    """
+    lbp_keys = [key for key in keys if "LBP" in key[:2]]
+    if not lbp_keys:
+        return {}
+    
+    # Build the requested currencies and dates as a derived table
+    request_rows = []
+    values = []
+    for idx, (from_currency, to_currency, date) in enumerate(lbp_keys):
+        request_rows.append("SELECT %s AS idx, %s AS currency, CAST(%s AS DATE) AS date")
+        values.extend([idx, to_currency if from_currency == "LBP" else from_currency, date])
+    values.append(get_rate_type(rate_type))
+    
+    result = frappe.db.sql("""
+        SELECT req.idx, daily.exchange_rate
+        FROM ({requests}) req
+        JOIN `tabLBP Daily Rate` daily
+            ON daily.currency = req.currency AND daily.date = req.date
+            AND daily.rate_type = %s
+    """.format(requests=" UNION ALL ".join(request_rows)), values, as_dict=1)
+    
+    rates = {}
+    for row in result:
+        if not flt(row.exchange_rate):
+            continue
+        
+        key = lbp_keys[int(row.idx)]
+        rates[key] = 1.0 / flt(row.exchange_rate) if key[0] == "LBP" else flt(row.exchange_rate)
+    
+    return rates
+
+def query_exchange_rates(keys, rate_type=None, fallback=1.0):
+    """
+    Resolve a batch of rate requests with one set-based query
+    
+    Args:
+        keys (list): Distinct (from_currency, to_currency, date) tuples
+        rate_type (str): Rate type
+        fallback (float): Rate of requests without any rate, None to leave them unresolved
+        
+    Returns:
+        dict: Exchange rate keyed by request, the fallback where no rate is found
+    """
+    # Build the requested triples as a derived table
+    rate_type = get_rate_type(rate_type)
+    request_rows = []
+    values = [rate_type, rate_type]
+    for idx, (from_currency, to_currency, date) in enumerate(keys):
+        request_rows.append("SELECT %s AS idx, %s AS from_currency, %s AS to_currency, CAST(%s AS DATE) AS date")
+        values.extend([idx, from_currency, to_currency, date])
+    
+    # Latest direct rate and latest reverse rate on or before each requested date
+    result = frappe.db.sql("""
+        SELECT req.idx,
+            (SELECT ce.exchange_rate
+             FROM `tabCurrency Exchange` ce
+             WHERE ce.from_currency = req.from_currency
+               AND ce.to_currency = req.to_currency
+               AND ce.rate_type = %s
+               AND ce.date <= req.date
+             ORDER BY ce.date DESC, ce.creation DESC
+             LIMIT 1) AS direct_rate,
+            (SELECT ce.exchange_rate
+             FROM `tabCurrency Exchange` ce
+             WHERE ce.from_currency = req.to_currency
+               AND ce.to_currency = req.from_currency
+               AND ce.rate_type = %s
+               AND ce.date <= req.date
+             ORDER BY ce.date DESC, ce.creation DESC
+             LIMIT 1) AS reverse_rate
+        FROM ({requests}) req
+    """.format(requests=" UNION ALL ".join(request_rows)), values, as_dict=1)
+    
+    rates = {}
+    for row in result:
+        exchange_rate = flt(row.direct_rate)
+        
+        if not exchange_rate and flt(row.reverse_rate):
+            # Fall back to the reverse pair
+            exchange_rate = 1.0 / flt(row.reverse_rate)
+        
+        key = keys[int(row.idx)]
+        if not exchange_rate:
+            # Triangulate through the base currency
+            exchange_rate = get_triangulated_rate(*key, rate_type)
+        
+        if not exchange_rate and fallback is not None:
+            record_fallback(key[0], key[1], rate_type)
+        
+        rates[key] = exchange_rate or fallback
+    
+    return rates
+
+def get_currency_exchange_name(date, from_currency, to_currency, for_buying=1, for_selling=1, rate_type=None):
+    """
+    Get the name ERPNext gives a Currency Exchange record, suffixed with the
+    rate type for rates other than the official one
+    
+    Args:
+        date (str): Date of the exchange rate
+        from_currency (str): From currency
+        to_currency (str): To currency
+        for_buying (int): Whether the rate is used for buying
+        for_selling (int): Whether the rate is used for selling
+        rate_type (str): Rate type
+        
+    Returns:
+        str: Currency Exchange name
+    """
+    purpose = "Selling-Buying"
+    if not cint(for_buying) and cint(for_selling):
+        purpose = "Selling"
+    elif cint(for_buying) and not cint(for_selling):
+        purpose = "Buying"
+    
+    name = "{0}-{1}-{2}-{3}".format(getdate(date).isoformat(), from_currency, to_currency, purpose)
+    
+    if get_rate_type(rate_type) != DEFAULT_RATE_TYPE:
+        name += "-" + rate_type
+    
+    return name
 
 def get_account_balance_in_lbp(account, company, posting_date=None):
     """
     Get account balance in LBP
+    
+    LBP accounts return their own balance.
     """
-    filters = {
-        "account": account,
-        "company": company
-    }
-    
-    if posting_date:
-        filters["posting_date"] = ("<=", posting_date)
-    
-    # Get balance in account currency
-    balance = frappe.db.sql("""
-        SELECT sum(debit_in_account_currency) - sum(credit_in_account_currency) as balance,
-               account_currency
-        FROM `tabGL Entry`
-        WHERE account = %(account)s AND company = %(company)s
-        {date_condition}
-        GROUP BY account_currency
-    """.format(
-        date_condition = "AND posting_date <= %(posting_date)s" if posting_date else ""
-    ), filters, as_dict=1)
-    
-    if not balance:
-        return 0
+    return get_account_balances_in_lbp(company, [account], posting_date)[account].balance_lbp
+
+@frappe.whitelist()
+def get_lbp_balances(company, accounts=None, as_of=None):
+    """
+    Get the balances of many accounts in one call, for dashboards and the
+    account tree
+    
+    Args:
+        company (str): Company name
+        accounts (str): JSON list of account names, every account with entries if not given
+        as_of (str): Last posting date included, all dates if not given
+        
+    Returns:
+        dict: Balances from get_account_balances_in_lbp
+    """
+    frappe.has_permission("GL Entry", throw=True)
+    
+    if isinstance(accounts, str):
+        accounts = frappe.parse_json(accounts)
+    
+    # Snapshots hold whole accounts, so users limited by permissions get
+    # balances of the entries they may see
+    return get_account_balances_in_lbp(company, accounts, as_of, get_match_condition() or None)
+
+def get_account_balances_in_lbp(company, accounts=None, as_of=None, condition=None):
+    """
+    Get the balances of many accounts in account currency and in LBP at once
+    
+    Read from the monthly balance snapshots plus at most one month of GL
+    Entries, or from one grouped GL Entry query while the company's
+    snapshots are not built.
+    
+    Args:
+        company (str): Company name
+        accounts (list): Account names, every account with entries if not given
+        as_of (str): Last posting date included, all dates if not given
+        condition (str): Extra SQL condition on the gle alias, read from GL Entry
+        
+    Returns:
+        dict: account_currency, balance (in account currency) and balance_lbp
+            by account, zero for requested accounts without entries
+    """
+    # Cumulative totals of every account in one round trip
+    if condition:
+        totals = get_ledger_balances(company, as_of, accounts, condition)
+    elif has_balance_snapshots(company):
+        totals = get_snapshot_balances(company, as_of, accounts)
+    else:
+        totals = get_ledger_balances(company, as_of, accounts)
     
-    # If account currency is LBP, return balance directly
-    if balance[0].account_currency == "LBP":
-        return balance[0].balance
-    
-    # Get balance in LBP
-    lbp_balance = frappe.db.sql("""
-        SELECT sum(lbp_amount) as lbp_balance
-        FROM `tabGL Entry`
-        WHERE account = %(account)s AND company = %(company)s
-        {date_condition}
-    """.format(
-        date_condition = "AND posting_date <= %(posting_date)s" if posting_date else ""
-    ), filters, as_dict=1)
-    
-    return lbp_balance[0].lbp_balance if lbp_balance and lbp_balance[0].lbp_balance else 0
+    # Requested accounts without entries still get a zero balance
+    for account in set(accounts or []) - set(totals):
+        totals[account] = frappe._dict(
+            account_currency=frappe.get_cached_value("Account", account, "account_currency"))
+    
+    balances = {}
+    for account, total in totals.items():
+        balance = flt(total.get("debit_in_account_currency")) - flt(total.get("credit_in_account_currency"))
+        
+        # LBP accounts are their own LBP balance
+        if total.account_currency == "LBP":
+            balance_lbp = balance
+        else:
+            balance_lbp = flt(total.get("debit_lbp")) - flt(total.get("credit_lbp"))
+        
+        balances[account] = frappe._dict(
+            account_currency=total.account_currency, balance=balance, balance_lbp=balance_lbp)
+    
+    return balances
 
 def get_exchange_gain_loss(account, company, from_date, to_date):
     """
@@ -117,11 +374,14 @@ def get_exchange_gain_loss(account, company, from_date, to_date):
     # Get balance in account currency at from_date
     opening_balance = get_account_balance(account, company, from_date)
     
+    # Value both dates with the rate type the company posts with
+    rate_type = get_company_rate_type(company)
+    
     # Get exchange rate at from_date
-    opening_exchange_rate = get_exchange_rate(account_currency, "LBP", from_date)
+    opening_exchange_rate = get_exchange_rate(account_currency, "LBP", from_date, rate_type)
     
     # Get exchange rate at to_date
-    closing_exchange_rate = get_exchange_rate(account_currency, "LBP", to_date)
+    closing_exchange_rate = get_exchange_rate(account_currency, "LBP", to_date, rate_type)
     
     # Calculate exchange gain/loss
     exchange_gain_loss = opening_balance * (closing_exchange_rate - opening_exchange_rate)
@@ -132,22 +392,4 @@ def get_account_balance(account, company, date=None):
     """
     Get account balance in account currency
     """
-    filters = {
-        "account": account,
-        "company": company
-    }
-    
-    if date:
-        filters["posting_date"] = ("<=", date)
-    
-    # Get balance in account currency
-    balance = frappe.db.sql("""
-        SELECT sum(debit_in_account_currency) - sum(credit_in_account_currency) as balance
-        FROM `tabGL Entry`
-        WHERE account = %(account)s AND company = %(company)s
-        {date_condition}
-    """.format(
-        date_condition = "AND posting_date <= %(posting_date)s" if date else ""
-    ), filters, as_dict=1)
-    
-    return balance[0].balance if balance and balance[0].balance else 0
\ No newline at end of file
+    return get_account_balances_in_lbp(company, [account], date)[account].balance
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import click
+from frappe.commands import get_site, pass_context
+
+@click.command("lebanese-explain-hot-queries")
+@pass_context
+def explain_hot_queries(context):
+    """
+    Print the EXPLAIN plans of the Lebanese Regulations hot queries
+    """
+    import frappe
+    from lebanese_regulations.setup.indexes import explain_hot_queries, verify_indexes
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        missing = verify_indexes()
+        if missing:
+            click.secho("Missing indexes: {0}".format(", ".join(missing)), fg="red")
+        
+        for label, plan in explain_hot_queries():
+            click.secho(label, bold=True)
+            for row in plan:
+                click.echo("  table={0} type={1} key={2} rows={3} extra={4}".format(
+                    row.get("table"), row.get("type"), row.get("key"), row.get("rows"), row.get("Extra")
+                ))
+    finally:
+        frappe.destroy()
+
+@click.command("lebanese-backfill-gl-currency-info")
+@click.option("--chunk-size", default=5000, help="GL Entries per chunk")
+@click.option("--sleep", default=0.5, help="Seconds to pause between chunks")
+@click.option("--max-chunks", default=0, help="Stop after this many chunks")
+@click.option("--restart", is_flag=True, default=False, help="Ignore the checkpoint and start over")
+@pass_context
+def backfill_gl_currency_info(context, chunk_size, sleep, max_chunks, restart):
+    """
+    Backfill LBP amounts and exchange rates on historical GL Entries
+    """
+    import frappe
+    from lebanese_regulations.accounting.backfill import backfill_gl_currency_info
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        updated = backfill_gl_currency_info(chunk_size=chunk_size, sleep=sleep,
+            max_chunks=max_chunks or None, restart=restart)
+        click.echo("Updated {0} GL Entries".format(updated))
+    finally:
+        frappe.destroy()
+
+@click.command("lebanese-import-exchange-rates")
+@click.argument("file_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--rate-type", default=None, help="Rate type of rows that do not set one")
+@click.option("--no-propagate", is_flag=True, default=False, help="Leave open documents untouched")
+@pass_context
+def import_exchange_rates(context, file_path, rate_type, no_propagate):
+    """
+    Bulk import Currency Exchange rates from a CSV or JSON file
+    """
+    import frappe
+    from lebanese_regulations.accounting.rate_import import import_exchange_rates
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        result = import_exchange_rates(file_path=file_path, rate_type=rate_type, propagate=not no_propagate)
+        frappe.db.commit()
+        click.echo("Imported {0} exchange rates for {1} currency pairs, updated open documents for {2}".format(
+            result["imported"], result["pairs"], result["propagated"]
+        ))
+    finally:
+        frappe.destroy()
+
+@click.command("lebanese-rate-metrics")
+@click.option("--top", default=20, help="Number of missing and fallback pairs to list")
+@click.option("--reset", is_flag=True, default=False, help="Clear the metrics after printing them")
+@pass_context
+def rate_metrics(context, top, reset):
+    """
+    Print exchange rate lookup hit/miss counters and latency histograms
+    """
+    import frappe
+    from lebanese_regulations.accounting.rate_metrics import print_rate_metrics, reset_rate_metrics
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        print_rate_metrics(top)
+        if reset:
+            reset_rate_metrics()
+    finally:
+        frappe.destroy()
+
+@click.command("lebanese-rebuild-balance-snapshots")
+@click.option("--company", default=None, help="Company to rebuild, all companies if not given")
+@pass_context
+def rebuild_balance_snapshots(context, company):
+    """
+    Rebuild the monthly account balance snapshots from GL Entry
+    """
+    import frappe
+    from lebanese_regulations.accounting.balance_snapshots import rebuild_account_balance_snapshots
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        rebuild_account_balance_snapshots(company)
+        click.echo("Rebuilt account balance snapshots")
+    finally:
+        frappe.destroy()
+
+@click.command("lebanese-export-gl-snapshot")
+@click.option("--full", is_flag=True, default=False, help="Rewrite every month instead of the changed ones")
+@pass_context
+def export_gl_snapshot(context, full):
+    """
+    Bring the GL Entry Parquet snapshot up to date
+    """
+    import frappe
+    from lebanese_regulations.accounting.gl_parquet import export_gl_snapshot
+    
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    
+    try:
+        months = export_gl_snapshot(full=full)
+        click.echo(f"Exported {months} months to the GL Parquet snapshot")
+    finally:
+        frappe.destroy()
+
+commands = [
+    explain_hot_queries,
+    backfill_gl_currency_info,
+    import_exchange_rates,
+    rate_metrics,
+    rebuild_balance_snapshots,
+    export_gl_snapshot
+]
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class AccountBalanceSnapshot(Document):
+    pass
+
+def on_doctype_update():
+    """
+    Enforce one snapshot per company, account and month
+    """
+    frappe.db.add_unique("Account Balance Snapshot", ["company", "account", "month"],
+        constraint_name="unique_company_account_month")
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class LBPDailyRate(Document):
+    pass
+
+def on_doctype_update():
+    """
+    Enforce one rate per currency, rate type and calendar date
+    """
+    frappe.db.add_unique("LBP Daily Rate", ["currency", "rate_type", "date"], constraint_name="unique_currency_rate_type_date")
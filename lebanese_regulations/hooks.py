@@ -81,6 +81,7 @@ website_generators = ["Lebanese Audit Checklist"]
 
 before_install = "lebanese_regulations.install.before_install"
 after_install = "lebanese_regulations.install.after_install"
+after_migrate = ["lebanese_regulations.setup.indexes.after_migrate"]
 
 # Desk Notifications
 # ------------------
@@ -106,7 +107,8 @@ has_permission = {
 
 override_doctype_class = {
     "Salary Slip": "lebanese_regulations.overrides.salary_slip.LebaneseRegulationsSalarySlip",
-    "Payroll Entry": "lebanese_regulations.overrides.payroll_entry.LebaneseRegulationsPayrollEntry"
+    "Payroll Entry": "lebanese_regulations.overrides.payroll_entry.LebaneseRegulationsPayrollEntry",
+    "Currency Exchange": "lebanese_regulations.overrides.currency_exchange.LebaneseRegulationsCurrencyExchange"
 }
 
 # Document Events
@@ -123,15 +125,26 @@ doc_events = {
         "validate": "lebanese_regulations.payroll.utils.validate_employee",
     },
     "Company": {
-        "after_insert": "lebanese_regulations.setup.setup_company_defaults",
-        "on_update": "lebanese_regulations.setup.events.on_company_update",
+        "after_insert": [
+            "lebanese_regulations.setup.setup_company_defaults",
+            "lebanese_regulations.accounting.balance_snapshots.on_company_insert",
+        ],
+        "on_update": [
+            "lebanese_regulations.setup.events.on_company_update",
+            "lebanese_regulations.accounting.balance_snapshots.on_company_update",
+        ],
     },
     "GL Entry": {
         "validate": "lebanese_regulations.accounting.utils.add_currency_info",
+        "after_insert": [
+            "lebanese_regulations.accounting.report_cache.on_gl_entry_insert",
+            "lebanese_regulations.accounting.balance_snapshots.on_gl_entry_insert",
+        ],
     },
     "Currency Exchange": {
         "after_insert": "lebanese_regulations.accounting.events.on_currency_exchange_update",
         "on_update": "lebanese_regulations.accounting.events.on_currency_exchange_update",
+        "after_delete": "lebanese_regulations.accounting.events.on_currency_exchange_delete",
     },
 }
 
@@ -141,6 +154,7 @@ doc_events = {
 scheduler_events = {
     "daily": [
         "lebanese_regulations.compliance.utils.send_nssf_deadline_reminders",
+        "lebanese_regulations.accounting.daily_rates.extend_daily_rates",
     ],
     "monthly": [
         "lebanese_regulations.payroll.utils.update_monthly_indemnity_accrual",
@@ -150,6 +164,10 @@ scheduler_events = {
         "0 0 1 * *": [
             "lebanese_regulations.accounting.tasks.process_month_end_exchange_rates"
         ],
+        # Run every night at 01:30
+        "30 1 * * *": [
+            "lebanese_regulations.accounting.gl_parquet.run_nightly_gl_snapshot"
+        ],
         # Run on the 15th of every month at 09:00
         "0 9 15 * *": [
             "lebanese_regulations.payroll.tasks.send_nssf_submission_reminder"
@@ -167,7 +185,8 @@ before_tests = "lebanese_regulations.install.before_tests"
 #
 override_whitelisted_methods = {
     "erpnext.accounts.report.general_ledger.general_ledger.get_result": "lebanese_regulations.report.lebanese_general_ledger.lebanese_general_ledger.get_result",
-    "erpnext.payroll.doctype.salary_slip.salary_slip.make_salary_slip": "lebanese_regulations.payroll.overrides.make_salary_slip"
+    "erpnext.payroll.doctype.salary_slip.salary_slip.make_salary_slip": "lebanese_regulations.payroll.overrides.make_salary_slip",
+    "erpnext.setup.utils.get_exchange_rate": "lebanese_regulations.accounting.overrides.get_exchange_rate"
 }
 
 # each overriding function accepts a `data` argument;
@@ -230,6 +249,7 @@ fixtures = [
                     "Company-nssf_employee_rate",
                     "Company-indemnity_accrual_account",
                     "Company-nssf_payable_account",
+                    "Company-lbp_rate_type",
                     
                     # Employee fields
                     "Employee-nssf_number",
@@ -249,6 +269,11 @@ fixtures = [
                     
                     # Report fields
                     "GL Entry-lbp_amount",
+                    "GL Entry-lbp_rate_type",
+                    
+                    # Currency Exchange fields
+                    "Currency Exchange-rate_type",
+                    "Currency Exchange-for_month_end",
                 ),
             ],
         ],
@@ -38,6 +38,15 @@ def after_install():
     # Create notification for NSSF deadlines
     create_notifications()
     
+    # Create the hot query indexes, as patches are only marked done on install
+    create_indexes()
+    
+    # Forward-fill LBP daily rates from the existing exchange rates
+    build_daily_rates()
+    
+    # Build the account balance snapshots, as patches are only marked done on install
+    build_balance_snapshots()
+    
     frappe.msgprint(_("Lebanese Regulations module has been installed successfully."))
 
 def create_custom_fields():
@@ -186,4 +195,28 @@ Please ensure all payroll entries are processed and NSSF contributions are calcu
 
 Regards,
 ERPNext"""
-        notification.insert()
\ No newline at end of file
+        notification.insert()
+
+def create_indexes():
+    """
+    Create the hot query indexes once the custom fields they cover exist
+    """
+    from lebanese_regulations.setup.indexes import ensure_indexes
+    
+    ensure_indexes()
+
+def build_daily_rates():
+    """
+    Build the LBP Daily Rate table from the existing Currency Exchange rows
+    """
+    from lebanese_regulations.accounting.daily_rates import rebuild_daily_rates
+    
+    rebuild_daily_rates()
+
+def build_balance_snapshots():
+    """
+    Build the account balance snapshots of every company from the existing GL Entries
+    """
+    from lebanese_regulations.accounting.balance_snapshots import rebuild_account_balance_snapshots
+    
+    rebuild_account_balance_snapshots()
\ No newline at end of file
@@ -3,4 +3,5 @@
 # For license information, please see license.txt
 
 from .salary_slip import LebaneseRegulationsSalarySlip
-from .payroll_entry import LebaneseRegulationsPayrollEntry
\ No newline at end of file
+from .payroll_entry import LebaneseRegulationsPayrollEntry
+from .currency_exchange import LebaneseRegulationsCurrencyExchange
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from erpnext.setup.doctype.currency_exchange.currency_exchange import CurrencyExchange
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE, RATE_TYPES, get_rate_type
+
+class LebaneseRegulationsCurrencyExchange(CurrencyExchange):
+    """
+    Customized Currency Exchange keeping one rate per rate type
+    """
+
+    def autoname(self):
+        """
+        Suffix the standard name with the rate type, so Official, Sayrafa
+        and Market rates of the same pair and date can coexist
+        """
+        super(LebaneseRegulationsCurrencyExchange, self).autoname()
+
+        self.rate_type = get_rate_type(self.get("rate_type"))
+        if self.rate_type != DEFAULT_RATE_TYPE:
+            self.name += "-" + self.rate_type
+
+    def validate(self):
+        """
+        Validate currency exchange
+        """
+        super(LebaneseRegulationsCurrencyExchange, self).validate()
+
+        self.rate_type = get_rate_type(self.get("rate_type"))
+        if self.rate_type not in RATE_TYPES:
+            frappe.throw(_("Rate Type must be one of {0}").format(", ".join(RATE_TYPES)))
@@ -6,6 +6,7 @@ import frappe
 from frappe import _
 from frappe.utils import flt, getdate, add_days, add_months, get_first_day, get_last_day
 from erpnext.payroll.doctype.payroll_entry.payroll_entry import PayrollEntry
+from lebanese_regulations.accounting.bulk_posting import bulk_gl_posting
 
 class LebaneseRegulationsPayrollEntry(PayrollEntry):
     """
@@ -180,7 +181,8 @@ class LebaneseRegulationsPayrollEntry(PayrollEntry):
         })
         
         je.insert()
-        je.submit()
+        with bulk_gl_posting():
+            je.submit()
         
         # Store reference to journal entry
         self.db_set("nssf_accrual_entry", je.name)
@@ -261,7 +263,8 @@ class LebaneseRegulationsPayrollEntry(PayrollEntry):
         })
         
         je.insert()
-        je.submit()
+        with bulk_gl_posting():
+            je.submit()
         
         # Store reference to journal entry
         self.db_set("indemnity_accrual_entry", je.name)
@@ -273,8 +276,9 @@ class LebaneseRegulationsPayrollEntry(PayrollEntry):
         """
         Make accrual journal entry
         """
-        # Run standard accrual entry
-        super(LebaneseRegulationsPayrollEntry, self).make_accrual_jv_entry()
+        # Run standard accrual entry, enriching its GL Entries in one pass
+        with bulk_gl_posting():
+            super(LebaneseRegulationsPayrollEntry, self).make_accrual_jv_entry()
         
         # Add Lebanese-specific accrual entries
         self.create_nssf_accrual_entry()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from lebanese_regulations.accounting.daily_rates import rebuild_daily_rates
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE, bump_rate_version
+from lebanese_regulations.setup.custom_fields import get_custom_fields
+from lebanese_regulations.setup.indexes import ensure_indexes
+
+def execute():
+    """
+    Add rate types to exchange rates, treating every existing rate as official
+    """
+    custom_fields = get_custom_fields()
+    create_custom_fields({
+        "Company": [field for field in custom_fields["Company"] if field["fieldname"] == "lbp_rate_type"],
+        "GL Entry": [field for field in custom_fields["GL Entry"] if field["fieldname"] == "lbp_rate_type"],
+        "Currency Exchange": custom_fields["Currency Exchange"]
+    })
+
+    frappe.db.sql("""
+        UPDATE `tabCurrency Exchange`
+        SET rate_type = %s
+        WHERE IFNULL(rate_type, '') = ''
+    """, (DEFAULT_RATE_TYPE,))
+
+    frappe.db.sql("""
+        UPDATE `tabCompany`
+        SET lbp_rate_type = %s
+        WHERE IFNULL(lbp_rate_type, '') = ''
+    """, (DEFAULT_RATE_TYPE,))
+
+    # Replace the pair/date indexes with their rate type aware versions
+    for doctype, index_name in (
+        ("Currency Exchange", "lebanese_pair_date_index"),
+        ("LBP Daily Rate", "unique_currency_date")
+    ):
+        if frappe.db.sql("SHOW INDEX FROM `tab{0}` WHERE Key_name = %s".format(doctype), (index_name,)):
+            frappe.db.sql_ddl("ALTER TABLE `tab{0}` DROP INDEX `{1}`".format(doctype, index_name))
+
+    ensure_indexes()
+
+    # Daily rates are renamed per rate type, so rebuild them from scratch
+    frappe.db.delete("LBP Daily Rate")
+    rebuild_daily_rates()
+
+    # Retire every cached timeline and matrix
+    bump_rate_version()
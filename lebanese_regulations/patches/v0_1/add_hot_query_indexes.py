@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from lebanese_regulations.setup.indexes import ensure_indexes
+
+def execute():
+    """
+    Create the composite indexes used by the Lebanese Regulations hot queries
+    """
+    ensure_indexes()
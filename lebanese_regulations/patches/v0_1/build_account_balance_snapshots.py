@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from lebanese_regulations.accounting.balance_snapshots import rebuild_account_balance_snapshots
+
+def execute():
+    """
+    Build the monthly account balance snapshots from the existing GL Entries
+    """
+    rebuild_account_balance_snapshots()
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from lebanese_regulations.setup.custom_fields import get_custom_fields
+
+def execute():
+    """
+    Create the Currency Exchange custom fields on existing sites
+    """
+    create_custom_fields({"Currency Exchange": get_custom_fields()["Currency Exchange"]})
@@ -5,6 +5,7 @@
 import frappe
 from frappe import _
 from frappe.utils import flt, getdate, nowdate, add_days, add_months, get_first_day, get_last_day
+from lebanese_regulations.accounting.bulk_posting import bulk_gl_posting
 
 def send_nssf_submission_reminder():
     """
@@ -236,6 +237,7 @@ def process_indemnity_accruals():
         })
         
         je.insert()
-        je.submit()
+        with bulk_gl_posting():
+            je.submit()
         
         frappe.msgprint(_("Processed indemnity accrual for employee {0}").format(employee.employee_name))
\ No newline at end of file
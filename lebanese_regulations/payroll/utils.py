@@ -5,6 +5,7 @@
 import frappe
 from frappe import _
 from frappe.utils import flt, getdate, date_diff, add_months, get_first_day, get_last_day
+from lebanese_regulations.accounting.bulk_posting import bulk_gl_posting
 
 def calculate_nssf_contributions(salary_slip):
     """
@@ -441,4 +442,5 @@ def create_indemnity_accrual_entry(employee, amount, posting_date):
     })
     
     je.insert()
-    je.submit()
\ No newline at end of file
+    with bulk_gl_posting():
+        je.submit()
\ No newline at end of file
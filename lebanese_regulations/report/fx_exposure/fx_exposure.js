@@ -0,0 +1,86 @@
+// Copyright (c) 2023, Your Name and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["FX Exposure"] = {
+    "filters": [
+        {
+            "fieldname": "company",
+            "label": __("Company"),
+            "fieldtype": "Link",
+            "options": "Company",
+            "default": frappe.defaults.get_user_default("Company"),
+            "reqd": 1
+        },
+        {
+            "fieldname": "from_date",
+            "label": __("From Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.add_days(frappe.datetime.get_today(), -1),
+            "reqd": 1,
+            "width": "60px"
+        },
+        {
+            "fieldname": "to_date",
+            "label": __("To Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today(),
+            "reqd": 1,
+            "width": "60px"
+        },
+        {
+            "fieldname": "account",
+            "label": __("Account"),
+            "fieldtype": "Link",
+            "options": "Account",
+            "get_query": function() {
+                var company = frappe.query_report.get_filter_value('company');
+                return {
+                    "doctype": "Account",
+                    "filters": {
+                        "company": company,
+                    }
+                }
+            }
+        },
+        {
+            "fieldname": "party_type",
+            "label": __("Party Type"),
+            "fieldtype": "Link",
+            "options": "Party Type",
+            "default": "",
+            "on_change": function() {
+                frappe.query_report.set_filter_value('party', "");
+            }
+        },
+        {
+            "fieldname": "party",
+            "label": __("Party"),
+            "fieldtype": "MultiSelectList",
+            "get_data": function(txt) {
+                if (!frappe.query_report.filters) return;
+
+                let party_type = frappe.query_report.get_filter_value('party_type');
+                if (!party_type) return;
+
+                return frappe.db.get_link_options(party_type, txt);
+            }
+        },
+        {
+            "fieldname": "rate_type",
+            "label": __("LBP Rate Type"),
+            "fieldtype": "Select",
+            "options": "\nOfficial\nSayrafa\nMarket",
+            "description": __("Defaults to the company's LBP rate type")
+        }
+    ],
+    "formatter": function(value, row, column, data, default_formatter) {
+        value = default_formatter(value, row, column, data);
+
+        if (["gain_loss", "unrealized_gain_loss"].includes(column.fieldname) && data && data[column.fieldname]) {
+            var color = data[column.fieldname] > 0 ? "green" : "red";
+            value = "<span style='color:" + color + "'>" + value + "</span>";
+        }
+
+        return value;
+    }
+};
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+import numpy as np
+from frappe import _
+from frappe.utils import getdate
+from lebanese_regulations.accounting.gl_expressions import get_lbp_amount_expressions, get_rate_join
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+from lebanese_regulations.accounting.rate_metrics import record_missing_rates
+from lebanese_regulations.accounting.report_cache import get_report_result
+from lebanese_regulations.accounting.utils import get_exchange_rates
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    get_column, get_gl_entry_conditions
+)
+
+# LBP columns summed in the total row
+TOTAL_FIELDS = ["gain_loss", "book_balance_lbp", "revalued_balance_lbp", "unrealized_gain_loss"]
+
+def execute(filters=None):
+    """
+    Execute the FX Exposure report
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (columns, data)
+    """
+    filters = frappe._dict(filters or {})
+
+    # Value balances with the company's rate type unless another one is chosen
+    if not filters.get("rate_type"):
+        filters["rate_type"] = get_company_rate_type(filters.get("company"))
+
+    # Reuse the result of an identical filter set until its ledger or rates change
+    return get_report_result("FX Exposure", filters, lambda: get_result(filters))
+
+def get_result(filters):
+    """
+    Compute the FX Exposure report
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (columns, data)
+    """
+    validate_filters(filters)
+
+    # Foreign currency balances at both dates in one grouped pass
+    balances = get_foreign_currency_balances(filters)
+
+    # Gain and loss column-wise over all balances
+    data = get_exposure_rows(filters, balances)
+
+    return get_columns(), data
+
+def validate_filters(filters):
+    """
+    Validate the report filters
+
+    Args:
+        filters (dict): Report filters
+    """
+    if not filters.get("company"):
+        frappe.throw(_("{0} is mandatory").format(_("Company")))
+
+    if not filters.get("from_date") or not filters.get("to_date"):
+        frappe.throw(_("From Date and To Date are mandatory"))
+
+    if getdate(filters.get("from_date")) > getdate(filters.get("to_date")):
+        frappe.throw(_("From Date must be before To Date"))
+
+def get_foreign_currency_balances(filters):
+    """
+    Get the balance of every foreign currency account and party at
+    from_date and at to_date, with its LBP book balance at to_date
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        list: Rows as dicts
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    return frappe.db.sql("""
+        SELECT gle.account, gle.party_type, gle.party, gle.account_currency,
+            SUM(IF(gle.posting_date <= %(from_date)s,
+                gle.debit_in_account_currency - gle.credit_in_account_currency, 0)) AS opening_balance,
+            SUM(gle.debit_in_account_currency - gle.credit_in_account_currency) AS closing_balance,
+            SUM({debit_lbp} - {credit_lbp}) AS book_balance_lbp
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+          AND gle.account_currency != 'LBP'
+        GROUP BY gle.account, gle.party_type, gle.party, gle.account_currency
+        HAVING opening_balance != 0 OR closing_balance != 0 OR book_balance_lbp != 0
+        ORDER BY gle.account, gle.party_type, gle.party
+    """.format(
+        debit_lbp=debit_lbp,
+        credit_lbp=credit_lbp,
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions)
+    ), values, as_dict=1)
+
+def get_exposure_rows(filters, balances):
+    """
+    Value the balances at the from_date and to_date rates and add the gain
+    or loss columns
+
+    Each currency's two rates are resolved once, in one batch, and spread
+    over the rows as rate vectors. Rows of a currency without a rate keep
+    blank rate, revalued and gain or loss columns, left out of the totals,
+    rather than being valued at 1 LBP.
+
+    Args:
+        filters (dict): Report filters
+        balances (list): Rows from get_foreign_currency_balances, updated in place
+
+    Returns:
+        list: Report rows with a total row
+    """
+    if not balances:
+        return []
+
+    from_date = getdate(filters.get("from_date"))
+    to_date = getdate(filters.get("to_date"))
+
+    # Opening and closing rate of every currency in one batch
+    currencies = sorted({row.account_currency for row in balances})
+    rates = get_exchange_rates(
+        [(currency, "LBP", date) for currency in currencies for date in (from_date, to_date)],
+        filters.get("rate_type"),
+        fallback=None
+    )
+
+    opening_rates = np.array([rates[(row.account_currency, "LBP", from_date)] for row in balances], dtype=float)
+    closing_rates = np.array([rates[(row.account_currency, "LBP", to_date)] for row in balances], dtype=float)
+
+    # Count the rows left blank for lack of a rate
+    missing = {}
+    for row, is_missing in zip(balances, np.isnan(opening_rates) | np.isnan(closing_rates)):
+        if is_missing:
+            missing[row.account_currency] = missing.get(row.account_currency, 0) + 1
+    if missing:
+        record_missing_rates(missing, filters.get("rate_type"))
+
+    opening_balance = get_column(balances, "opening_balance")
+    closing_balance = get_column(balances, "closing_balance")
+    book_balance_lbp = get_column(balances, "book_balance_lbp")
+
+    # Gain or loss on the from_date balance, and on the to_date balance against its book value,
+    # NaN where a rate is missing
+    columns = {
+        "opening_rate": opening_rates,
+        "closing_rate": closing_rates,
+        "gain_loss": opening_balance * (closing_rates - opening_rates),
+        "revalued_balance_lbp": closing_balance * closing_rates,
+        "unrealized_gain_loss": closing_balance * closing_rates - book_balance_lbp
+    }
+    columns = {fieldname: np.where(np.isnan(values), None, values).tolist() for fieldname, values in columns.items()}
+
+    for i, row in enumerate(balances):
+        for fieldname, values in columns.items():
+            row[fieldname] = values[i]
+
+    total_row = {"account": _("'Total'")}
+    for fieldname in TOTAL_FIELDS:
+        total_row[fieldname] = float(get_column(balances, fieldname).sum())
+
+    return balances + [{}, total_row]
+
+def get_columns():
+    """
+    Get the report columns
+
+    Returns:
+        list: Report columns
+    """
+    return [
+        {
+            "label": _("Account"),
+            "fieldname": "account",
+            "fieldtype": "Link",
+            "options": "Account",
+            "width": 220
+        },
+        {
+            "label": _("Party Type"),
+            "fieldname": "party_type",
+            "fieldtype": "Link",
+            "options": "Party Type",
+            "width": 100
+        },
+        {
+            "label": _("Party"),
+            "fieldname": "party",
+            "fieldtype": "Dynamic Link",
+            "options": "party_type",
+            "width": 160
+        },
+        {
+            "label": _("Currency"),
+            "fieldname": "account_currency",
+            "fieldtype": "Link",
+            "options": "Currency",
+            "width": 80
+        },
+        {
+            "label": _("Balance at From Date"),
+            "fieldname": "opening_balance",
+            "fieldtype": "Currency",
+            "options": "account_currency",
+            "width": 140
+        },
+        {
+            "label": _("Rate at From Date"),
+            "fieldname": "opening_rate",
+            "fieldtype": "Float",
+            "precision": 6,
+            "width": 110
+        },
+        {
+            "label": _("Balance at To Date"),
+            "fieldname": "closing_balance",
+            "fieldtype": "Currency",
+            "options": "account_currency",
+            "width": 140
+        },
+        {
+            "label": _("Rate at To Date"),
+            "fieldname": "closing_rate",
+            "fieldtype": "Float",
+            "precision": 6,
+            "width": 110
+        },
+        {
+            "label": _("Gain/Loss on From Date Balance (LBP)"),
+            "fieldname": "gain_loss",
+            "fieldtype": "Currency",
+            "options": "LBP",
+            "width": 160
+        },
+        {
+            "label": _("Book Balance (LBP)"),
+            "fieldname": "book_balance_lbp",
+            "fieldtype": "Currency",
+            "options": "LBP",
+            "width": 150
+        },
+        {
+            "label": _("Revalued Balance (LBP)"),
+            "fieldname": "revalued_balance_lbp",
+            "fieldtype": "Currency",
+            "options": "LBP",
+            "width": 150
+        },
+        {
+            "label": _("Unrealized Gain/Loss (LBP)"),
+            "fieldname": "unrealized_gain_loss",
+            "fieldtype": "Currency",
+            "options": "LBP",
+            "width": 160
+        }
+    ]
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import csv
+import os
+from itertools import islice
+
+import frappe
+from frappe import _
+from frappe.utils import flt, now_datetime
+from lebanese_regulations.accounting.gl_expressions import (
+    get_exchange_rate_expression, get_lbp_amount_expressions, get_rate_join
+)
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    OPENING_CONDITION, add_running_balances, get_gl_entry_conditions
+)
+from lebanese_regulations.report.lebanese_general_ledger.lebanese_general_ledger import validate_filters
+
+# GL Entries enriched and written per chunk
+EXPORT_CHUNK_SIZE = 5000
+
+# (fieldname, label) of the exported columns, in file order
+EXPORT_COLUMNS = [
+    ("posting_date", "Posting Date"),
+    ("account", "Account"),
+    ("party_type", "Party Type"),
+    ("party", "Party"),
+    ("voucher_type", "Voucher Type"),
+    ("voucher_no", "Voucher No"),
+    ("against", "Against Account"),
+    ("cost_center", "Cost Center"),
+    ("project", "Project"),
+    ("remarks", "Remarks"),
+    ("debit", "Debit"),
+    ("credit", "Credit"),
+    ("balance", "Balance"),
+    ("account_currency", "Account Currency"),
+    ("exchange_rate", "Exchange Rate"),
+    ("debit_lbp", "Debit (LBP)"),
+    ("credit_lbp", "Credit (LBP)"),
+    ("balance_lbp", "Balance (LBP)"),
+    ("foreign_currency", "Foreign Currency"),
+    ("debit_fc", "Debit (FC)"),
+    ("credit_fc", "Credit (FC)")
+]
+
+def export_general_ledger(filters, file_path, file_format="csv"):
+    """
+    Stream the Lebanese General Ledger for a filter set into a CSV or XLSX file
+
+    GL Entries are read through an unbuffered server-side cursor and
+    enriched in SQL, so each chunk is converted and written without further
+    queries and memory stays flat whatever the date range.
+
+    Args:
+        filters (dict): Report filters (company, from_date, to_date, account,
+            party_type, party, voucher_no, cost_center, project,
+            show_cancelled_entries, rate_type)
+        file_path (str): Path of the file to write
+        file_format (str): "csv" or "xlsx"
+
+    Returns:
+        int: Number of GL Entries written
+    """
+    filters = frappe._dict(filters)
+    validate_filters(filters)
+    filters.rate_type = filters.rate_type or get_company_rate_type(filters.company)
+
+    conditions, values = get_gl_entry_conditions(filters)
+
+    # Opening balances are summed before the stream starts
+    opening = get_opening_row(filters, conditions, values)
+
+    writer = get_export_writer(file_path, file_format)
+    writer.write_row([_(label) for fieldname, label in EXPORT_COLUMNS])
+    writer.write_row(format_export_row(opening))
+
+    balance = flt(opening.balance)
+    balance_lbp = flt(opening.balance_lbp)
+    written = 0
+
+    try:
+        with frappe.db.unbuffered_cursor():
+            rows = frappe.db.sql(get_gl_entry_query(conditions), values, as_dict=1, as_iterator=True)
+
+            while True:
+                chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+                if not chunk:
+                    break
+
+                balance, balance_lbp = add_running_balances(chunk, balance, balance_lbp)
+
+                for row in chunk:
+                    writer.write_row(format_export_row(row))
+
+                written += len(chunk)
+    finally:
+        writer.close()
+
+    return written
+
+def get_gl_entry_query(conditions):
+    """
+    Get the query streaming the GL Entries of the period with their LBP and
+    foreign currency columns
+
+    Args:
+        conditions (list): SQL conditions from get_gl_entry_conditions
+
+    Returns:
+        str: SQL query
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    return """
+        SELECT
+            gle.posting_date, gle.account, gle.party_type, gle.party,
+            gle.voucher_type, gle.voucher_no, gle.against, gle.cost_center,
+            gle.project, gle.remarks, gle.debit, gle.credit, gle.account_currency,
+            {rate} AS exchange_rate,
+            {debit_lbp} AS debit_lbp,
+            {credit_lbp} AS credit_lbp,
+            IF(gle.account_currency = 'LBP', '', gle.account_currency) AS foreign_currency,
+            IF(gle.account_currency = 'LBP', 0, gle.debit_in_account_currency) AS debit_fc,
+            IF(gle.account_currency = 'LBP', 0, gle.credit_in_account_currency) AS credit_fc
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+          AND IFNULL(gle.is_opening, 'No') != 'Yes'
+        ORDER BY gle.posting_date, gle.creation, gle.name
+    """.format(
+        rate=get_exchange_rate_expression(),
+        debit_lbp=debit_lbp,
+        credit_lbp=credit_lbp,
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions)
+    )
+
+def get_opening_row(filters, conditions, values):
+    """
+    Get the opening balance row of the export, counting the same entries
+    as the report's opening
+
+    Args:
+        filters (dict): Report filters
+        conditions (list): SQL conditions from get_gl_entry_conditions
+        values (dict): Query values
+
+    Returns:
+        dict: Opening row
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    opening = frappe.db.sql("""
+        SELECT
+            IFNULL(SUM(gle.debit), 0) - IFNULL(SUM(gle.credit), 0) AS balance,
+            IFNULL(SUM({debit_lbp} - {credit_lbp}), 0) AS balance_lbp
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+          AND {opening}
+    """.format(
+        debit_lbp=debit_lbp,
+        credit_lbp=credit_lbp,
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions),
+        opening=OPENING_CONDITION
+    ), values, as_dict=1)[0]
+
+    return frappe._dict({
+        "posting_date": filters.get("from_date"),
+        "account": _("Opening"),
+        "balance": flt(opening.balance),
+        "balance_lbp": flt(opening.balance_lbp)
+    })
+
+def format_export_row(row):
+    """
+    Order a row's values by the export columns
+
+    Args:
+        row (dict): Export row
+
+    Returns:
+        list: Cell values
+    """
+    return [row.get(fieldname) for fieldname, label in EXPORT_COLUMNS]
+
+def get_export_writer(file_path, file_format):
+    """
+    Get a row writer for the export file format
+
+    Args:
+        file_path (str): Path of the file to write
+        file_format (str): "csv" or "xlsx"
+
+    Returns:
+        CSVExportWriter | XLSXExportWriter: Row writer
+    """
+    if file_format == "xlsx":
+        return XLSXExportWriter(file_path)
+
+    if file_format == "csv":
+        return CSVExportWriter(file_path)
+
+    frappe.throw(_("Unsupported export format: {0}").format(file_format))
+
+class CSVExportWriter:
+    """
+    Write export rows to a CSV file as they arrive
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+class XLSXExportWriter:
+    """
+    Write export rows to an XLSX file with openpyxl's write-only mode, which
+    streams rows to disk instead of keeping the sheet in memory
+    """
+
+    def __init__(self, file_path):
+        from openpyxl import Workbook
+
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(_("General Ledger"))
+
+    def write_row(self, row):
+        self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.file_path)
+
+def export_general_ledger_to_file(filters, file_format="csv", user=None):
+    """
+    Export the Lebanese General Ledger to a private File and notify the user
+    This runs as a background job
+
+    Args:
+        filters (dict): Report filters
+        file_format (str): "csv" or "xlsx"
+        user (str): User to notify
+
+    Returns:
+        str: URL of the exported File
+    """
+    file_name = "lebanese_general_ledger_{0}_{1}.{2}".format(
+        frappe.scrub(filters.get("company") or ""), now_datetime().strftime("%Y%m%d%H%M%S"), file_format
+    )
+    file_path = frappe.get_site_path("private", "files", file_name)
+
+    rows = export_general_ledger(filters, file_path, file_format)
+
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "file_url": "/private/files/" + file_name,
+        "is_private": 1,
+        "file_size": os.path.getsize(file_path)
+    })
+    file_doc.flags.ignore_file_validate = True
+    file_doc.insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    if user:
+        frappe.publish_realtime("msgprint", {
+            "message": _("Lebanese General Ledger export with {0} entries is ready: <a href='{1}'>{2}</a>").format(
+                rows, file_doc.file_url, file_name
+            ),
+            "title": _("Export Ready")
+        }, user=user)
+
+    return file_doc.file_url
+
+@frappe.whitelist()
+def enqueue_general_ledger_export(filters, file_format="csv"):
+    """
+    Queue a streaming export of the Lebanese General Ledger
+
+    Args:
+        filters (dict|str): Report filters
+        file_format (str): "csv" or "xlsx"
+    """
+    filters = frappe.parse_json(filters)
+    frappe.has_permission("GL Entry", throw=True)
+
+    if file_format not in ("csv", "xlsx"):
+        frappe.throw(_("Unsupported export format: {0}").format(file_format))
+
+    # Fail before queueing, as the job validates the same filters again
+    validate_filters(filters)
+
+    frappe.enqueue(
+        "lebanese_regulations.report.lebanese_general_ledger.gl_export.export_general_ledger_to_file",
+        queue="long",
+        timeout=4 * 60 * 60,
+        filters=filters,
+        file_format=file_format,
+        user=frappe.session.user
+    )
+
+    frappe.msgprint(_("The export has been queued. You will be notified when the file is ready."), alert=True)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import cint, flt
+from lebanese_regulations.accounting.gl_expressions import get_rate_join
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    GROUP_BY_KEYS, OPENING_CONDITION, add_group_running_balances, add_running_balances, get_entry_fields,
+    get_gl_entry_conditions, order_summary
+)
+
+# Amounts a GL Entry adds to the summary totals
+AMOUNT_FIELDS = ("debit", "credit", "debit_lbp", "credit_lbp")
+
+def get_ledger_state(filters, summary, entries):
+    """
+    Get the state a cached ledger result is refreshed from
+
+    The watermark is read after the ledger, in the same transaction and so
+    from the same consistent read, which makes it describe exactly the
+    entries the ledger covers. That only holds for a ledger get_ledger_parts
+    computed in this process: the Parquet snapshot and the parallel workers,
+    which read in their own transactions, must not be given a state.
+
+    Args:
+        filters (dict): Report filters
+        summary (dict): Totals from get_balance_summary
+        entries (list): Rows from get_period_entries
+
+    Returns:
+        dict: User, summary, entries and watermark, or None when the grouping
+            cannot be refreshed incrementally
+    """
+    # Consolidated voucher rows cannot take single entries in or out
+    if filters.get("group_by") == "Group by Voucher":
+        return None
+
+    return {
+        "user": frappe.session.user,
+        "summary": summary,
+        "entries": entries,
+        "watermark": get_watermark(filters)
+    }
+
+def get_watermark(filters):
+    """
+    Get the entry count and the latest creation and modification of the GL
+    Entries a ledger covers
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        dict: count, creation and modified
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+
+    return frappe.db.sql("""
+        SELECT COUNT(*) AS count, MAX(gle.creation) AS creation, MAX(gle.modified) AS modified
+        FROM `tabGL Entry` gle
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+    """.format(conditions=" AND ".join(conditions)), values, as_dict=1)[0]
+
+def refresh_ledger_parts(filters, state):
+    """
+    Bring a cached ledger up to date with the GL Entries created or
+    cancelled after its watermark
+
+    New entries are added to the totals of their group and, when in the
+    period, merged into the entries. Cancelled entries are taken out the
+    same way. The entry count is then checked against the database, so
+    deleted or late-committed entries fall back to a full recompute.
+
+    Args:
+        filters (dict): Report filters
+        state (dict): State from get_ledger_state
+
+    Returns:
+        tuple: (summary, entries, state), or None when the ledger must be recomputed
+    """
+    if not state or filters.get("group_by") == "Group by Voucher":
+        return None
+
+    # The state holds the rows its user may see
+    if state.get("user") != frappe.session.user:
+        return None
+
+    watermark = state["watermark"]
+    summary = state["summary"]
+    entries = state["entries"]
+
+    current = get_watermark(filters)
+
+    created = get_changed_entries(filters, "gle.creation > %(watermark_creation)s", watermark)
+
+    # Cancelled entries stay in the ledger when cancelled entries are shown
+    cancelled = []
+    if not cint(filters.get("show_cancelled_entries")):
+        cancelled = get_changed_entries(
+            frappe._dict(filters, show_cancelled_entries=1),
+            """gle.is_cancelled = 1 AND gle.creation <= %(watermark_creation)s
+                AND gle.modified > %(watermark_modified)s""",
+            watermark
+        )
+
+    if cint(watermark.count) + len(created) - len(cancelled) != cint(current.count):
+        return None
+
+    # Take out cancelled entries
+    cancelled_names = set()
+    for entry in cancelled:
+        add_to_summary(summary, entry, -1)
+        cancelled_names.add(entry.gl_entry)
+
+    entries = [entry for entry in entries if entry.get("gl_entry") not in cancelled_names]
+
+    # Add new entries
+    for entry in created:
+        add_to_summary(summary, entry, 1)
+        if not cint(entry.pop("in_opening")):
+            entries.append(entry)
+
+    order_summary(summary)
+
+    # Restore ledger order and the in-period running balances, which the
+    # cached rows hold shifted by their opening
+    grouped = filters.get("group_by") in GROUP_BY_KEYS
+    entries.sort(key=lambda entry: (
+        entry.get("group_key") or "" if grouped else "", entry.get("posting_date"), entry.get("creation"),
+        entry.get("gl_entry")
+    ))
+
+    if grouped:
+        add_group_running_balances(entries)
+    else:
+        add_running_balances(entries)
+
+    return summary, entries, dict(state, summary=summary, entries=entries, watermark=current)
+
+def get_changed_entries(filters, condition, watermark):
+    """
+    Get the GL Entries of a ledger matching a watermark condition
+
+    Args:
+        filters (dict): Report filters
+        condition (str): SQL condition using watermark_creation and watermark_modified
+        watermark (dict): Watermark from get_watermark
+
+    Returns:
+        list: Rows with the entry fields, group_key and in_opening
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+    values.update({
+        "watermark_creation": watermark.creation or "1900-01-01",
+        "watermark_modified": watermark.modified or "1900-01-01"
+    })
+
+    group_key = GROUP_BY_KEYS.get(filters.get("group_by"))
+
+    return frappe.db.sql("""
+        SELECT {fields}, {group_key} AS group_key, {opening} AS in_opening
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+          AND {condition}
+    """.format(
+        fields=get_entry_fields(),
+        group_key=group_key or "NULL",
+        opening=OPENING_CONDITION,
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions),
+        condition=condition
+    ), values, as_dict=1)
+
+def add_to_summary(summary, entry, sign):
+    """
+    Add a GL Entry to the totals of its group and to the overall totals
+
+    Args:
+        summary (dict): Totals from get_balance_summary, updated in place
+        entry (dict): Row from get_changed_entries
+        sign (int): 1 to add the entry, -1 to take it out
+    """
+    kind = "opening" if cint(entry.get("in_opening")) else "period"
+
+    targets = [summary.setdefault(None, frappe._dict(group_key=None))]
+    if entry.get("group_key") is not None:
+        targets.append(summary.setdefault(entry.group_key, frappe._dict(group_key=entry.group_key)))
+
+    for totals in targets:
+        for field in AMOUNT_FIELDS:
+            totals[f"{kind}_{field}"] = flt(totals.get(f"{kind}_{field}")) + sign * flt(entry.get(field))
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import frappe
+from frappe.utils import cint, flt
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    GROUP_BY_KEYS, add_running_balances, arrange_ledger, get_gl_entry_conditions, get_ledger_parts, order_summary
+)
+
+# Ledgers with fewer period entries than this run in a single process
+PARALLEL_MIN_ENTRIES = 100000
+
+# Worker processes a parallel run uses unless the site config says otherwise;
+# each one holds its own database connection for the length of the run
+DEFAULT_PARALLEL_WORKERS = 4
+
+# Summary totals added up across partitions
+SUMMARY_FIELDS = [
+    f"{kind}_{field}"
+    for kind in ("opening", "period")
+    for field in ("debit", "credit", "debit_lbp", "credit_lbp")
+]
+
+def get_parallel_workers():
+    """
+    Get the number of worker processes a parallel run may use
+
+    The lebanese_gl_parallel_workers site config overrides the default of
+    DEFAULT_PARALLEL_WORKERS, capped by the CPU count; set it to 1 to
+    disable parallel runs.
+
+    Returns:
+        int: Worker processes
+    """
+    return cint(frappe.conf.get("lebanese_gl_parallel_workers")) or min(DEFAULT_PARALLEL_WORKERS, os.cpu_count() or 1)
+
+def get_ledger_partitions(filters):
+    """
+    Split a large ledger into account partitions of similar entry counts
+
+    Party grouping mixes accounts within a group, so it always runs in a
+    single process.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        list: Account name lists, one per partition, or None for a single process run
+    """
+    workers = get_parallel_workers()
+    if workers < 2 or filters.get("group_by") == "Group by Party":
+        return None
+
+    conditions, values = get_gl_entry_conditions(filters)
+
+    weights = dict(frappe.db.sql("""
+        SELECT gle.account, COUNT(*)
+        FROM `tabGL Entry` gle
+        WHERE {conditions}
+          AND gle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+        GROUP BY gle.account
+    """.format(conditions=" AND ".join(conditions)), values))
+
+    if sum(weights.values()) < PARALLEL_MIN_ENTRIES:
+        return None
+
+    # Accounts with history but no period entries still carry an opening balance
+    account_filters = {"company": filters.get("company"), "is_group": 0}
+    if filters.get("account"):
+        account_filters.update({"lft": (">=", values["account_lft"]), "rgt": ("<=", values["account_rgt"])})
+
+    accounts = frappe.get_all("Account", filters=account_filters, pluck="name")
+
+    return partition_accounts({account: weights.get(account, 0) for account in accounts}, workers)
+
+def partition_accounts(weights, count):
+    """
+    Spread accounts over partitions, heaviest first onto the lightest partition
+
+    Args:
+        weights (dict): Entry count by account
+        count (int): Number of partitions
+
+    Returns:
+        list: Non-empty account name lists
+    """
+    partitions = [[] for i in range(count)]
+    loads = [(0, i) for i in range(count)]
+
+    for account, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+        load, i = heapq.heappop(loads)
+        partitions[i].append(account)
+        heapq.heappush(loads, (load + weight, i))
+
+    return [accounts for accounts in partitions if accounts]
+
+def get_parallel_ledger(filters, partitions):
+    """
+    Compute the Lebanese General Ledger with one worker process per
+    account partition and merge the results
+
+    Args:
+        filters (dict): Report filters
+        partitions (list): Account name lists from get_ledger_partitions
+
+    Returns:
+        list: Report rows
+    """
+    summary, entries = get_parallel_ledger_parts(filters, partitions)
+
+    return arrange_ledger(filters, summary, entries)
+
+def get_parallel_ledger_parts(filters, partitions):
+    """
+    Compute the summary and period entries of every account partition in
+    worker processes and merge them
+
+    Args:
+        filters (dict): Report filters
+        partitions (list): Account name lists from get_ledger_partitions
+
+    Returns:
+        tuple: (summary, entries) as get_ledger_parts returns them
+    """
+    count = len(partitions)
+
+    # Workers start fresh interpreters, as forking would share the open database connection
+    with ProcessPoolExecutor(
+        max_workers=min(count, get_parallel_workers()),
+        mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        results = list(pool.map(
+            run_partition,
+            [frappe.local.site] * count,
+            [frappe.local.sites_path] * count,
+            [frappe.session.user] * count,
+            [dict(filters, accounts=accounts) for accounts in partitions]
+        ))
+
+    return merge_partitions(filters, results)
+
+def run_partition(site, sites_path, user, filters):
+    """
+    Compute the summary and period entries of one account partition
+    This runs in a worker process, connected to the site as the user running
+    the report so partitions apply the same permissions, and disconnected
+    once done
+
+    Args:
+        site (str): Site name
+        sites_path (str): Sites directory
+        user (str): Session user
+        filters (dict): Report filters with the partition's accounts
+
+    Returns:
+        tuple: (summary as (group key, dict) pairs, entries as dicts)
+    """
+    frappe.init(site=site, sites_path=sites_path)
+
+    try:
+        frappe.connect()
+        frappe.set_user(user)
+
+        summary, entries = get_ledger_parts(frappe._dict(filters))
+    finally:
+        frappe.destroy()
+
+    return [(key, dict(totals)) for key, totals in summary.items()], [dict(entry) for entry in entries]
+
+def merge_partitions(filters, results):
+    """
+    Merge partition results into one summary and one ordered entry list
+
+    Account groups are disjoint across partitions and are kept as they are.
+    Without account grouping the entries are merged back into ledger order
+    and their running balances recomputed.
+
+    Args:
+        filters (dict): Report filters
+        results (list): Results of run_partition
+
+    Returns:
+        tuple: (summary, entries) as get_ledger_parts returns them
+    """
+    summary = {}
+    total = frappe._dict(group_key=None)
+
+    for partition_summary, partition_entries in results:
+        for key, totals in partition_summary:
+            if key is None:
+                for field in SUMMARY_FIELDS:
+                    total[field] = flt(total.get(field)) + flt(totals.get(field))
+            else:
+                summary[key] = frappe._dict(totals)
+
+    summary[None] = total
+    order_summary(summary)
+
+    entry_lists = [[frappe._dict(entry) for entry in partition_entries] for partition_summary, partition_entries in results]
+
+    if filters.get("group_by") in GROUP_BY_KEYS:
+        return summary, [entry for partition_entries in entry_lists for entry in partition_entries]
+
+    # Same order as the ORDER BY of get_period_entries
+    if filters.get("group_by") == "Group by Voucher":
+        sort_key = lambda entry: (entry.posting_date, entry.creation, entry.voucher_no, entry.account)
+    else:
+        sort_key = lambda entry: (entry.posting_date, entry.creation, entry.gl_entry)
+
+    entries = list(heapq.merge(*entry_lists, key=sort_key))
+    add_running_balances(entries)
+
+    return summary, entries
@@ -0,0 +1,632 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+import numpy as np
+from frappe import _
+from frappe.utils import add_days, cint, flt, getdate
+from lebanese_regulations.accounting.balance_snapshots import get_snapshot_balances, has_balance_snapshots
+from lebanese_regulations.accounting.gl_expressions import (
+    get_exchange_rate_expression, get_lbp_amount_expressions, get_match_condition, get_rate_join
+)
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE, get_company_rate_type
+from lebanese_regulations.accounting.rate_metrics import record_missing_rates
+
+# SQL condition of GL Entries counted in opening balances
+OPENING_CONDITION = "(gle.posting_date < %(from_date)s OR IFNULL(gle.is_opening, 'No') = 'Yes')"
+
+# Rows per page of the paginated ledger, by default and at most
+LEDGER_PAGE_SIZE = 500
+MAX_LEDGER_PAGE_SIZE = 5000
+
+# SQL expression each group_by option partitions the ledger on
+GROUP_BY_KEYS = {
+    "Group by Account": "IFNULL(gle.account, '')",
+    "Group by Party": "CONCAT_WS('::', IFNULL(gle.party_type, ''), IFNULL(gle.party, ''))"
+}
+
+def get_gl_entry_conditions(filters):
+    """
+    Build the GL Entry conditions of a Lebanese General Ledger filter set
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (list of SQL conditions on the gle alias, values dict)
+    """
+    values = {
+        "company": filters.get("company"),
+        "from_date": getdate(filters.get("from_date")),
+        "to_date": getdate(filters.get("to_date")),
+        "rate_type": filters.get("rate_type") or get_company_rate_type(filters.get("company")),
+        "default_rate_type": DEFAULT_RATE_TYPE
+    }
+    conditions = ["gle.company = %(company)s"]
+
+    if filters.get("account"):
+        # Group accounts cover every account below them
+        lft, rgt = frappe.db.get_value("Account", filters.get("account"), ["lft", "rgt"])
+        conditions.append("""gle.account IN (
+            SELECT name FROM `tabAccount` WHERE lft >= %(account_lft)s AND rgt <= %(account_rgt)s)""")
+        values.update({"account_lft": lft, "account_rgt": rgt})
+
+    if filters.get("accounts"):
+        # Partition of a parallel run
+        conditions.append("gle.account IN %(accounts)s")
+        values["accounts"] = tuple(filters.get("accounts"))
+
+    if filters.get("voucher_no"):
+        conditions.append("gle.voucher_no = %(voucher_no)s")
+        values["voucher_no"] = filters.get("voucher_no")
+
+    if filters.get("party_type"):
+        conditions.append("gle.party_type = %(party_type)s")
+        values["party_type"] = filters.get("party_type")
+
+    if filters.get("party"):
+        party = filters.get("party")
+        if isinstance(party, str):
+            party = json.loads(party) if party.startswith("[") else [party]
+        conditions.append("gle.party IN %(party)s")
+        values["party"] = tuple(party)
+
+    if filters.get("cost_center"):
+        conditions.append("gle.cost_center = %(cost_center)s")
+        values["cost_center"] = filters.get("cost_center")
+
+    if filters.get("project"):
+        conditions.append("gle.project = %(project)s")
+        values["project"] = filters.get("project")
+
+    if filters.get("finance_book"):
+        # Entries of the chosen book, optionally with the company's default book
+        books = [filters.get("finance_book")]
+        if cint(filters.get("include_default_book_entries")):
+            default_book = frappe.get_cached_value("Company", filters.get("company"), "default_finance_book")
+            if default_book:
+                books.append(default_book)
+        conditions.append("(gle.finance_book IN %(finance_books)s OR IFNULL(gle.finance_book, '') = '')")
+        values["finance_books"] = tuple(books)
+
+    if not cint(filters.get("show_cancelled_entries")):
+        conditions.append("gle.is_cancelled = 0")
+
+    # Entries the user's permissions allow
+    match_condition = get_match_condition()
+    if match_condition:
+        conditions.append(match_condition)
+
+    return conditions, values
+
+def get_entry_fields():
+    """
+    Get the SQL columns of one ledger row per GL Entry, with its LBP and
+    foreign currency values
+
+    Returns:
+        str: Comma separated SQL columns over the gle and daily aliases
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    return """
+        gle.name AS gl_entry, gle.posting_date, gle.account, gle.party_type, gle.party,
+        gle.voucher_type, gle.voucher_no, gle.against, gle.cost_center, gle.project,
+        gle.remarks, gle.account_currency, gle.creation, gle.debit, gle.credit,
+        gle.debit_in_account_currency, gle.credit_in_account_currency,
+        {debit_lbp} AS debit_lbp, {credit_lbp} AS credit_lbp,
+        {rate} AS exchange_rate,
+        IF(gle.account_currency = 'LBP', '', gle.account_currency) AS foreign_currency,
+        IF(gle.account_currency = 'LBP', 0, gle.debit_in_account_currency) AS debit_fc,
+        IF(gle.account_currency = 'LBP', 0, gle.credit_in_account_currency) AS credit_fc
+    """.format(debit_lbp=debit_lbp, credit_lbp=credit_lbp, rate=get_exchange_rate_expression())
+
+def get_period_entries(filters, conditions, values):
+    """
+    Get the period's GL Entries with LBP and foreign currency columns and
+    running balances computed in the database
+
+    Args:
+        filters (dict): Report filters
+        conditions (list): SQL conditions from get_gl_entry_conditions
+        values (dict): Query values
+
+    Returns:
+        list: Rows as dicts, with group_key when grouping by account or party
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+    group_key = GROUP_BY_KEYS.get(filters.get("group_by"))
+    consolidated = filters.get("group_by") == "Group by Voucher"
+
+    partition = f"PARTITION BY {group_key}" if group_key else ""
+    order = "gle.posting_date, gle.creation, gle.name"
+
+    if consolidated:
+        # One row per voucher and account, summed in the database
+        select = f"""
+            MIN(gle.posting_date) AS posting_date, gle.account, gle.party_type, gle.party,
+            gle.voucher_type, gle.voucher_no, MIN(gle.against) AS against,
+            MIN(gle.cost_center) AS cost_center, MIN(gle.project) AS project,
+            MIN(gle.remarks) AS remarks, gle.account_currency, MIN(gle.creation) AS creation,
+            SUM(gle.debit) AS debit, SUM(gle.credit) AS credit,
+            SUM(gle.debit_in_account_currency) AS debit_in_account_currency,
+            SUM(gle.credit_in_account_currency) AS credit_in_account_currency,
+            SUM({debit_lbp}) AS debit_lbp, SUM({credit_lbp}) AS credit_lbp,
+            IF(gle.account_currency = 'LBP', 1,
+                SUM({debit_lbp} + {credit_lbp})
+                / NULLIF(SUM(gle.debit_in_account_currency + gle.credit_in_account_currency), 0)) AS exchange_rate,
+            IF(gle.account_currency = 'LBP', 0, SUM(gle.debit_in_account_currency)) AS debit_fc,
+            IF(gle.account_currency = 'LBP', 0, SUM(gle.credit_in_account_currency)) AS credit_fc,
+            IF(gle.account_currency = 'LBP', '', gle.account_currency) AS foreign_currency,
+            SUM(SUM(gle.debit - gle.credit)) OVER (
+                ORDER BY MIN(gle.posting_date), MIN(gle.creation), gle.voucher_no, gle.account) AS balance,
+            SUM(SUM({debit_lbp}) - SUM({credit_lbp})) OVER (
+                ORDER BY MIN(gle.posting_date), MIN(gle.creation), gle.voucher_no, gle.account) AS balance_lbp
+        """
+        group_by = "GROUP BY gle.voucher_type, gle.voucher_no, gle.account, gle.party_type, gle.party, gle.account_currency"
+        order_by = "ORDER BY MIN(gle.posting_date), MIN(gle.creation), gle.voucher_no, gle.account"
+    else:
+        select = f"""
+            {get_entry_fields()},
+            SUM(gle.debit - gle.credit) OVER ({partition} ORDER BY {order}) AS balance,
+            SUM({debit_lbp} - {credit_lbp}) OVER ({partition} ORDER BY {order}) AS balance_lbp
+        """
+        if group_key:
+            select += f", {group_key} AS group_key"
+        group_by = ""
+        order_by = f"ORDER BY {group_key + ', ' if group_key else ''}{order}"
+
+    return frappe.db.sql("""
+        SELECT {select}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+          AND IFNULL(gle.is_opening, 'No') != 'Yes'
+        {group_by}
+        {order_by}
+    """.format(
+        select=select,
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions),
+        group_by=group_by,
+        order_by=order_by
+    ), values, as_dict=1)
+
+def get_balance_summary(filters, conditions, values):
+    """
+    Get the opening, period and closing totals per group and overall in one
+    grouped pass
+
+    When the filters allow it, history before from_date is read from the
+    account balance snapshots and only the period is summed here. Entries
+    without an LBP rate are left out of the LBP totals and counted in
+    missing_rates.
+
+    Args:
+        filters (dict): Report filters
+        conditions (list): SQL conditions from get_gl_entry_conditions
+        values (dict): Query values
+
+    Returns:
+        dict: Totals keyed by group key, the overall totals under None
+    """
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+    group_key = GROUP_BY_KEYS.get(filters.get("group_by"))
+
+    use_snapshots = can_use_balance_snapshots(filters, values)
+    if use_snapshots:
+        conditions = conditions + ["gle.posting_date >= %(from_date)s"]
+
+    opening = OPENING_CONDITION
+
+    sums = []
+    for field, expression in (
+        ("debit", "gle.debit"),
+        ("credit", "gle.credit"),
+        ("debit_lbp", debit_lbp),
+        ("credit_lbp", credit_lbp)
+    ):
+        sums.append(f"SUM(IF({opening}, {expression}, 0)) AS opening_{field}")
+        sums.append(f"SUM(IF({opening}, 0, {expression})) AS period_{field}")
+    sums.append(f"SUM(({debit_lbp}) IS NULL) AS missing_rates")
+
+    rows = frappe.db.sql("""
+        SELECT {group_select} AS group_key, {sums}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+        {group_by}
+    """.format(
+        group_select=group_key or "NULL",
+        sums=", ".join(sums),
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions),
+        group_by=f"GROUP BY {group_key} WITH ROLLUP" if group_key else ""
+    ), values, as_dict=1)
+
+    summary = {row.group_key: row for row in rows}
+
+    if summary.get(None) and cint(summary[None].missing_rates):
+        record_missing_ledger_rates(conditions, values)
+
+    if use_snapshots:
+        add_snapshot_openings(summary, filters, values, grouped=bool(group_key))
+
+    return summary
+
+def record_missing_ledger_rates(conditions, values):
+    """
+    Count the entries without an LBP rate by account currency in the rate metrics
+
+    Args:
+        conditions (list): SQL conditions from get_gl_entry_conditions
+        values (dict): Query values
+    """
+    counts = frappe.db.sql("""
+        SELECT gle.account_currency, COUNT(*)
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+          AND ({debit_lbp}) IS NULL
+        GROUP BY gle.account_currency
+    """.format(
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions),
+        debit_lbp=get_lbp_amount_expressions()[0]
+    ), values)
+
+    record_missing_rates(dict(counts), values["rate_type"])
+
+def can_use_balance_snapshots(filters, values):
+    """
+    Check whether opening balances can come from the account balance
+    snapshots, which hold whole accounts at the company's rate type
+
+    Args:
+        filters (dict): Report filters
+        values (dict): Query values
+
+    Returns:
+        bool: True when no filter narrows the entries below account level
+    """
+    if filters.get("group_by") not in (None, "", "Group by Account"):
+        return False
+
+    # Snapshots hold whole accounts, whatever the user may see
+    if get_match_condition():
+        return False
+
+    if not has_balance_snapshots(filters.get("company")):
+        return False
+
+    for fieldname in ("voucher_no", "party_type", "party", "cost_center", "project", "finance_book",
+        "show_cancelled_entries"):
+        if filters.get(fieldname):
+            return False
+
+    return values["rate_type"] == get_company_rate_type(filters.get("company"))
+
+def add_snapshot_openings(summary, filters, values, grouped):
+    """
+    Add the snapshot balances before from_date to the opening totals
+
+    Args:
+        summary (dict): Totals from get_balance_summary, updated in place
+        filters (dict): Report filters
+        values (dict): Query values
+        grouped (bool): Whether the summary is grouped by account
+    """
+    accounts = None
+    if filters.get("account"):
+        accounts = frappe.get_all("Account", filters={
+            "company": filters.get("company"),
+            "lft": (">=", values["account_lft"]),
+            "rgt": ("<=", values["account_rgt"])
+        }, pluck="name")
+
+    if filters.get("accounts"):
+        accounts = [account for account in filters.get("accounts") if accounts is None or account in accounts]
+
+    balances = get_snapshot_balances(filters.get("company"), add_days(values["from_date"], -1), accounts)
+
+    for account, balance in balances.items():
+        targets = [summary.setdefault(None, frappe._dict(group_key=None))]
+        if grouped:
+            targets.append(summary.setdefault(account, frappe._dict(group_key=account)))
+
+        for totals in targets:
+            for field in ("debit", "credit", "debit_lbp", "credit_lbp"):
+                totals[f"opening_{field}"] = flt(totals.get(f"opening_{field}")) + flt(balance[field])
+
+    order_summary(summary)
+
+def order_summary(summary):
+    """
+    Put the groups of a summary in key order with the overall totals last
+
+    Args:
+        summary (dict): Totals from get_balance_summary, reordered in place
+    """
+    ordered = {key: summary[key] for key in sorted(key for key in summary if key is not None)}
+    if None in summary:
+        ordered[None] = summary[None]
+
+    summary.clear()
+    summary.update(ordered)
+
+def get_ledger_page(filters, cursor=None, page_size=LEDGER_PAGE_SIZE):
+    """
+    Get one page of the ungrouped ledger after a keyset cursor
+
+    Pages are read with a (posting_date, creation, name) range seek instead
+    of OFFSET, so every page costs the same however deep it is. The cursor
+    also carries the running balances, so no page re-sums earlier rows.
+
+    Args:
+        filters (dict): Report filters
+        cursor (dict): next_cursor of the previous page, None for the first page
+        page_size (int): Rows per page
+
+    Returns:
+        dict: opening row (first page only), rows, and next_cursor (None on the last page)
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+    values["page_size"] = page_size + 1
+    opening = None
+
+    if cursor:
+        balance = flt(cursor.get("balance"))
+        balance_lbp = flt(cursor.get("balance_lbp"))
+
+        conditions.append("""(gle.posting_date > %(cursor_date)s
+            OR (gle.posting_date = %(cursor_date)s AND (gle.creation > %(cursor_creation)s
+                OR (gle.creation = %(cursor_creation)s AND gle.name > %(cursor_name)s))))""")
+        values.update({
+            "cursor_date": getdate(cursor.get("posting_date")),
+            "cursor_creation": cursor.get("creation"),
+            "cursor_name": cursor.get("name")
+        })
+    else:
+        summary = get_balance_summary(frappe._dict(filters, group_by=None), conditions, values)
+        opening = get_summary_row(_("'Opening'"), summary.get(None) or frappe._dict(), "opening")
+        balance = opening["balance"]
+        balance_lbp = opening["balance_lbp"]
+
+    rows = frappe.db.sql("""
+        SELECT {fields}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+          AND IFNULL(gle.is_opening, 'No') != 'Yes'
+        ORDER BY gle.posting_date, gle.creation, gle.name
+        LIMIT %(page_size)s
+    """.format(
+        fields=get_entry_fields(),
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions)
+    ), values, as_dict=1)
+
+    # One extra row tells whether another page follows
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    balance, balance_lbp = add_running_balances(rows, balance, balance_lbp)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = {
+            "posting_date": str(last.posting_date),
+            "creation": str(last.creation),
+            "name": last.gl_entry,
+            "balance": balance,
+            "balance_lbp": balance_lbp
+        }
+
+    return {"opening": opening, "rows": rows, "next_cursor": next_cursor}
+
+def get_ledger(filters):
+    """
+    Get the Lebanese General Ledger rows: opening, entries, totals and
+    closing per group and overall
+
+    All amounts come from the database; the rows are only arranged here.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        list: Report rows
+    """
+    summary, entries = get_ledger_parts(filters)
+
+    return arrange_ledger(filters, summary, entries)
+
+def get_ledger_parts(filters):
+    """
+    Get the balance summary and the period entries of a filter set
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (summary from get_balance_summary, entries from get_period_entries)
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+
+    summary = get_balance_summary(filters, conditions, values)
+    entries = get_period_entries(filters, conditions, values)
+
+    return summary, entries
+
+def arrange_ledger(filters, summary, entries):
+    """
+    Arrange a balance summary and period entries into report rows
+
+    Args:
+        filters (dict): Report filters
+        summary (dict): Totals from get_balance_summary
+        entries (list): Rows from get_period_entries
+
+    Returns:
+        list: Report rows
+    """
+    if filters.get("group_by") not in GROUP_BY_KEYS:
+        return arrange_group(summary.get(None), entries)
+
+    data = []
+    group_entries = {}
+    for entry in entries:
+        group_entries.setdefault(entry.get("group_key"), []).append(entry)
+
+    for group_key, totals in summary.items():
+        if group_key is None:
+            continue
+
+        data.extend(arrange_group(totals, group_entries.get(group_key, []), label=group_key.replace("::", " "),
+            indent=1))
+        data.append({})
+
+    data.extend(get_summary_rows(summary.get(None)))
+
+    return data
+
+def arrange_group(totals, entries, label=None, indent=0):
+    """
+    Arrange the opening row, entries with their running balances, and the
+    total and closing rows of one group
+
+    Args:
+        totals (dict): Row from get_balance_summary
+        entries (list): Rows from get_period_entries
+        label (str): Group label
+        indent (int): Indent of the entry rows
+
+    Returns:
+        list: Report rows
+    """
+    totals = totals or frappe._dict()
+    opening_balance = flt(totals.opening_debit) - flt(totals.opening_credit)
+    opening_balance_lbp = flt(totals.opening_debit_lbp) - flt(totals.opening_credit_lbp)
+
+    rows = [get_summary_row(_("'Opening'") if not label else "{0} - {1}".format(label, _("'Opening'")),
+        totals, "opening")]
+
+    # Shift the in-period running balances by the opening, column-wise
+    if entries:
+        balances = (opening_balance + get_column(entries, "balance")).tolist()
+        balances_lbp = (opening_balance_lbp + get_column(entries, "balance_lbp")).tolist()
+
+        for entry, balance, balance_lbp in zip(entries, balances, balances_lbp):
+            entry["balance"] = balance
+            entry["balance_lbp"] = balance_lbp
+            entry["indent"] = indent
+
+    rows.extend(entries)
+    rows.extend(get_summary_rows(totals))
+
+    return rows
+
+def get_column(rows, fieldname):
+    """
+    Get a numeric column of the rows as a float array, missing values as zero
+
+    Args:
+        rows (list): Rows as dicts
+        fieldname (str): Column to read
+
+    Returns:
+        numpy.ndarray: Column values
+    """
+    return np.fromiter((row.get(fieldname) or 0 for row in rows), dtype=float, count=len(rows))
+
+def add_running_balances(rows, balance=0.0, balance_lbp=0.0):
+    """
+    Set balance and balance_lbp on rows as running totals of their debit and
+    credit columns, computed column-wise
+
+    Args:
+        rows (list): Rows with debit, credit, debit_lbp and credit_lbp
+        balance (float): Balance before the first row
+        balance_lbp (float): LBP balance before the first row
+
+    Returns:
+        tuple: (balance, balance_lbp) after the last row
+    """
+    if not rows:
+        return balance, balance_lbp
+
+    balances = (balance + np.cumsum(get_column(rows, "debit") - get_column(rows, "credit"))).tolist()
+    balances_lbp = (balance_lbp + np.cumsum(get_column(rows, "debit_lbp") - get_column(rows, "credit_lbp"))).tolist()
+
+    for row, row_balance, row_balance_lbp in zip(rows, balances, balances_lbp):
+        row["balance"] = row_balance
+        row["balance_lbp"] = row_balance_lbp
+
+    return balances[-1], balances_lbp[-1]
+
+def add_group_running_balances(rows):
+    """
+    Set in-group running balances on rows ordered by their group_key
+
+    Args:
+        rows (list): Rows with group_key, debit, credit, debit_lbp and credit_lbp
+    """
+    start = 0
+    for end in range(1, len(rows) + 1):
+        if end == len(rows) or rows[end].get("group_key") != rows[start].get("group_key"):
+            add_running_balances(rows[start:end])
+            start = end
+
+def get_summary_rows(totals):
+    """
+    Get the total and closing rows of a group or of the whole ledger
+
+    Args:
+        totals (dict): Row from get_balance_summary
+
+    Returns:
+        list: Total and closing rows
+    """
+    totals = totals or frappe._dict()
+
+    return [
+        get_summary_row(_("'Total'"), totals, "period"),
+        get_summary_row(_("'Closing (Opening + Total)'"), totals, "closing")
+    ]
+
+def get_summary_row(label, totals, kind):
+    """
+    Get an opening, total or closing row
+
+    Args:
+        label (str): Row label
+        totals (dict): Row from get_balance_summary
+        kind (str): "opening", "period" or "closing"
+
+    Returns:
+        dict: Report row
+    """
+    amounts = {}
+    for field in ("debit", "credit", "debit_lbp", "credit_lbp"):
+        if kind == "closing":
+            amounts[field] = flt(totals.get(f"opening_{field}")) + flt(totals.get(f"period_{field}"))
+        else:
+            amounts[field] = flt(totals.get(f"{kind}_{field}"))
+
+    return {
+        "account": label,
+        "debit": amounts["debit"],
+        "credit": amounts["credit"],
+        "balance": amounts["debit"] - amounts["credit"],
+        "debit_lbp": amounts["debit_lbp"],
+        "credit_lbp": amounts["credit_lbp"],
+        "balance_lbp": amounts["debit_lbp"] - amounts["credit_lbp"]
+    }
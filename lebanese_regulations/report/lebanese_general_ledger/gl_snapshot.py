@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+import numpy as np
+from frappe.utils import cint, flt, getdate
+from lebanese_regulations.accounting.gl_parquet import (
+    can_read_gl_snapshot, get_pyarrow, read_gl_snapshot, scan_gl_snapshot
+)
+from lebanese_regulations.accounting.gl_expressions import get_match_condition
+from lebanese_regulations.accounting.rate_cache import DEFAULT_RATE_TYPE
+from lebanese_regulations.accounting.rate_metrics import record_missing_rates
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    GROUP_BY_KEYS, add_group_running_balances, add_running_balances, get_gl_entry_conditions, order_summary
+)
+
+# Snapshot columns a ledger reads
+LEDGER_COLUMNS = [
+    "name", "posting_date", "account", "party_type", "party", "voucher_type", "voucher_no", "against",
+    "cost_center", "project", "remarks", "is_opening", "account_currency", "creation", "debit", "credit",
+    "debit_in_account_currency", "credit_in_account_currency", "exchange_rate", "lbp_amount", "lbp_rate_type"
+]
+
+# Snapshot columns the summed totals read
+SUM_COLUMNS = [
+    "posting_date", "account", "party_type", "party", "account_currency", "debit", "credit",
+    "debit_in_account_currency", "credit_in_account_currency", "exchange_rate", "lbp_amount", "lbp_rate_type"
+]
+
+# Amounts totalled in a ledger's balance summary
+SUMMARY_AMOUNTS = ["debit", "credit", "debit_lbp", "credit_lbp"]
+
+def can_use_gl_snapshot(filters):
+    """
+    Check whether a ledger is asked for and can be read from the GL Parquet snapshot
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        bool: True when the snapshot option is set and covers the period
+    """
+    if not cint(filters.get("use_gl_snapshot")) or filters.get("group_by") == "Group by Voucher":
+        return False
+
+    # The snapshot files cannot apply the user's permissions
+    if get_match_condition():
+        return False
+
+    return can_read_gl_snapshot(filters.get("company"), filters.get("to_date"))
+
+def get_snapshot_ledger_parts(filters):
+    """
+    Get the balance summary and the period entries of a closed period from
+    the GL Parquet snapshot instead of GL Entry
+
+    The history before from_date is only ever summed, batch by batch, in
+    the scan; only the period entries are read into memory. The LBP
+    amounts follow the same rules as get_lbp_amount_expressions, computed
+    column-wise over the snapshot rows.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (summary, entries) as get_ledger_parts returns them
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+
+    grouped = filters.get("group_by") in GROUP_BY_KEYS
+    daily_rates = get_daily_rates(values["to_date"], values["rate_type"])
+    expression = get_snapshot_filter(filters, values)
+
+    # Opening totals summed in the scan
+    opening = get_snapshot_sums(
+        scan_gl_snapshot(filters.get("company"), values["to_date"], columns=SUM_COLUMNS,
+            filter_expression=expression & get_opening_filter(values)),
+        filters, SUMMARY_AMOUNTS, values["rate_type"], daily_rates
+    )
+
+    # Period entries in ledger order, as get_period_entries returns them
+    table = read_gl_snapshot(filters.get("company"), values["to_date"], columns=LEDGER_COLUMNS,
+        filter_expression=expression & get_period_filter(values), from_date=values["from_date"])
+    table = table.append_column("group_key", get_group_keys(filters, table))
+    table = table.sort_by([(column, "ascending") for column in
+        (["group_key"] if grouped else []) + ["posting_date", "creation", "name"]])
+
+    amounts = get_amounts(table, SUMMARY_AMOUNTS, values["rate_type"], daily_rates)
+    period = get_snapshot_sums([table], filters, SUMMARY_AMOUNTS, values["rate_type"], daily_rates, amounts)
+    summary = get_snapshot_summary(opening, period, SUMMARY_AMOUNTS)
+
+    debit_lbp = to_list(amounts["debit_lbp"])
+    credit_lbp = to_list(amounts["credit_lbp"])
+    rates = to_list(amounts["exchange_rate"])
+
+    entries = []
+    for i, row in enumerate(table.to_pylist()):
+        is_lbp = row["account_currency"] == "LBP"
+        entry = frappe._dict({
+            "gl_entry": row["name"],
+            "posting_date": row["posting_date"],
+            "account": row["account"],
+            "party_type": row["party_type"],
+            "party": row["party"],
+            "voucher_type": row["voucher_type"],
+            "voucher_no": row["voucher_no"],
+            "against": row["against"],
+            "cost_center": row["cost_center"],
+            "project": row["project"],
+            "remarks": row["remarks"],
+            "account_currency": row["account_currency"],
+            "creation": row["creation"],
+            "debit": row["debit"] or 0,
+            "credit": row["credit"] or 0,
+            "debit_in_account_currency": row["debit_in_account_currency"] or 0,
+            "credit_in_account_currency": row["credit_in_account_currency"] or 0,
+            "debit_lbp": debit_lbp[i],
+            "credit_lbp": credit_lbp[i],
+            "exchange_rate": rates[i],
+            "foreign_currency": "" if is_lbp else row["account_currency"],
+            "debit_fc": 0 if is_lbp else row["debit_in_account_currency"] or 0,
+            "credit_fc": 0 if is_lbp else row["credit_in_account_currency"] or 0
+        })
+        if grouped:
+            entry.group_key = row["group_key"]
+        entries.append(entry)
+
+    if grouped:
+        add_group_running_balances(entries)
+    else:
+        add_running_balances(entries)
+
+    return summary, entries
+
+def get_snapshot_account_totals(filters, fields):
+    """
+    Get the opening and period totals of every account of a closed period
+    from the GL Parquet snapshot, summed in the scan
+
+    Args:
+        filters (dict): Report filters
+        fields (list): Amounts to total, out of debit, credit,
+            debit_in_account_currency, credit_in_account_currency, debit_lbp and credit_lbp
+
+    Returns:
+        dict: Totals keyed by account, the overall totals under None
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+
+    filters = frappe._dict(filters, group_by="Group by Account")
+    daily_rates = get_daily_rates(values["to_date"], values["rate_type"])
+    expression = get_snapshot_filter(filters, values)
+
+    totals = {}
+    for kind, row_filter, from_date in (
+        ("opening", get_opening_filter(values), None),
+        ("period", get_period_filter(values), values["from_date"])
+    ):
+        totals[kind] = get_snapshot_sums(
+            scan_gl_snapshot(filters.get("company"), values["to_date"], columns=SUM_COLUMNS,
+                filter_expression=expression & row_filter, from_date=from_date),
+            filters, fields, values["rate_type"], daily_rates
+        )
+
+    return get_snapshot_summary(totals["opening"], totals["period"], fields)
+
+def get_opening_filter(values):
+    """
+    Build the snapshot row filter of the entries counted in the opening, as
+    OPENING_CONDITION selects them
+
+    Args:
+        values (dict): Query values from get_gl_entry_conditions
+
+    Returns:
+        pyarrow.compute.Expression: Row filter
+    """
+    pa, pq = get_pyarrow()
+    import pyarrow.compute as pc
+
+    return ((pc.field("posting_date") < pa.scalar(getdate(values["from_date"]), pa.date32()))
+        | (pc.field("is_opening") == "Yes"))
+
+def get_period_filter(values):
+    """
+    Build the snapshot row filter of the period entries, every entry the
+    opening filter leaves out
+
+    Args:
+        values (dict): Query values from get_gl_entry_conditions
+
+    Returns:
+        pyarrow.compute.Expression: Row filter
+    """
+    pa, pq = get_pyarrow()
+    import pyarrow.compute as pc
+
+    return ((pc.field("posting_date") >= pa.scalar(getdate(values["from_date"]), pa.date32()))
+        & ((pc.field("is_opening") != "Yes") | pc.field("is_opening").is_null()))
+
+def get_snapshot_filter(filters, values):
+    """
+    Build the snapshot row filter matching get_gl_entry_conditions
+
+    Args:
+        filters (dict): Report filters
+        values (dict): Query values from get_gl_entry_conditions
+
+    Returns:
+        pyarrow.compute.Expression: Row filter
+    """
+    get_pyarrow()
+    import pyarrow.compute as pc
+
+    expression = pc.field("company") == values["company"]
+
+    if filters.get("account"):
+        accounts = frappe.get_all("Account", filters={
+            "company": values["company"],
+            "lft": (">=", values["account_lft"]),
+            "rgt": ("<=", values["account_rgt"])
+        }, pluck="name")
+        expression &= pc.field("account").isin(accounts)
+
+    if values.get("accounts"):
+        expression &= pc.field("account").isin(list(values["accounts"]))
+
+    for fieldname in ("voucher_no", "party_type", "cost_center", "project"):
+        if values.get(fieldname):
+            expression &= pc.field(fieldname) == values[fieldname]
+
+    if values.get("party"):
+        expression &= pc.field("party").isin(list(values["party"]))
+
+    if values.get("finance_books"):
+        expression &= (pc.field("finance_book").isin(list(values["finance_books"]))
+            | pc.field("finance_book").is_null() | (pc.field("finance_book") == ""))
+
+    if not cint(filters.get("show_cancelled_entries")):
+        expression &= pc.field("is_cancelled") == 0
+
+    return expression
+
+def get_amounts(rows, fields, rate_type, daily_rates):
+    """
+    Get the amount columns of snapshot rows as float arrays
+
+    Args:
+        rows (pyarrow.Table): Snapshot rows, or a pyarrow.RecordBatch
+        fields (list): Amounts wanted, LBP ones computed for the rate type
+        rate_type (str): Requested rate type
+        daily_rates (pyarrow.Table): Rates from get_daily_rates
+
+    Returns:
+        dict: Array by field, with the LBP rate under exchange_rate
+    """
+    amounts = {field: to_array(rows.column(field)) for field in fields if field in rows.schema.names}
+
+    if "debit_lbp" in fields or "credit_lbp" in fields:
+        amounts["debit_lbp"], amounts["credit_lbp"], amounts["exchange_rate"] = get_lbp_amounts(
+            rows, rate_type, daily_rates)
+
+    return amounts
+
+def get_lbp_amounts(rows, rate_type, daily_rates):
+    """
+    Get the LBP debit, credit and rate of snapshot rows for a rate type
+
+    Rows without a rate are NaN, as the SQL expressions leave them NULL,
+    and are counted in the rate metrics.
+
+    Args:
+        rows (pyarrow.Table): Snapshot rows, or a pyarrow.RecordBatch
+        rate_type (str): Requested rate type
+        daily_rates (pyarrow.Table): Rates from get_daily_rates
+
+    Returns:
+        tuple: (debit_lbp, credit_lbp, exchange_rate) arrays
+    """
+    pa, pq = get_pyarrow()
+    import pyarrow.compute as pc
+
+    debit = to_array(rows.column("debit_in_account_currency"))
+    credit = to_array(rows.column("credit_in_account_currency"))
+    stored_rate = to_array(rows.column("exchange_rate"))
+    lbp_amount = to_array(rows.column("lbp_amount"))
+
+    is_lbp = np.asarray(pc.fill_null(pc.equal(rows.column("account_currency"), "LBP"), False), dtype=bool)
+
+    # Entries without a stored rate type were valued at the default one
+    rate_types = [rate_type] + ([""] if rate_type == DEFAULT_RATE_TYPE else [])
+    same_type = np.asarray(
+        pc.is_in(pc.fill_null(rows.column("lbp_rate_type"), ""), value_set=pa.array(rate_types, pa.string())),
+        dtype=bool
+    )
+
+    # Stored rate of the same type, else the daily rate, else NaN
+    daily_rate = get_row_daily_rates(rows, daily_rates)
+    rates = np.where(same_type & (stored_rate != 0), stored_rate, daily_rate)
+    rates = np.where(is_lbp, 1.0, rates)
+
+    # Stored LBP amounts are unsigned, on the side the entry was posted
+    stored = ~is_lbp & (lbp_amount != 0) & same_type
+    debit_lbp = np.where(stored, np.where(debit > 0, lbp_amount, 0.0), debit * rates)
+    credit_lbp = np.where(stored, np.where(debit > 0, 0.0, lbp_amount), credit * rates)
+
+    missing = np.isnan(debit_lbp)
+    if missing.any():
+        currencies, counts = np.unique(
+            np.asarray(rows.column("account_currency").to_pylist(), dtype=object)[missing].astype(str),
+            return_counts=True)
+        record_missing_rates(dict(zip(currencies.tolist(), counts.tolist())), rate_type)
+
+    return debit_lbp, credit_lbp, rates
+
+def get_daily_rates(to_date, rate_type):
+    """
+    Get the daily rates of every foreign currency up to a date
+
+    Args:
+        to_date (str): Last date
+        rate_type (str): Rate type
+
+    Returns:
+        pyarrow.Table: account_currency, posting_date and daily_rate columns
+    """
+    pa, pq = get_pyarrow()
+
+    rates = frappe.db.sql("""
+        SELECT currency, date, exchange_rate
+        FROM `tabLBP Daily Rate`
+        WHERE rate_type = %(rate_type)s
+          AND currency != 'LBP'
+          AND date <= %(to_date)s
+    """, {"rate_type": rate_type, "to_date": to_date})
+
+    currencies, dates, values = zip(*rates) if rates else ((), (), ())
+
+    return pa.table({
+        "account_currency": pa.array(currencies, pa.string()),
+        "posting_date": pa.array(dates, pa.date32()),
+        "daily_rate": pa.array([float(value) for value in values], pa.float64())
+    })
+
+def get_row_daily_rates(rows, daily_rates):
+    """
+    Look up the daily rate of every snapshot row with a join on currency and date
+
+    Args:
+        rows (pyarrow.Table): Snapshot rows, or a pyarrow.RecordBatch
+        daily_rates (pyarrow.Table): Rates from get_daily_rates
+
+    Returns:
+        numpy.ndarray: Rate per row, NaN where there is none
+    """
+    pa, pq = get_pyarrow()
+
+    rate = np.full(rows.num_rows, np.nan)
+    if not rows.num_rows or not daily_rates.num_rows:
+        return rate
+
+    keys = pa.table({
+        "row": pa.array(np.arange(rows.num_rows)),
+        "account_currency": rows.column("account_currency"),
+        "posting_date": rows.column("posting_date")
+    })
+    matched = keys.join(daily_rates, keys=["account_currency", "posting_date"], join_type="inner")
+    rate[np.asarray(matched.column("row"), dtype=int)] = to_array(matched.column("daily_rate"))
+
+    return rate
+
+def get_group_keys(filters, rows):
+    """
+    Get the group key of every snapshot row, as GROUP_BY_KEYS builds it
+
+    Args:
+        filters (dict): Report filters
+        rows (pyarrow.Table): Snapshot rows, or a pyarrow.RecordBatch
+
+    Returns:
+        pyarrow.Array: Group key per row, null when not grouped
+    """
+    pa, pq = get_pyarrow()
+    import pyarrow.compute as pc
+
+    if filters.get("group_by") == "Group by Account":
+        return pc.fill_null(rows.column("account"), "")
+
+    if filters.get("group_by") == "Group by Party":
+        return pc.binary_join_element_wise(
+            pc.fill_null(rows.column("party_type"), ""), pc.fill_null(rows.column("party"), ""), "::")
+
+    return pa.nulls(rows.num_rows, pa.string())
+
+def get_snapshot_sums(batches, filters, fields, rate_type, daily_rates, amounts=None):
+    """
+    Sum amounts per group key over snapshot rows, each batch grouped on its
+    own and the partial sums grouped again at the end
+
+    Args:
+        batches (iterable): pyarrow.RecordBatch or pyarrow.Table of snapshot rows
+        filters (dict): Report filters
+        fields (list): Amounts to sum
+        rate_type (str): Requested rate type
+        daily_rates (pyarrow.Table): Rates from get_daily_rates
+        amounts (dict): Amount arrays of a single batch, when already computed
+
+    Returns:
+        dict: Sums by group key, None as the key of ungrouped rows
+    """
+    pa, pq = get_pyarrow()
+
+    partials = []
+    for rows in batches:
+        if not rows.num_rows:
+            continue
+
+        # NaN amounts become nulls, which the sums skip as SQL SUM does
+        columns = amounts or get_amounts(rows, fields, rate_type, daily_rates)
+        partial = pa.table({"group_key": get_group_keys(filters, rows),
+            **{field: pa.array(columns[field], from_pandas=True) for field in fields}})
+        partials.append(partial.group_by("group_key").aggregate([(field, "sum") for field in fields]))
+
+    if not partials:
+        return {}
+
+    sums = pa.concat_tables(partials).group_by("group_key").aggregate(
+        [(f"{field}_sum", "sum") for field in fields])
+
+    return {
+        row["group_key"]: {field: row[f"{field}_sum_sum"] or 0.0 for field in fields}
+        for row in sums.to_pylist()
+    }
+
+def get_snapshot_summary(opening, period, fields):
+    """
+    Combine the opening and period sums into the totals per group and overall
+
+    Args:
+        opening (dict): Opening sums from get_snapshot_sums
+        period (dict): Period sums from get_snapshot_sums
+        fields (list): Amounts summed
+
+    Returns:
+        dict: Totals keyed by group key, the overall totals under None
+    """
+    summary = {}
+
+    for kind, sums in (("opening", opening), ("period", period)):
+        for key, values in sums.items():
+            for target in ([key, None] if key is not None else [None]):
+                totals = summary.setdefault(target, frappe._dict(group_key=target))
+                for field in fields:
+                    totals[f"{kind}_{field}"] = flt(totals.get(f"{kind}_{field}")) + values[field]
+
+    # Every total is present, zero when no row counts in it
+    summary.setdefault(None, frappe._dict(group_key=None))
+    for totals in summary.values():
+        for kind in ("opening", "period"):
+            for field in fields:
+                totals.setdefault(f"{kind}_{field}", 0.0)
+
+    order_summary(summary)
+
+    return summary
+
+def to_array(values):
+    """
+    Convert a snapshot column to a float array, missing values as zero
+
+    Args:
+        values (pyarrow.Array): Column values, or a pyarrow.ChunkedArray
+
+    Returns:
+        numpy.ndarray: Column values
+    """
+    import pyarrow.compute as pc
+
+    return np.asarray(pc.fill_null(values, 0), dtype=float)
+
+def to_list(values):
+    """
+    Convert a float array to a list, NaN as None like the SQL rows' NULL
+
+    Args:
+        values (numpy.ndarray): Values
+
+    Returns:
+        list: Values
+    """
+    return np.where(np.isnan(values), None, values).tolist()
@@ -131,6 +131,13 @@ frappe.query_reports["Lebanese General Ledger"] = {
             "fieldtype": "Check",
             "default": 1
         },
+        {
+            "fieldname": "rate_type",
+            "label": __("LBP Rate Type"),
+            "fieldtype": "Select",
+            "options": "\nOfficial\nSayrafa\nMarket",
+            "description": __("Defaults to the company's LBP rate type")
+        },
         {
             "fieldname": "show_foreign_currency",
             "label": __("Show Foreign Currency"),
@@ -153,8 +160,33 @@ frappe.query_reports["Lebanese General Ledger"] = {
             "label": __("Include Default Book Entries"),
             "fieldtype": "Check",
             "default": 1
+        },
+        {
+            "fieldname": "use_gl_snapshot",
+            "label": __("Read Closed Periods from Snapshot"),
+            "fieldtype": "Check",
+            "description": __("Read the nightly GL snapshot when the whole report falls in closed periods")
         }
     ],
+    "onload": function(report) {
+        report.page.add_inner_button(__("Export to File"), function() {
+            frappe.prompt({
+                "fieldname": "file_format",
+                "label": __("Format"),
+                "fieldtype": "Select",
+                "options": "csv\nxlsx",
+                "default": "csv"
+            }, function(values) {
+                frappe.call({
+                    method: "lebanese_regulations.report.lebanese_general_ledger.gl_export.enqueue_general_ledger_export",
+                    args: {
+                        filters: report.get_values(),
+                        file_format: values.file_format
+                    }
+                });
+            }, __("Export Lebanese General Ledger"), __("Export"));
+        });
+    },
     "formatter": function(value, row, column, data, default_formatter) {
         value = default_formatter(value, row, column, data);
         
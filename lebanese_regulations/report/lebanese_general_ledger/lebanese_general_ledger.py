@@ -4,8 +4,19 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, flt, cstr
-from erpnext.accounts.report.general_ledger.general_ledger import execute as gl_execute
+from frappe.utils import cint, getdate
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+from lebanese_regulations.accounting.report_cache import get_report_result
+from lebanese_regulations.report.lebanese_general_ledger.gl_incremental import get_ledger_state, refresh_ledger_parts
+from lebanese_regulations.report.lebanese_general_ledger.gl_parallel import (
+    get_ledger_partitions, get_parallel_ledger_parts
+)
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    LEDGER_PAGE_SIZE, MAX_LEDGER_PAGE_SIZE, arrange_ledger, get_ledger_page, get_ledger_parts
+)
+from lebanese_regulations.report.lebanese_general_ledger.gl_snapshot import (
+    can_use_gl_snapshot, get_snapshot_ledger_parts
+)
 
 def execute(filters=None):
     """
@@ -29,43 +40,251 @@ def execute(filters=None):
     if "show_foreign_currency" not in filters:
         filters["show_foreign_currency"] = 1
     
-    # Execute standard GL report
-    columns, data = gl_execute(filters)
+    # Report with the company's rate type unless another one is chosen
+    if not filters.get("rate_type"):
+        filters["rate_type"] = get_company_rate_type(filters.get("company"))
     
-    # Modify columns and data for Lebanese requirements
-    columns, data = modify_for_lebanese_requirements(filters, columns, data)
-    
-    return columns, data
+    # Reuse the result of an identical filter set until its ledger or rates
+    # change, and bring it up to date when only new entries arrived
+    return get_report_result(
+        "Lebanese General Ledger",
+        filters,
+        lambda: get_result_with_state(filters),
+        lambda state: refresh_result(filters, state)
+    )
 
-def modify_for_lebanese_requirements(filters, columns, data):
+def get_result(filters):
     """
-    Modify columns and data for Lebanese requirements
+    Compute the Lebanese General Ledger
     
     Args:
         filters (dict): Report filters
-        columns (list): Report columns
-        data (list): Report data
         
     Returns:
         tuple: (columns, data)
     """
-    # Add LBP and foreign currency columns if needed
+    return get_result_with_state(filters)[0]
+
+def get_result_with_state(filters):
+    """
+    Compute the Lebanese General Ledger and the state it can later be
+    refreshed from
+    
+    Amounts, LBP values, opening and closing balances and grouping all come
+    from gl_query, which reads the LBP amounts stored on GL Entry.
+    
+    Args:
+        filters (dict): Report filters
+        
+    Returns:
+        tuple: ((columns, data), state)
+    """
+    filters = frappe._dict(filters)
+    
+    # Validate the period
+    validate_filters(filters)
+    
+    # Read closed periods from the GL Parquet snapshot when asked to,
+    # otherwise fetch the parts in set-based queries, split by account for
+    # large ledgers
+    state = None
+    if can_use_gl_snapshot(filters):
+        summary, entries = get_snapshot_ledger_parts(filters)
+    else:
+        partitions = get_ledger_partitions(filters)
+        if partitions:
+            summary, entries = get_parallel_ledger_parts(filters, partitions)
+        else:
+            summary, entries = get_ledger_parts(filters)
+            
+            # Only a ledger read in this transaction matches the watermark
+            # read after it; snapshot files and worker processes see other
+            # sets of entries, so those results are not refreshed incrementally
+            state = get_ledger_state(filters, summary, entries)
+    
+    data = arrange_ledger(filters, summary, entries)
+    
+    return (get_columns(filters), data), state
+
+def refresh_result(filters, state):
+    """
+    Bring a cached Lebanese General Ledger up to date from its state
+    
+    Args:
+        filters (dict): Report filters
+        state (dict): State from get_result_with_state
+        
+    Returns:
+        tuple: ((columns, data), state), or None when it must be recomputed
+    """
+    filters = frappe._dict(filters)
+    
+    refreshed = refresh_ledger_parts(filters, state)
+    if not refreshed:
+        return None
+    
+    summary, entries, state = refreshed
+    
+    return (get_columns(filters), arrange_ledger(filters, summary, entries)), state
+
+@frappe.whitelist()
+def get_general_ledger_page(filters, cursor=None, page_size=LEDGER_PAGE_SIZE):
+    """
+    Get one page of the Lebanese General Ledger for virtual scrolling
+    
+    Pass the next_cursor of a page to get the page after it; it carries the
+    running balances, so pages can be fetched as deep as needed.
+    
+    Args:
+        filters (dict|str): Report filters; group_by is ignored
+        cursor (dict|str): next_cursor of the previous page
+        page_size (int): Rows per page
+        
+    Returns:
+        dict: opening row (first page only), rows, and next_cursor
+    """
+    frappe.has_permission("GL Entry", throw=True)
+    
+    filters = frappe._dict(frappe.parse_json(filters))
+    cursor = frappe.parse_json(cursor) if cursor else None
+    page_size = max(1, min(cint(page_size) or LEDGER_PAGE_SIZE, MAX_LEDGER_PAGE_SIZE))
+    
+    # Validate the period
+    validate_filters(filters)
+    
+    return get_ledger_page(filters, cursor, page_size)
+
+def validate_filters(filters):
+    """
+    Validate the report filters
+    
+    Args:
+        filters (dict): Report filters
+    """
+    if not filters.get("company"):
+        frappe.throw(_("{0} is mandatory").format(_("Company")))
+    
+    if not filters.get("from_date") or not filters.get("to_date"):
+        frappe.throw(_("From Date and To Date are mandatory"))
+    
+    if getdate(filters.get("from_date")) > getdate(filters.get("to_date")):
+        frappe.throw(_("From Date must be before To Date"))
+
+def get_columns(filters):
+    """
+    Get the report columns
+    
+    Args:
+        filters (dict): Report filters
+        
+    Returns:
+        list: Report columns
+    """
+    currency = frappe.get_cached_value("Company", filters.get("company"), "default_currency")
+    
+    columns = [
+        {
+            "label": _("GL Entry"),
+            "fieldname": "gl_entry",
+            "fieldtype": "Link",
+            "options": "GL Entry",
+            "hidden": 1
+        },
+        {
+            "label": _("Posting Date"),
+            "fieldname": "posting_date",
+            "fieldtype": "Date",
+            "width": 100
+        },
+        {
+            "label": _("Account"),
+            "fieldname": "account",
+            "fieldtype": "Link",
+            "options": "Account",
+            "width": 180
+        },
+        {
+            "label": _("Debit ({0})").format(currency),
+            "fieldname": "debit",
+            "fieldtype": "Float",
+            "width": 130
+        },
+        {
+            "label": _("Credit ({0})").format(currency),
+            "fieldname": "credit",
+            "fieldtype": "Float",
+            "width": 130
+        },
+        {
+            "label": _("Balance ({0})").format(currency),
+            "fieldname": "balance",
+            "fieldtype": "Float",
+            "width": 130
+        },
+        {
+            "label": _("Voucher Type"),
+            "fieldname": "voucher_type",
+            "width": 120
+        },
+        {
+            "label": _("Voucher No"),
+            "fieldname": "voucher_no",
+            "fieldtype": "Dynamic Link",
+            "options": "voucher_type",
+            "width": 180
+        },
+        {
+            "label": _("Against Account"),
+            "fieldname": "against",
+            "width": 120
+        },
+        {
+            "label": _("Party Type"),
+            "fieldname": "party_type",
+            "width": 100
+        },
+        {
+            "label": _("Party"),
+            "fieldname": "party",
+            "width": 100
+        },
+        {
+            "label": _("Project"),
+            "fieldname": "project",
+            "fieldtype": "Link",
+            "options": "Project",
+            "width": 100
+        },
+        {
+            "label": _("Cost Center"),
+            "fieldname": "cost_center",
+            "fieldtype": "Link",
+            "options": "Cost Center",
+            "width": 100
+        },
+        {
+            "label": _("Account Currency"),
+            "fieldname": "account_currency",
+            "fieldtype": "Link",
+            "options": "Currency",
+            "width": 100
+        },
+        {
+            "label": _("Remarks"),
+            "fieldname": "remarks",
+            "width": 400
+        }
+    ]
+    
+    # Add LBP columns if needed
     if filters.get("show_in_lbp"):
-        # Add LBP columns
         columns = add_lbp_columns(columns)
-        
-        # Add LBP values to data
-        data = add_lbp_values(data, filters)
     
     # Add foreign currency columns if needed
     if filters.get("show_foreign_currency"):
-        # Add foreign currency columns
         columns = add_foreign_currency_columns(columns)
-        
-        # Add foreign currency values to data
-        data = add_foreign_currency_values(data, filters)
     
-    return columns, data
+    return columns
 
 def add_lbp_columns(columns):
     """
@@ -103,10 +322,18 @@ def add_lbp_columns(columns):
                 "fieldtype": "Currency",
                 "options": "LBP",
                 "width": 120
+            },
+            {
+                "label": _("Balance (LBP)"),
+                "fieldname": "balance_lbp",
+                "fieldtype": "Currency",
+                "options": "LBP",
+                "width": 130
             }
         ]
         
         # Insert after credit column
+        columns.insert(credit_idx + 1, lbp_columns[2])
         columns.insert(credit_idx + 1, lbp_columns[1])
         columns.insert(debit_idx + 1, lbp_columns[0])
     
@@ -170,108 +397,3 @@ def add_foreign_currency_columns(columns):
             columns.insert(debit_idx + i, col)
     
     return columns
-
-def add_lbp_values(data, filters):
-    """
-    Add LBP values to the report data
-    
-    Args:
-        data (list): Report data
-        filters (dict): Report filters
-        
-    Returns:
-        list: Modified data
-    """
-    for row in data:
-        if not row.get("posting_date"):
-            continue
-        
-        # Get exchange rate
-        exchange_rate = 1.0
-        if row.get("account_currency") and row.get("account_currency") != "LBP":
-            exchange_rate = get_exchange_rate(row.get("account_currency"), "LBP", row.get("posting_date"))
-        
-        # Calculate LBP values
-        row["debit_lbp"] = flt(row.get("debit")) * flt(exchange_rate)
-        row["credit_lbp"] = flt(row.get("credit")) * flt(exchange_rate)
-    
-    return data
-
-def add_foreign_currency_values(data, filters):
-    """
-    Add foreign currency values to the report data
-    
-    Args:
-        data (list): Report data
-        filters (dict): Report filters
-        
-    Returns:
-        list: Modified data
-    """
-    for row in data:
-        if not row.get("posting_date"):
-            continue
-        
-        # Set foreign currency values
-        if row.get("account_currency") and row.get("account_currency") != "LBP":
-            row["foreign_currency"] = row.get("account_currency")
-            row["exchange_rate"] = get_exchange_rate(row.get("account_currency"), "LBP", row.get("posting_date"))
-            
-            # Calculate foreign currency values
-            if row.get("debit") > 0:
-                row["debit_fc"] = flt(row.get("debit_in_account_currency"))
-                row["credit_fc"] = 0
-            else:
-                row["debit_fc"] = 0
-                row["credit_fc"] = flt(row.get("credit_in_account_currency"))
-        else:
-            # For LBP accounts, set foreign currency values to zero
-            row["foreign_currency"] = ""
-            row["exchange_rate"] = 1.0
-            row["debit_fc"] = 0
-            row["credit_fc"] = 0
-    
-    return data
-
-def get_exchange_rate(from_currency, to_currency, date):
-    """
-    Get exchange rate between two currencies
-    
-    Args:
-        from_currency (str): From currency
-        to_currency (str): To currency
-        date (str): Date for exchange rate
-        
-    Returns:
-        float: Exchange rate
-    """
-    if from_currency == to_currency:
-        return 1.0
-    
-    # Get exchange rate from Currency Exchange
-    exchange_rate = frappe.db.get_value("Currency Exchange",
-        {
-            "from_currency": from_currency,
-            "to_currency": to_currency,
-            "date": ("<=", date)
-        },
-        "exchange_rate",
-        order_by="date desc"
-    )
-    
-    if not exchange_rate:
-        # Try reverse lookup
-        exchange_rate = frappe.db.get_value("Currency Exchange",
-            {
-                "from_currency": to_currency,
-                "to_currency": from_currency,
-                "date": ("<=", date)
-            },
-            "exchange_rate",
-            order_by="date desc"
-        )
-        
-        if exchange_rate:
-            exchange_rate = 1.0 / flt(exchange_rate)
-    
-    return exchange_rate or 1.0
\ No newline at end of file
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from frappe.permissions import add_user_permission, remove_user_permission
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import today
+from lebanese_regulations.report.lebanese_general_ledger.lebanese_general_ledger import (
+    get_general_ledger_page, get_result
+)
+
+TEST_USER = "test@example.com"
+ALLOWED_COST_CENTER = "_Test Cost Center - _TC"
+OTHER_COST_CENTER = "_Test Cost Center 2 - _TC"
+
+class TestLebaneseGeneralLedger(FrappeTestCase):
+    def setUp(self):
+        frappe.set_user("Administrator")
+        frappe.get_doc("User", TEST_USER).add_roles("Accounts User")
+
+        self.allowed = make_journal_entry("_Test Cash - _TC", "_Test Bank - _TC", 100, ALLOWED_COST_CENTER,
+            posting_date=today(), submit=True)
+        self.other = make_journal_entry("_Test Cash - _TC", "_Test Bank - _TC", 200, OTHER_COST_CENTER,
+            posting_date=today(), submit=True)
+
+        add_user_permission("Cost Center", ALLOWED_COST_CENTER, TEST_USER)
+
+    def tearDown(self):
+        frappe.set_user("Administrator")
+        remove_user_permission("Cost Center", ALLOWED_COST_CENTER, TEST_USER)
+        frappe.db.rollback()
+
+    def get_filters(self):
+        return frappe._dict(company="_Test Company", from_date=today(), to_date=today())
+
+    def test_user_permissions_limit_the_ledger(self):
+        frappe.set_user(TEST_USER)
+
+        columns, data = get_result(self.get_filters())
+        vouchers = {row.get("voucher_no") for row in data}
+
+        self.assertIn(self.allowed.name, vouchers)
+        self.assertNotIn(self.other.name, vouchers)
+
+    def test_user_permissions_limit_ledger_pages(self):
+        frappe.set_user(TEST_USER)
+
+        page = get_general_ledger_page(self.get_filters())
+        vouchers = {row.get("voucher_no") for row in page["rows"]}
+
+        self.assertIn(self.allowed.name, vouchers)
+        self.assertNotIn(self.other.name, vouchers)
+
+    def test_unrestricted_user_sees_every_entry(self):
+        columns, data = get_result(self.get_filters())
+        vouchers = {row.get("voucher_no") for row in data}
+
+        self.assertIn(self.allowed.name, vouchers)
+        self.assertIn(self.other.name, vouchers)
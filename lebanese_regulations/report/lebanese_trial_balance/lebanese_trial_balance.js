@@ -0,0 +1,106 @@
+// Copyright (c) 2023, Your Name and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Lebanese Trial Balance"] = {
+    "filters": [
+        {
+            "fieldname": "company",
+            "label": __("Company"),
+            "fieldtype": "Link",
+            "options": "Company",
+            "default": frappe.defaults.get_user_default("Company"),
+            "reqd": 1
+        },
+        {
+            "fieldname": "finance_book",
+            "label": __("Finance Book"),
+            "fieldtype": "Link",
+            "options": "Finance Book"
+        },
+        {
+            "fieldname": "from_date",
+            "label": __("From Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.year_start(),
+            "reqd": 1,
+            "width": "60px"
+        },
+        {
+            "fieldname": "to_date",
+            "label": __("To Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today(),
+            "reqd": 1,
+            "width": "60px"
+        },
+        {
+            "fieldname": "cost_center",
+            "label": __("Cost Center"),
+            "fieldtype": "Link",
+            "options": "Cost Center",
+            get_query: () => {
+                var company = frappe.query_report.get_filter_value('company');
+                return {
+                    filters: {
+                        'company': company
+                    }
+                };
+            }
+        },
+        {
+            "fieldname": "project",
+            "label": __("Project"),
+            "fieldtype": "Link",
+            "options": "Project"
+        },
+        {
+            "fieldname": "rate_type",
+            "label": __("LBP Rate Type"),
+            "fieldtype": "Select",
+            "options": "\nOfficial\nSayrafa\nMarket",
+            "description": __("Defaults to the company's LBP rate type")
+        },
+        {
+            "fieldname": "show_in_lbp",
+            "label": __("Show in LBP"),
+            "fieldtype": "Check",
+            "default": 1
+        },
+        {
+            "fieldname": "show_foreign_currency",
+            "label": __("Show Account Currency"),
+            "fieldtype": "Check",
+            "default": 1
+        },
+        {
+            "fieldname": "show_zero_values",
+            "label": __("Show Zero Values"),
+            "fieldtype": "Check"
+        },
+        {
+            "fieldname": "include_default_book_entries",
+            "label": __("Include Default Book Entries"),
+            "fieldtype": "Check",
+            "default": 1
+        },
+        {
+            "fieldname": "use_gl_snapshot",
+            "label": __("Read Closed Periods from Snapshot"),
+            "fieldtype": "Check",
+            "description": __("Read the nightly GL snapshot when the whole report falls in closed periods")
+        }
+    ],
+    "formatter": function(value, row, column, data, default_formatter) {
+        value = default_formatter(value, row, column, data);
+
+        if (data && !data.parent_account && column.fieldname == "account") {
+            value = "<b>" + value + "</b>";
+        }
+
+        return value;
+    },
+    "tree": true,
+    "name_field": "account",
+    "parent_field": "parent_account",
+    "initial_depth": 3
+};
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+import numpy as np
+from frappe import _
+from frappe.utils import add_days, cint, flt, getdate
+from lebanese_regulations.accounting.balance_snapshots import get_snapshot_balances
+from lebanese_regulations.accounting.gl_expressions import get_lbp_amount_expressions, get_rate_join
+from lebanese_regulations.accounting.rate_cache import get_company_rate_type
+from lebanese_regulations.accounting.report_cache import get_report_result
+from lebanese_regulations.report.lebanese_general_ledger.gl_query import (
+    OPENING_CONDITION, can_use_balance_snapshots, get_gl_entry_conditions
+)
+from lebanese_regulations.report.lebanese_general_ledger.gl_snapshot import (
+    can_use_gl_snapshot, get_snapshot_account_totals
+)
+
+# Amounts totalled per account: company currency, account currency and LBP
+AMOUNT_FIELDS = [
+    "debit", "credit", "debit_in_account_currency", "credit_in_account_currency", "debit_lbp", "credit_lbp"
+]
+
+# Amounts rolled up to group accounts, which mix account currencies
+ROLLUP_FIELDS = ["debit", "credit", "debit_lbp", "credit_lbp"]
+
+# Column suffix of each currency shown
+CURRENCY_SUFFIXES = {"company": "", "account": "_in_account_currency", "lbp": "_lbp"}
+
+# Columns of the total row, summed over the root accounts' rows
+TOTAL_FIELDS = [
+    f"{fieldname}{suffix}"
+    for suffix in ("", "_lbp")
+    for fieldname in ("opening_debit", "opening_credit", "debit", "credit", "closing_debit", "closing_credit")
+]
+
+def execute(filters=None):
+    """
+    Execute the Lebanese Trial Balance report
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (columns, data)
+    """
+    filters = frappe._dict(filters or {})
+
+    # Show LBP and account currency columns unless turned off
+    filters.setdefault("show_in_lbp", 1)
+    filters.setdefault("show_foreign_currency", 1)
+
+    # Report with the company's rate type unless another one is chosen
+    if not filters.get("rate_type"):
+        filters["rate_type"] = get_company_rate_type(filters.get("company"))
+
+    # Reuse the result of an identical filter set until its ledger or rates change
+    return get_report_result("Lebanese Trial Balance", filters, lambda: get_result(filters))
+
+def get_result(filters):
+    """
+    Compute the Lebanese Trial Balance
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        tuple: (columns, data)
+    """
+    validate_filters(filters)
+
+    # Opening and period totals of every account in one grouped pass
+    if can_use_gl_snapshot(filters):
+        totals = get_snapshot_account_totals(filters, AMOUNT_FIELDS)
+    else:
+        totals = get_account_totals(filters)
+
+    # Roll the totals up the account tree
+    accounts = get_accounts(filters.get("company"))
+    data = get_data(filters, accounts, totals)
+
+    return get_columns(filters), data
+
+def validate_filters(filters):
+    """
+    Validate the report filters
+
+    Args:
+        filters (dict): Report filters
+    """
+    if not filters.get("company"):
+        frappe.throw(_("{0} is mandatory").format(_("Company")))
+
+    if not filters.get("from_date") or not filters.get("to_date"):
+        frappe.throw(_("From Date and To Date are mandatory"))
+
+    if getdate(filters.get("from_date")) > getdate(filters.get("to_date")):
+        frappe.throw(_("From Date must be before To Date"))
+
+def get_account_totals(filters):
+    """
+    Get the opening and period totals of every account with entries up to to_date
+
+    When the filters allow it, history before from_date is read from the
+    account balance snapshots and only the period is summed here.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        dict: Totals keyed by account
+    """
+    conditions, values = get_gl_entry_conditions(filters)
+    debit_lbp, credit_lbp = get_lbp_amount_expressions()
+
+    use_snapshots = can_use_balance_snapshots(frappe._dict(filters, group_by="Group by Account"), values)
+    if use_snapshots:
+        conditions = conditions + ["gle.posting_date >= %(from_date)s"]
+
+    expressions = {
+        "debit": "gle.debit",
+        "credit": "gle.credit",
+        "debit_in_account_currency": "gle.debit_in_account_currency",
+        "credit_in_account_currency": "gle.credit_in_account_currency",
+        "debit_lbp": debit_lbp,
+        "credit_lbp": credit_lbp
+    }
+
+    sums = []
+    for field in AMOUNT_FIELDS:
+        sums.append(f"SUM(IF({OPENING_CONDITION}, {expressions[field]}, 0)) AS opening_{field}")
+        sums.append(f"SUM(IF({OPENING_CONDITION}, 0, {expressions[field]})) AS period_{field}")
+
+    rows = frappe.db.sql("""
+        SELECT gle.account, {sums}
+        FROM `tabGL Entry` gle
+        {rate_join}
+        WHERE {conditions}
+          AND gle.posting_date <= %(to_date)s
+        GROUP BY gle.account
+    """.format(
+        sums=", ".join(sums),
+        rate_join=get_rate_join(),
+        conditions=" AND ".join(conditions)
+    ), values, as_dict=1)
+
+    totals = {row.account: row for row in rows}
+
+    if use_snapshots:
+        balances = get_snapshot_balances(filters.get("company"), add_days(values["from_date"], -1))
+        for account, balance in balances.items():
+            account_totals = totals.setdefault(account, frappe._dict(account=account))
+            for field in AMOUNT_FIELDS:
+                account_totals[f"opening_{field}"] = flt(account_totals.get(f"opening_{field}")) + flt(balance[field])
+
+    return totals
+
+def get_accounts(company):
+    """
+    Get the company's chart of accounts in tree order
+
+    Args:
+        company (str): Company name
+
+    Returns:
+        list: Accounts as dicts
+    """
+    return frappe.db.sql("""
+        SELECT name, account_name, account_number, parent_account, account_currency, root_type, is_group
+        FROM `tabAccount`
+        WHERE company = %s
+        ORDER BY lft
+    """, (company,), as_dict=1)
+
+def get_data(filters, accounts, totals):
+    """
+    Build the report rows: one per account with its totals rolled up from
+    its descendants, and a grand total
+
+    Args:
+        filters (dict): Report filters
+        accounts (list): Accounts from get_accounts
+        totals (dict): Totals from get_account_totals
+
+    Returns:
+        list: Report rows
+    """
+    index = {account.name: i for i, account in enumerate(accounts)}
+
+    # One row of opening and period amounts per account
+    fields = [f"{kind}_{field}" for kind in ("opening", "period") for field in AMOUNT_FIELDS]
+    amounts = np.zeros((len(accounts), len(fields)))
+    for account, account_totals in totals.items():
+        if account in index:
+            amounts[index[account]] = [flt(account_totals.get(field)) for field in fields]
+
+    # Children come after their parent in tree order, so a reverse pass
+    # adds every subtree into its root
+    rollup = np.array([field.split("_", 1)[1] in ROLLUP_FIELDS for field in fields])
+    for i in range(len(accounts) - 1, -1, -1):
+        parent = index.get(accounts[i].parent_account)
+        if parent is not None:
+            amounts[parent, rollup] += amounts[i, rollup]
+
+    data = []
+    indents = {}
+    total_row = {"account": _("'Total'"), "account_name": _("'Total'")}
+    show_zero_values = cint(filters.get("show_zero_values"))
+
+    for i, account in enumerate(accounts):
+        indent = indents[account.name] = indents.get(account.parent_account, -1) + 1
+        row = get_row(dict(zip(fields, amounts[i].tolist())), not cint(account.is_group))
+
+        # Root balances are added on their own sides, so the total debits match the total credits
+        if not account.parent_account:
+            for fieldname in TOTAL_FIELDS:
+                total_row[fieldname] = total_row.get(fieldname, 0.0) + row[fieldname]
+
+        if not show_zero_values and not amounts[i, rollup].any():
+            continue
+
+        row.update({
+            "account": account.name,
+            "account_name": account.account_name,
+            "parent_account": account.parent_account,
+            "account_currency": account.account_currency if not cint(account.is_group) else None,
+            "indent": indent
+        })
+        data.append(row)
+
+    data.extend([{}, total_row])
+
+    return data
+
+def get_row(amounts, with_account_currency):
+    """
+    Get the opening, movement and closing columns of one row
+
+    Opening and closing are shown as a balance on the debit or the credit
+    side; the movement shows both sides.
+
+    Args:
+        amounts (dict): Opening and period totals
+        with_account_currency (bool): Include the account currency columns
+
+    Returns:
+        dict: Report row
+    """
+    row = {}
+
+    for currency, suffix in CURRENCY_SUFFIXES.items():
+        if currency == "account" and not with_account_currency:
+            continue
+
+        opening = amounts[f"opening_debit{suffix}"] - amounts[f"opening_credit{suffix}"]
+        debit = amounts[f"period_debit{suffix}"]
+        credit = amounts[f"period_credit{suffix}"]
+        closing = opening + debit - credit
+
+        row.update({
+            f"opening_debit{suffix}": max(opening, 0.0),
+            f"opening_credit{suffix}": max(-opening, 0.0),
+            f"debit{suffix}": debit,
+            f"credit{suffix}": credit,
+            f"closing_debit{suffix}": max(closing, 0.0),
+            f"closing_credit{suffix}": max(-closing, 0.0)
+        })
+
+    return row
+
+def get_columns(filters):
+    """
+    Get the report columns
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        list: Report columns
+    """
+    currency = frappe.get_cached_value("Company", filters.get("company"), "default_currency")
+
+    columns = [
+        {
+            "label": _("Account"),
+            "fieldname": "account",
+            "fieldtype": "Link",
+            "options": "Account",
+            "width": 300
+        },
+        {
+            "label": _("Account Currency"),
+            "fieldname": "account_currency",
+            "fieldtype": "Link",
+            "options": "Currency",
+            "hidden": 1
+        }
+    ]
+
+    # Company currency, then LBP, then account currency
+    columns.extend(get_amount_columns("", "Currency", currency, "({0})".format(currency)))
+
+    if cint(filters.get("show_in_lbp")):
+        columns.extend(get_amount_columns("_lbp", "Currency", "LBP", "(LBP)"))
+
+    if cint(filters.get("show_foreign_currency")):
+        columns.extend(get_amount_columns("_in_account_currency", "Currency", "account_currency",
+            _("(Account Currency)")))
+
+    return columns
+
+def get_amount_columns(suffix, fieldtype, options, label_suffix):
+    """
+    Get the opening, movement and closing columns of one currency
+
+    Args:
+        suffix (str): Fieldname suffix
+        fieldtype (str): Column fieldtype
+        options (str): Currency, or the field holding it
+        label_suffix (str): Label suffix naming the currency
+
+    Returns:
+        list: Report columns
+    """
+    return [
+        {
+            "label": "{0} {1}".format(label, label_suffix),
+            "fieldname": f"{fieldname}{suffix}",
+            "fieldtype": fieldtype,
+            "options": options,
+            "width": 130
+        }
+        for fieldname, label in (
+            ("opening_debit", _("Opening (Dr)")),
+            ("opening_credit", _("Opening (Cr)")),
+            ("debit", _("Debit")),
+            ("credit", _("Credit")),
+            ("closing_debit", _("Closing (Dr)")),
+            ("closing_credit", _("Closing (Cr)"))
+        )
+    ]
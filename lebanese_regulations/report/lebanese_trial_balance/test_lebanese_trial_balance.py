@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from lebanese_regulations.report.lebanese_trial_balance.lebanese_trial_balance import AMOUNT_FIELDS, get_data
+
+def get_account(name, parent_account=None, is_group=0, root_type="Asset"):
+    return frappe._dict(name=name, account_name=name, account_number=None, parent_account=parent_account,
+        account_currency="USD", root_type=root_type, is_group=is_group)
+
+def get_totals(account, **amounts):
+    totals = frappe._dict(account=account)
+    for field in AMOUNT_FIELDS:
+        for kind in ("opening", "period"):
+            totals[f"{kind}_{field}"] = amounts.get(f"{kind}_{field}", 0.0)
+    return totals
+
+class TestLebaneseTrialBalance(FrappeTestCase):
+    def get_total_row(self):
+        accounts = [
+            get_account("Assets", is_group=1),
+            get_account("Cash", "Assets"),
+            get_account("Liabilities", is_group=1, root_type="Liability"),
+            get_account("Loans", "Liabilities", root_type="Liability"),
+        ]
+        totals = {
+            "Cash": get_totals("Cash", opening_debit=100.0, period_debit=50.0,
+                opening_debit_lbp=8950000.0, period_debit_lbp=4475000.0),
+            "Loans": get_totals("Loans", opening_credit=100.0, period_credit=50.0,
+                opening_credit_lbp=8950000.0, period_credit_lbp=4475000.0),
+        }
+
+        data = get_data(frappe._dict(), accounts, totals)
+        return data[-1]
+
+    def test_total_row_balances(self):
+        total_row = self.get_total_row()
+
+        for suffix in ("", "_lbp"):
+            self.assertEqual(total_row[f"opening_debit{suffix}"], total_row[f"opening_credit{suffix}"])
+            self.assertEqual(total_row[f"debit{suffix}"], total_row[f"credit{suffix}"])
+            self.assertEqual(total_row[f"closing_debit{suffix}"], total_row[f"closing_credit{suffix}"])
+
+    def test_total_row_keeps_gross_balances(self):
+        total_row = self.get_total_row()
+
+        self.assertEqual(total_row["opening_debit"], 100.0)
+        self.assertEqual(total_row["closing_debit"], 150.0)
+        self.assertEqual(total_row["closing_credit_lbp"], 13425000.0)
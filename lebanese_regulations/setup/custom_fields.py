@@ -50,6 +50,15 @@ def get_custom_fields():
                 "options": "Account",
                 "insert_after": "indemnity_accrual_account",
                 "description": "Account for NSSF contributions payable"
+            },
+            {
+                "fieldname": "lbp_rate_type",
+                "label": "LBP Rate Type",
+                "fieldtype": "Select",
+                "options": "Official\nSayrafa\nMarket",
+                "insert_after": "lbp_currency_symbol",
+                "default": "Official",
+                "description": "Exchange rate type used to post and report LBP amounts"
             }
         ],
         "Employee": [
@@ -138,6 +147,36 @@ def get_custom_fields():
                 "options": "LBP",
                 "insert_after": "exchange_rate",
                 "description": "Amount in LBP (Lebanese Pound)"
+            },
+            {
+                "fieldname": "lbp_rate_type",
+                "label": "LBP Rate Type",
+                "fieldtype": "Data",
+                "insert_after": "lbp_amount",
+                "read_only": 1,
+                "description": "Exchange rate type the LBP amount was computed with"
+            }
+        ],
+        "Currency Exchange": [
+            {
+                "fieldname": "rate_type",
+                "label": "Rate Type",
+                "fieldtype": "Select",
+                "options": "Official\nSayrafa\nMarket",
+                "insert_after": "exchange_rate",
+                "default": "Official",
+                "reqd": 1,
+                "in_list_view": 1,
+                "in_standard_filter": 1,
+                "description": "Official, Sayrafa or Market rate"
+            },
+            {
+                "fieldname": "for_month_end",
+                "label": "For Month End",
+                "fieldtype": "Check",
+                "insert_after": "for_selling",
+                "read_only": 1,
+                "description": "Month-end rate recorded by the Lebanese month-end exchange rate processing"
             }
         ],
         "Salary Slip": [
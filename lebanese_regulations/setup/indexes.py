@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2023, Your Name and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, nowdate
+
+# Composite indexes for the query patterns of this app
+HOT_QUERY_INDEXES = [
+    {
+        "doctype": "Currency Exchange",
+        "fields": ["from_currency", "to_currency", "rate_type", "date"],
+        "index_name": "lebanese_pair_rate_type_date_index"
+    },
+    {
+        "doctype": "GL Entry",
+        "fields": ["company", "account_currency", "is_cancelled", "posting_date"],
+        "index_name": "lebanese_revaluation_index"
+    },
+    {
+        "doctype": "GL Entry",
+        "fields": ["company", "account", "posting_date"],
+        "index_name": "lebanese_account_balance_index"
+    },
+    {
+        "doctype": "GL Entry",
+        "fields": ["company", "posting_date", "creation", "name"],
+        "index_name": "lebanese_ledger_keyset_index"
+    },
+    {
+        "doctype": "Salary Slip",
+        "fields": ["employee", "docstatus", "start_date"],
+        "index_name": "lebanese_ytd_index"
+    }
+]
+
+def after_migrate():
+    """
+    Create and verify the hot query indexes after every migration
+    """
+    ensure_indexes()
+
+    missing = verify_indexes()
+    if missing:
+        frappe.log_error(
+            "Missing or malformed indexes: {0}".format(", ".join(missing)),
+            "Lebanese Regulations Indexes"
+        )
+
+def ensure_indexes():
+    """
+    Create the hot query indexes that do not exist yet
+    """
+    for index in HOT_QUERY_INDEXES:
+        # Custom field columns may not exist yet on a fresh install
+        if not all(frappe.db.has_column(index["doctype"], field) for field in index["fields"]):
+            continue
+
+        # add_index is a no-op when the index already exists
+        frappe.db.add_index(index["doctype"], index["fields"], index_name=index["index_name"])
+
+def verify_indexes():
+    """
+    Check that every hot query index exists with the expected columns
+
+    Returns:
+        list: Names of the missing or malformed indexes
+    """
+    missing = []
+
+    for index in HOT_QUERY_INDEXES:
+        columns = frappe.db.sql_list("""
+            SELECT column_name
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+              AND table_name = %s
+              AND index_name = %s
+            ORDER BY seq_in_index
+        """, ("tab" + index["doctype"], index["index_name"]))
+
+        if columns != index["fields"]:
+            missing.append(index["index_name"])
+
+    return missing
+
+def get_hot_queries():
+    """
+    Get the hot queries of this app with representative values
+
+    Returns:
+        list: (label, query, values) tuples
+    """
+    today = getdate(nowdate())
+    company = frappe.db.get_value("Company", {}, "name")
+    account = frappe.db.get_value("Account", {"company": company, "is_group": 0}, "name")
+    employee = frappe.db.get_value("Employee", {}, "name")
+
+    return [
+        (
+            _("Exchange rate timeline"),
+            """
+                SELECT date, exchange_rate, creation
+                FROM `tabCurrency Exchange`
+                WHERE from_currency = %s AND to_currency = %s
+                  AND rate_type = %s AND date BETWEEN %s AND %s
+                ORDER BY date, creation
+            """,
+            ("USD", "LBP", "Official", today.replace(month=1, day=1), today.replace(month=12, day=31))
+        ),
+        (
+            _("Month-end revaluation"),
+            """
+                SELECT name, account, party_type, party, debit, credit,
+                       debit_in_account_currency, credit_in_account_currency
+                FROM `tabGL Entry`
+                WHERE company = %s AND account_currency = %s
+                  AND is_cancelled = 0 AND posting_date <= %s
+            """,
+            (company, "USD", today)
+        ),
+        (
+            _("Account balance"),
+            """
+                SELECT SUM(debit_in_account_currency) - SUM(credit_in_account_currency)
+                FROM `tabGL Entry`
+                WHERE account = %s AND company = %s AND posting_date <= %s
+            """,
+            (account, company, today)
+        ),
+        (
+            _("Ledger page seek"),
+            """
+                SELECT name, posting_date, creation, debit, credit
+                FROM `tabGL Entry`
+                WHERE company = %s AND is_cancelled = 0
+                  AND posting_date BETWEEN %s AND %s
+                  AND (posting_date > %s OR (posting_date = %s AND (creation > %s
+                      OR (creation = %s AND name > %s))))
+                ORDER BY posting_date, creation, name
+                LIMIT 501
+            """,
+            (company, today.replace(month=1, day=1), today, today.replace(month=1, day=1),
+                today.replace(month=1, day=1), today, today, "")
+        ),
+        (
+            _("Salary Slip year to date"),
+            """
+                SELECT SUM(nssf_employee_contribution), SUM(nssf_employer_contribution)
+                FROM `tabSalary Slip`
+                WHERE employee = %s AND docstatus = 1
+                  AND start_date >= %s AND end_date <= %s
+            """,
+            (employee, today.replace(month=1, day=1), today)
+        ),
+        (
+            _("LBP daily rate join"),
+            """
+                SELECT exchange_rate
+                FROM `tabLBP Daily Rate`
+                WHERE currency = %s AND rate_type = %s AND date = %s
+            """,
+            ("USD", "Official", today)
+        )
+    ]
+
+def explain_hot_queries():
+    """
+    Get the EXPLAIN plan of every hot query
+
+    Returns:
+        list: (label, plan rows) tuples
+    """
+    return [
+        (label, frappe.db.sql("EXPLAIN " + query, values, as_dict=1))
+        for label, query, values in get_hot_queries()
+    ]